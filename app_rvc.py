@@ -1,11 +1,10 @@
-import gradio as gr
 from soni_translate.logging_setup import (
     logger,
     set_logging_level,
     configure_logging_libs,
 ); configure_logging_libs() # noqa
-import whisperx
-import torch
+from soni_translate import startup
+from soni_translate.startup import lazy_import
 import os
 from soni_translate.audio_segments import create_translated_audio
 from soni_translate.text_to_speech import (
@@ -33,6 +32,7 @@ from soni_translate.postprocessor import (
     media_out,
     get_subtitle_speaker,
 )
+from soni_translate.render import render_final_media, RENDER_VIDEO_PRESET
 from soni_translate.language_configuration import (
     LANGUAGES,
     UNIDIRECTIONAL_L_LIST,
@@ -86,16 +86,23 @@ from soni_translate.text_multiformat_processor import (
     create_video_from_images,
     merge_video_and_audio,
 )
-from soni_translate.languages_gui import language_data, news
+from soni_translate.stage_cache import StageCache, get_stage_cache
+from soni_translate.model_pool import get_model_pool
+from soni_translate.batch_engine import BatchEngine, BATCH_WORKERS
+from soni_translate.workspace import Workspace
 import copy
 import logging
 import json
-from pydub import AudioSegment
-from voice_main import ClassVoices
 import argparse
 import time
 import hashlib
 import sys
+import importlib.util
+
+# Loaded by the stages (and the GUI) that use them
+gr = lazy_import("gradio")
+whisperx = lazy_import("whisperx")
+torch = lazy_import("torch")
 
 directories = [
     "downloads",
@@ -140,6 +147,12 @@ class TTS_Info:
         return list_tts
 
 
+def gui_progress():
+    """Progress tracker of the gradio event being run, created when a GUI
+    call starts. Headless runs don't import gradio and get None."""
+    return None if startup.HEADLESS else gr.Progress()
+
+
 def prog_disp(msg, percent, is_gui, progress=None):
     logger.info(msg)
     if is_gui:
@@ -152,6 +165,20 @@ def warn_disp(wrn_lang, is_gui):
         gr.Warning(wrn_lang)
 
 
+# Clips of the clip store are bundled as FLAC under their name plus this
+# suffix, instead of being encoded to their own (Vorbis) files
+STAGE_CLIP_SUFFIX = ".clip.flac"
+# Steps whose results are kept on disk, with the directory of files they
+# produce (bundled into the entry) when the variables alone are not enough
+PERSISTENT_STEPS = {
+    "transcript_align": None,
+    "break_align": None,
+    "diarize": None,
+    "translate": None,
+    "tts": "audio",
+}
+
+
 class SoniTrCache:
     def __init__(self):
         self.cache = {
@@ -164,7 +191,6 @@ class SoniTrCache:
             'subs_and_edit': [],
             'tts': [],
             'acc_and_vc': [],
-            'mix_aud': [],
             'output': []
         }
 
@@ -178,7 +204,6 @@ class SoniTrCache:
             'subs_and_edit': [],
             'tts': [],
             'acc_and_vc': [],
-            'mix_aud': [],
             'output': []
         }
 
@@ -189,13 +214,98 @@ class SoniTrCache:
         self.pre_step = None
         self.pre_params = []
 
+        self.stage_cache_enabled = True
+
+        # Stage admission of the batch engine workers
+        self.stage_gate = None
+
+        # Default directory of the intermediate files of a job
+        self.workspace = Workspace()
+        # Workspace of the files the cached stages refer to
+        self.cache_workspace = self.workspace
+
     def set_variable(self, variable_name, value):
         setattr(self, variable_name, value)
 
+    def stage_key(self, step, params):
+        idx = self.cache_keys.index(step)
+        chain = [self.cache[key] for key in self.cache_keys[:idx]]
+        return StageCache.make_key(step, chain + [params])
+
+    def save_stage(self, step):
+        if not self.stage_cache_enabled or step not in PERSISTENT_STEPS:
+            return
+
+        try:
+            stage_cache = get_stage_cache()
+            key = self.stage_key(step, self.cache[step])
+            if key in stage_cache:
+                return
+
+            # Files by name, restored into the workspace of the next job
+            files = {}
+            directory = PERSISTENT_STEPS[step]
+            if directory:
+                directory = self.cache_workspace.path(directory)
+                clips = self.cache_workspace.clips
+                for path in clips.in_directory(directory):
+                    name = os.path.basename(path) + STAGE_CLIP_SUFFIX
+                    files[name] = clips.encode(path)
+            if directory and os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    path = os.path.join(directory, name)
+                    if name + STAGE_CLIP_SUFFIX in files:
+                        continue
+                    if os.path.isfile(path):
+                        with open(path, "rb") as f:
+                            files[name] = f.read()
+
+            stage_cache.save(key, self.cache_data[step], files)
+        except Exception as error:
+            logger.warning(f"Stage cache save {step}: {str(error)}")
+
+    def load_stage(self, step, params):
+        if not self.stage_cache_enabled or step not in PERSISTENT_STEPS:
+            return False
+
+        try:
+            entry = get_stage_cache().load(self.stage_key(step, params))
+        except Exception as error:
+            logger.warning(f"Stage cache load {step}: {str(error)}")
+            entry = None
+        if entry is None:
+            return False
+
+        directory = PERSISTENT_STEPS[step]
+        if directory:
+            self.cache_workspace.clean(directory)
+        for name, content in entry["files"].items():
+            path = self.cache_workspace.path(
+                directory, os.path.basename(name)
+            )
+            if path.endswith(STAGE_CLIP_SUFFIX):
+                self.cache_workspace.clips.put_encoded(
+                    path[:-len(STAGE_CLIP_SUFFIX)], content
+                )
+                continue
+            with open(path, "wb") as f:
+                f.write(content)
+
+        for key, value in entry["data"].items():
+            self.set_variable(key, value)
+            logger.debug(f"Stage cache load: {str(key)}")
+
+        self.cache_data[step] = copy.deepcopy(entry["data"])
+        logger.info(f"Restored from stage cache: {str(step)}")
+        return True
+
     def task_in_cache(self, step: str, params: list, previous_step_data: dict):
 
         self.pre_step_cache = None
 
+        if self.stage_gate is not None:
+            self.stage_gate.enter(step)
+
         if step == self.first_task:
             self.pre_step = None
 
@@ -204,6 +314,7 @@ class SoniTrCache:
 
             # Fill data in cache
             self.cache_data[self.pre_step] = copy.deepcopy(previous_step_data)
+            self.save_stage(self.pre_step)
 
         self.pre_params = params
         # logger.debug(f"Step: {str(step)}, Cache params: {str(self.cache)}")
@@ -232,7 +343,9 @@ class SoniTrCache:
 
             # The last is now previous
             self.pre_step = step
-            return False
+
+            # Result of a previous process or another job
+            return self.load_stage(step, params)
 
     def clear_cache(self, media, force=False):
 
@@ -284,27 +397,32 @@ class SoniTranslate(SoniTrCache):
         self.result_source_lang = None
         self.edit_subs_complete = False
         self.voiceless_id = None
-        self.burn_subs_id = None
 
-        self.vci = ClassVoices(only_cpu=cpu_mode)
+        self.cpu_mode = cpu_mode
+        self._vci = None
 
         self.tts_voices = self.get_tts_voice_list()
 
         logger.info(f"Working in: {self.device}")
 
-    def get_tts_voice_list(self):
-        try:
-            from piper import PiperVoice  # noqa
+    @property
+    def vci(self):
+        """Voice conversion models, loaded with their backend on first use."""
+        if self._vci is None:
+            from voice_main import ClassVoices
+
+            self._vci = ClassVoices(only_cpu=self.cpu_mode)
+        return self._vci
 
+    def get_tts_voice_list(self):
+        # Only look the engines up; importing them takes seconds
+        if importlib.util.find_spec("piper") is not None:
             piper_enabled = True
             logger.info("PIPER TTS enabled")
-        except Exception as error:
-            logger.debug(str(error))
+        else:
             piper_enabled = False
             logger.info("PIPER TTS disabled")
-        try:
-            from TTS.api import TTS  # noqa
-
+        if importlib.util.find_spec("TTS") is not None:
             xtts_enabled = True
             logger.info("Coqui XTTS enabled")
             logger.info(
@@ -315,8 +433,7 @@ class SoniTranslate(SoniTrCache):
                 "link:\nhttps://coqui.ai/cpml.txt."
             )
             os.environ["COQUI_TOS_AGREED"] = "1"
-        except Exception as error:
-            logger.debug(str(error))
+        else:
             xtts_enabled = False
             logger.info("Coqui XTTS disabled")
 
@@ -360,6 +477,29 @@ class SoniTranslate(SoniTrCache):
             media_batch = [media_batch[0]]
 
         result = []
+        if len(media_batch) > 1 and BATCH_WORKERS > 1:
+            # Files in parallel, each job in its own working directory
+            media_batch = [
+                media if isinstance(media, str) else media.name
+                for media in media_batch
+            ]
+            job_args = tuple(
+                arg.name
+                if hasattr(arg, "name") and not isinstance(arg, str)
+                else arg
+                for arg in kwargs[:-1]
+            ) + (False,)
+
+            def job_done(i, output_file):
+                if is_gui_arg and output_file:
+                    gr.Info(f"Done: {os.path.basename(output_file[0])}")
+
+            engine = BatchEngine(cpu_mode=self.device == "cpu")
+            outputs, _ = engine.run(media_batch, job_args, on_done=job_done)
+            for output_file in outputs:
+                result.extend(output_file)
+            return result
+
         for media in media_batch:
             # Call the nested function with the parameters
             output_file = self.multilingual_media_conversion(
@@ -373,6 +513,10 @@ class SoniTranslate(SoniTrCache):
             if is_gui_arg and len(media_batch) > 1:
                 gr.Info(f"Done: {os.path.basename(output_file[0])}")
 
+        # ASR, alignment and diarization models stay warm across the batch
+        # with KEEP_MODELS_WARM=1
+        logger.info(f"Model pool: {get_model_pool().get_stats()}")
+
         return result
 
     def multilingual_media_conversion(
@@ -434,8 +578,12 @@ class SoniTranslate(SoniTrCache):
         custom_voices=False,
         custom_voices_workers=1,
         is_gui=False,
-        progress=gr.Progress(),
+        progress=None,
+        workspace=None,
     ):
+        if is_gui and progress is None:
+            progress = gui_progress()
+
         if not YOUR_HF_TOKEN:
             YOUR_HF_TOKEN = os.getenv("YOUR_HF_TOKEN")
             if diarization_model == "disable" or max_speakers == 1:
@@ -559,13 +707,20 @@ class SoniTranslate(SoniTrCache):
                 "original language (Source language)"
             )
 
+        # Files of a different workspace are not in this one
+        workspace = workspace or self.workspace
+        moved_workspace = workspace.root != self.cache_workspace.root
+        self.cache_workspace = workspace
+
         if not media_file and subtitle_file:
             diarization_model = "disable"
-            media_file = "audio_support.wav"
+            media_file = workspace.path("audio_support.wav")
             if not get_video_from_text_json:
                 remove_files(media_file)
                 srt_data = srt_file_to_segments(subtitle_file)
                 total_duration = srt_data["segments"][-1]["end"] + 30.
+                from pydub import AudioSegment
+
                 support_audio = AudioSegment.silent(
                     duration=int(total_duration * 1000)
                 )
@@ -590,20 +745,21 @@ class SoniTranslate(SoniTrCache):
             logger.info("Compute type changed to float32")
             compute_type = "float32"
 
-        base_video_file = "Video.mp4"
-        base_audio_wav = "audio.wav"
-        dub_audio_file = "audio_dub_solo.ogg"
-        vocals_audio_file = "audio_Vocals_DeReverb.wav"
-        voiceless_audio_file = "audio_Voiceless.wav"
-        mix_audio_file = "audio_mix.mp3"
-        vid_subs = "video_subs_file.mp4"
-        video_output_file = "video_dub.mp4"
+        base_video_file = workspace.path("Video.mp4")
+        base_audio_wav = workspace.path("audio.wav")
+        dub_audio_file = workspace.path("audio_dub_solo.ogg")
+        vocals_audio_file = workspace.path("audio_Vocals_DeReverb.wav")
+        voiceless_audio_file = workspace.path("audio_Voiceless.wav")
+        separation_dir = workspace.path("clean_song_output")
 
         if os.path.exists(media_file):
             media_base_hash = get_hash(media_file)
         else:
             media_base_hash = media_file
-        self.clear_cache(media_base_hash, force=(not enable_cache))
+        self.stage_cache_enabled = enable_cache
+        self.clear_cache(
+            media_base_hash, force=(not enable_cache or moved_workspace)
+        )
 
         if not get_video_from_text_json:
             self.result_diarize = (
@@ -631,7 +787,9 @@ class SoniTranslate(SoniTrCache):
                     is_gui,
                     progress=progress
                 )
-                separate_out = sound_separate(base_audio_wav, output_type)
+                separate_out = sound_separate(
+                    base_audio_wav, output_type, workspace
+                )
                 final_outputs = []
                 for out in separate_out:
                     final_name = media_out(
@@ -666,12 +824,18 @@ class SoniTranslate(SoniTrCache):
                             main_vocals=False,
                             dereverb=True,
                             remove_files_output_dir=True,
+                            output_path=separation_dir,
                         )
                         remove_files(vocals_audio_file)
-                        copy_files(file_vocals, ".")
+                        copy_files(file_vocals, workspace.root)
                         self.vocals = vocals_audio_file
                     except Exception as error:
                         logger.error(str(error))
+                    finally:
+                        from soni_translate.mdx_net import (
+                            release_mdx_sessions
+                        )
+                        release_mdx_sessions()
 
             if not self.task_in_cache("transcript_align", [
                 subtitle_file,
@@ -852,7 +1016,7 @@ class SoniTranslate(SoniTrCache):
             "result_diarize": self.result_diarize
         }):
             if output_format_subtitle == "disable":
-                self.sub_file = "sub_tra.srt"
+                self.sub_file = workspace.path("sub_tra.srt")
             elif output_format_subtitle != "ass":
                 self.sub_file = process_subtitles(
                     self.result_source_lang,
@@ -860,6 +1024,7 @@ class SoniTranslate(SoniTrCache):
                     self.result_diarize,
                     output_format_subtitle,
                     TRANSLATE_AUDIO_TO,
+                    workspace,
                 )
 
             # Need task
@@ -870,12 +1035,15 @@ class SoniTranslate(SoniTrCache):
                     self.result_diarize,
                     "srt",
                     TRANSLATE_AUDIO_TO,
+                    workspace,
                 )
 
             if output_format_subtitle == "ass":
-                convert_ori = "ffmpeg -i sub_ori.srt sub_ori.ass -y"
-                convert_tra = "ffmpeg -i sub_tra.srt sub_tra.ass -y"
-                self.sub_file = "sub_tra.ass"
+                sub_ori = workspace.path("sub_ori.")
+                sub_tra = workspace.path("sub_tra.")
+                convert_ori = f'ffmpeg -i "{sub_ori}srt" "{sub_ori}ass" -y'
+                convert_tra = f'ffmpeg -i "{sub_tra}srt" "{sub_tra}ass" -y'
+                self.sub_file = f"{sub_tra}ass"
                 run_command(convert_ori)
                 run_command(convert_tra)
 
@@ -902,7 +1070,7 @@ class SoniTranslate(SoniTrCache):
                 self.align_language,
                 video_output_name,
                 format_sub,
-                file_obj=f"sub_ori.{format_sub}",
+                file_obj=workspace.path(f"sub_ori.{format_sub}"),
             )
             out_subs.append(ori_subs)
             logger.info(f"Done: {out_subs}")
@@ -915,6 +1083,7 @@ class SoniTranslate(SoniTrCache):
                 language=TRANSLATE_AUDIO_TO,
                 extension=format_sub,
                 base_name=video_output_name,
+                workspace=workspace,
             )
             logger.info(f"Done: {str(output)}")
             return output
@@ -930,6 +1099,7 @@ class SoniTranslate(SoniTrCache):
                 file_obj=base_audio_wav if is_audio_file(media_file) else base_video_file,
                 soft_subtitles=False if is_audio_file(media_file) else True,
                 subtitle_files=output_format_subtitle,
+                workspace=workspace,
             )
             msg_out = output[0] if isinstance(output, list) else output
             logger.info(f"Done: {msg_out}")
@@ -971,6 +1141,7 @@ class SoniTranslate(SoniTrCache):
                 tts_voice10,
                 tts_voice11,
                 dereverb_automatic_xtts,
+                workspace=workspace,
             )
 
         if not self.task_in_cache("acc_and_vc", [
@@ -983,7 +1154,7 @@ class SoniTranslate(SoniTrCache):
             voice_imitation_method,
             custom_voices,
             custom_voices_workers,
-            copy.deepcopy(self.vci.model_config),
+            copy.deepcopy(self._vci.model_config if self._vci else {}),
             avoid_overlap
         ], {
             "valid_speakers": self.valid_speakers
@@ -993,8 +1164,13 @@ class SoniTranslate(SoniTrCache):
                     max_accelerate_audio,
                     self.valid_speakers,
                     acceleration_rate_regulation,
+                    workspace=workspace,
                 )
 
+            # The voice conversion reads and rewrites the files
+            if voice_imitation or custom_voices:
+                workspace.clips.persist(audio_files, release=True)
+
             # Voice Imitation (Tone color converter)
             if voice_imitation:
                 prog_disp(
@@ -1009,6 +1185,7 @@ class SoniTranslate(SoniTrCache):
                         voice_imitation_remove_previous,
                         voice_imitation_vocals_dereverb,
                         voice_imitation_method,
+                        workspace=workspace,
                     )
                 except Exception as error:
                     logger.error(str(error))
@@ -1046,13 +1223,17 @@ class SoniTranslate(SoniTrCache):
                 dub_audio_file,
                 False,
                 avoid_overlap,
+                workspace=workspace,
             )
 
         # Voiceless track, change with file
         hash_base_audio_wav = get_hash(base_audio_wav)
         if voiceless_track:
             if self.voiceless_id != hash_base_audio_wav:
-                from soni_translate.mdx_net import process_uvr_task
+                from soni_translate.mdx_net import (
+                    process_uvr_task,
+                    release_mdx_sessions,
+                )
 
                 try:
                     # voiceless_audio_file_dir = "clean_song_output/voiceless"
@@ -1062,93 +1243,76 @@ class SoniTranslate(SoniTrCache):
                         song_id="voiceless",
                         only_voiceless=True,
                         remove_files_output_dir=False,
+                        output_path=separation_dir,
                     )
-                    copy_files(uvr_voiceless_audio_wav, ".")
+                    copy_files(uvr_voiceless_audio_wav, workspace.root)
                     base_audio_wav = voiceless_audio_file
                     self.voiceless_id = hash_base_audio_wav
 
                 except Exception as error:
                     logger.error(str(error))
+                finally:
+                    release_mdx_sessions()
             else:
                 base_audio_wav = voiceless_audio_file
 
-        if not self.task_in_cache("mix_aud", [
-            mix_method_audio,
-            volume_original_audio,
-            volume_translated_audio,
-            voiceless_track
-        ], {}):
-            # TYPE MIX AUDIO
-            remove_files(mix_audio_file)
-            command_volume_mix = f'ffmpeg -y -i {base_audio_wav} -i {dub_audio_file} -filter_complex "[0:0]volume={volume_original_audio}[a];[1:0]volume={volume_translated_audio}[b];[a][b]amix=inputs=2:duration=longest" -c:a libmp3lame {mix_audio_file}'
-            command_background_mix = f'ffmpeg -i {base_audio_wav} -i {dub_audio_file} -filter_complex "[1:a]asplit=2[sc][mix];[0:a][sc]sidechaincompress=threshold=0.003:ratio=20[bg]; [bg][mix]amerge[final]" -map [final] {mix_audio_file}'
-            if mix_method_audio == "Adjusting volumes and mixing audio":
-                # volume mix
-                run_command(command_volume_mix)
-            else:
-                try:
-                    # background mix
-                    run_command(command_background_mix)
-                except Exception as error_mix:
-                    # volume mix except
-                    logger.error(str(error_mix))
-                    run_command(command_volume_mix)
-
         if "audio" in output_type or is_audio_file(media_file):
-            output = media_out(
-                media_file,
-                TRANSLATE_AUDIO_TO,
-                video_output_name,
-                "wav" if "wav" in output_type else (
-                    "ogg" if "ogg" in output_type else "mp3"
-                ),
-                file_obj=mix_audio_file,
-                subtitle_files=output_format_subtitle,
+            extension = "wav" if "wav" in output_type else (
+                "ogg" if "ogg" in output_type else "mp3"
             )
-            msg_out = output[0] if isinstance(output, list) else output
-            logger.info(f"Done: {msg_out}")
-            return output
-
-        hash_base_video_file = get_hash(base_video_file)
-
-        if burn_subtitles_to_video:
-            hashvideo_text = [
-                hash_base_video_file,
-                [seg["text"] for seg in self.result_diarize["segments"]]
-            ]
-            if self.burn_subs_id != hashvideo_text:
-                try:
-                    logger.info("Burn subtitles")
-                    remove_files(vid_subs)
-                    command = f"ffmpeg -i {base_video_file} -y -vf subtitles=sub_tra.srt -max_muxing_queue_size 9999 {vid_subs}"
-                    run_command(command)
-                    base_video_file = vid_subs
-                    self.burn_subs_id = hashvideo_text
-                except Exception as error:
-                    logger.error(str(error))
-            else:
-                base_video_file = vid_subs
+            render_file = workspace.path(f"audio_mix.{extension}")
+            render_video = None
+            hash_base_video_file = None
+        else:
+            extension = "mkv" if "mkv" in output_type else "mp4"
+            render_file = workspace.path(f"video_dub.{extension}")
+            render_video = base_video_file
+            hash_base_video_file = get_hash(base_video_file)
 
         if not self.task_in_cache("output", [
             hash_base_video_file,
             hash_base_audio_wav,
-            burn_subtitles_to_video
-        ], {}):
-            # Merge new audio + video
-            remove_files(video_output_file)
-            run_command(
-                f"ffmpeg -i {base_video_file} -i {mix_audio_file} -c:v copy -c:a copy -map 0:v -map 1:a -shortest {video_output_file}"
+            mix_method_audio,
+            volume_original_audio,
+            volume_translated_audio,
+            voiceless_track,
+            burn_subtitles_to_video,
+            soft_subtitles_to_video,
+            RENDER_VIDEO_PRESET,
+        ], {}) or not os.path.exists(render_file):
+            # Mix, subtitle burn and mux in a single ffmpeg pass, encoding
+            # the mix only once in the output codec
+            remove_files(render_file)
+            sub_tra = workspace.path("sub_tra.srt")
+            sub_ori = workspace.path("sub_ori.srt")
+            render_final_media(
+                render_file,
+                base_audio_wav,
+                dub_audio_file,
+                base_video=render_video,
+                mix_method=mix_method_audio,
+                volume_original=volume_original_audio,
+                volume_translated=volume_translated_audio,
+                burn_subtitles=sub_tra if burn_subtitles_to_video else None,
+                soft_subtitles=(
+                    [sub_tra, sub_ori] if soft_subtitles_to_video else []
+                ),
             )
 
+        time_start = time.perf_counter()
         output = media_out(
             media_file,
             TRANSLATE_AUDIO_TO,
             video_output_name,
-            "mkv" if "mkv" in output_type else "mp4",
-            file_obj=video_output_file,
-            soft_subtitles=soft_subtitles_to_video,
+            extension,
+            file_obj=render_file,
             subtitle_files=output_format_subtitle,
+            workspace=workspace,
+            # The render is removed before it is made again, never
+            # rewritten in place, so the output can share its data
+            link=True,
         )
+        logger.info(f"Published in {time.perf_counter() - time_start:.2f}s")
         msg_out = output[0] if isinstance(output, list) else output
         logger.info(f"Done: {msg_out}")
 
@@ -1172,10 +1336,21 @@ class SoniTranslate(SoniTrCache):
         end_page,
         bcolor,
         is_gui,
-        progress
+        progress,
+        workspace=None,
     ):
+        workspace = workspace or self.workspace
+
         prog_disp("Processing pages...", 0.10, is_gui, progress=progress)
-        doc_data = doc_to_txtximg_pages(document,  width, height, start_page, end_page, bcolor)
+        doc_data = doc_to_txtximg_pages(
+            document,
+            width,
+            height,
+            start_page,
+            end_page,
+            bcolor,
+            workspace,
+        )
         result_diarize = page_data_to_segments(doc_data, 1700)
 
         prog_disp("Translating...", 0.20, is_gui, progress=progress)
@@ -1198,6 +1373,7 @@ class SoniTranslate(SoniTrCache):
             tgt_lang,
             is_gui,
             tts,
+            workspace=workspace,
         )
 
         # fix format and set folder output
@@ -1205,10 +1381,12 @@ class SoniTranslate(SoniTrCache):
                 result_diarize,
                 1.0,
                 valid_speakers,
+                workspace=workspace,
             )
 
         # custom voice
         if custom_voices:
+            workspace.clips.persist(audio_files, release=True)
             prog_disp(
                 "Applying customized voices...",
                 0.60,
@@ -1224,24 +1402,31 @@ class SoniTranslate(SoniTrCache):
             self.vci.unload_models()
 
         # Update time segments and not concat
-        result_diarize = fix_timestamps_docs(result_diarize, audio_files)
-        final_wav_file = "audio_book.wav"
+        result_diarize = fix_timestamps_docs(
+            result_diarize, audio_files, workspace=workspace
+        )
+        final_wav_file = workspace.path("audio_book.wav")
         remove_files(final_wav_file)
 
         prog_disp("Creating audio file...", 0.70, is_gui, progress=progress)
         create_translated_audio(
-            result_diarize, audio_files, final_wav_file, False
+            result_diarize,
+            audio_files,
+            final_wav_file,
+            False,
+            workspace=workspace,
         )
 
         prog_disp("Creating video file...", 0.80, is_gui, progress=progress)
         video_doc = create_video_from_images(
                 doc_data,
-                result_diarize
+                result_diarize,
+                workspace,
         )
 
         # Merge video and audio
         prog_disp("Merging...", 0.90, is_gui, progress=progress)
-        vid_out = merge_video_and_audio(video_doc, final_wav_file)
+        vid_out = merge_video_and_audio(video_doc, final_wav_file, workspace)
 
         # End
         output = media_out(
@@ -1254,6 +1439,80 @@ class SoniTranslate(SoniTrCache):
         logger.info(f"Done: {output}")
         return output
 
+    def stream_media_conversion(
+        self,
+        source,
+        origin_language="Automatic detection",
+        target_language="English (en)",
+        tts_voice00="en-US-EmmaMultilingualNeural-Female",
+        transcriber_model="large-v3",
+        batch_size=4,
+        compute_type="auto",
+        literalize_numbers=True,
+        segment_duration_limit=15,
+        translate_process="google_translator_batch",
+        max_accelerate_audio=2.1,
+        output_file=None,
+        hls_directory=None,
+        on_audio=None,
+        realtime=False,
+        follow=False,
+        workspace=None,
+    ):
+        """
+        Low-latency dubbing of a live or growing input (file, URL, pipe or
+        recording) in rolling windows, with one voice. See StreamingDubber.
+
+        Returns:
+        - report (dict): Latency of each window and totals.
+        """
+        from soni_translate.streaming import StreamingDubber
+
+        if (
+            "gpt" in translate_process
+            or "OpenAI-TTS" in tts_voice00
+        ):
+            check_openai_api_key()
+        if transcriber_model == "OpenAI_API_Whisper":
+            raise ValueError(
+                "OpenAI's API Whisper is not available in streaming mode."
+            )
+        if origin_language in UNIDIRECTIONAL_L_LIST:
+            raise ValueError(
+                f"The language '{origin_language}' "
+                "is not supported for transcription (ASR)."
+            )
+
+        SOURCE_LANGUAGE = LANGUAGES[origin_language or "Automatic detection"]
+        if SOURCE_LANGUAGE == "Automatic detection":
+            SOURCE_LANGUAGE = None
+
+        if self.device == "cpu" and compute_type not in COMPUTE_TYPE_CPU:
+            logger.info("Compute type changed to float32")
+            compute_type = "float32"
+
+        dubber = StreamingDubber(
+            LANGUAGES[target_language],
+            SOURCE_LANGUAGE,
+            tts_voice00=tts_voice00,
+            transcriber_model=transcriber_model,
+            compute_type=compute_type,
+            batch_size=batch_size,
+            literalize_numbers=literalize_numbers,
+            segment_duration_limit=segment_duration_limit,
+            translate_process=translate_process,
+            max_accelerate_audio=max_accelerate_audio,
+            workspace=workspace or self.workspace,
+        )
+        return dubber.run(
+            source,
+            output_file=output_file,
+            hls_directory=hls_directory,
+            on_audio=on_audio,
+            realtime=realtime,
+            follow=follow,
+        )
+
     def multilingual_docs_conversion(
         self,
         string_text="",  # string
@@ -1274,11 +1533,17 @@ class SoniTranslate(SoniTrCache):
         height=720,
         bcolor="dynamic",
         is_gui=False,
-        progress=gr.Progress(),
+        progress=None,
+        workspace=None,
     ):
+        if is_gui and progress is None:
+            progress = gui_progress()
+
         if "gpt" in translate_process:
             check_openai_api_key()
 
+        workspace = workspace or self.workspace
+
         SOURCE_LANGUAGE = LANGUAGES[origin_language]
         if translate_process != "disable_translation":
             TRANSLATE_AUDIO_TO = LANGUAGES[target_language]
@@ -1327,15 +1592,16 @@ class SoniTranslate(SoniTrCache):
                 end_page,
                 bcolor,
                 is_gui,
-                progress
+                progress,
+                workspace=workspace,
             )
 
         # audio_wav = "audio.wav"
-        final_wav_file = "audio_book.wav"
+        final_wav_file = workspace.path("audio_book.wav")
 
         prog_disp("Processing text...", 0.15, is_gui, progress=progress)
         result_file_path, result_text = document_preprocessor(
-            document, is_string, start_page, end_page
+            document, is_string, start_page, end_page, workspace
         )
 
         if (
@@ -1364,7 +1630,9 @@ class SoniTranslate(SoniTrCache):
                 source=SOURCE_LANGUAGE,
             )
 
-            txt_file_path, result_text = segments_to_plain_text(result_diarize)
+            txt_file_path, result_text = segments_to_plain_text(
+                result_diarize, workspace
+            )
 
             if output_type == "book (txt)":
                 return media_out(
@@ -1388,6 +1656,7 @@ class SoniTranslate(SoniTrCache):
             TRANSLATE_AUDIO_TO,
             is_gui,
             tts_voice00,
+            workspace=workspace,
         )
 
         # fix format and set folder output
@@ -1395,6 +1664,7 @@ class SoniTranslate(SoniTrCache):
                 result_diarize,
                 1.0,
                 valid_speakers,
+                workspace=workspace,
             )
 
         # custom voice
@@ -1418,7 +1688,11 @@ class SoniTranslate(SoniTrCache):
         )
         remove_files(final_wav_file)
         create_translated_audio(
-            result_diarize, audio_files, final_wav_file, True
+            result_diarize,
+            audio_files,
+            final_wav_file,
+            True,
+            workspace=workspace,
         )
 
         output = media_out(
@@ -1440,6 +1714,8 @@ title = "<center><strong><font size='7'>📽️ SoniTranslate 🈷️</font></st
 
 
 def create_gui(theme, logs_in_gui=False):
+    from soni_translate.languages_gui import news
+
     with gr.Blocks(theme=theme) as app:
         gr.Markdown(title)
         gr.Markdown(lg_conf["description"])
@@ -2851,6 +3127,8 @@ if __name__ == "__main__":
 
     SoniTr = SoniTranslate(cpu_mode=args.cpu_mode)
 
+    from soni_translate.languages_gui import language_data
+
     lg_conf = get_language_config(language_data, language=args.language)
 
     app = create_gui(args.theme, logs_in_gui=args.logs_in_gui)
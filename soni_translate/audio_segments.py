@@ -1,61 +1,160 @@
-from pydub import AudioSegment
 from tqdm import tqdm
 from .utils import run_command
+from .workspace import Workspace
+from .clip_store import decode_audio
 from .logging_setup import logger
 import numpy as np
+import soundfile as sf
+import tempfile
+import os
 
+MIXER_SAMPLE_RATE = 44100
+# Timelines longer than this (in seconds) are backed by a scratch file
+MIXER_MEMMAP_THRESHOLD = 600
+MIXER_CHUNK_FRAMES = 1 << 20
 
-class Mixer:
-    def __init__(self):
-        self.parts = []
 
-    def __len__(self):
-        parts = self._sync()
-        seg = parts[0][1]
-        frame_count = max(offset + seg.frame_count() for offset, seg in parts)
-        return int(1000.0 * frame_count / seg.frame_rate)
+def read_audio_clip(audio_file, sample_rate=MIXER_SAMPLE_RATE):
+    """Decode a clip to mono float32 at `sample_rate`."""
+    data, sr = decode_audio(audio_file)
 
-    def overlay(self, sound, position=0):
-        self.parts.append((position, sound))
-        return self
+    if sr != sample_rate and len(data):
+        import librosa
 
-    def _sync(self):
-        positions, segs = zip(*self.parts)
+        data = librosa.resample(data, orig_sr=sr, target_sr=sample_rate)
 
-        frame_rate = segs[0].frame_rate
-        array_type = segs[0].array_type # noqa
+    return np.ascontiguousarray(data, dtype=np.float32)
 
-        offsets = [int(frame_rate * pos / 1000.0) for pos in positions]
-        segs = AudioSegment.empty()._sync(*segs)
-        return list(zip(offsets, segs))
 
-    def append(self, sound):
-        self.overlay(sound, position=len(self))
+class Mixer:
+    """Mono float32 timeline where clips are added in place.
+
+    The buffer is preallocated for the expected duration and grows only
+    when a clip ends past it. Long timelines live in a memory-mapped
+    scratch file so the resident memory does not depend on the number of
+    clips or the media length.
+    """
+
+    def __init__(
+        self,
+        duration=0.0,
+        sample_rate=MIXER_SAMPLE_RATE,
+        memmap=None,
+        normalize_parts=True,
+    ):
+        self.sample_rate = sample_rate
+        self.normalize_parts = normalize_parts
+        capacity = max(1, int(duration * sample_rate))
+        self.frames = int(duration * sample_rate)  # used length
+
+        if memmap is None:
+            memmap = duration > MIXER_MEMMAP_THRESHOLD
+
+        self._scratch = None
+        if memmap:
+            fd, self._scratch = tempfile.mkstemp(
+                prefix="sonitr_mix_", suffix=".f32"
+            )
+            os.close(fd)
+            self.buffer = self._open_memmap(capacity)
+        else:
+            self.buffer = np.zeros(capacity, dtype=np.float32)
+
+    def _open_memmap(self, capacity):
+        with open(self._scratch, "r+b") as f:
+            f.truncate(capacity * 4)
+        return np.memmap(
+            self._scratch, dtype=np.float32, mode="r+", shape=(capacity,)
+        )
+
+    def _ensure_capacity(self, frames):
+        capacity = len(self.buffer)
+        if frames <= capacity:
+            return
+        new_capacity = max(frames, int(capacity * 1.5))
+        logger.debug(f"Mixer timeline grows to {new_capacity} frames")
+        if self._scratch:
+            self.buffer.flush()
+            del self.buffer
+            self.buffer = self._open_memmap(new_capacity)
+        else:
+            buffer = np.zeros(new_capacity, dtype=np.float32)
+            buffer[:capacity] = self.buffer
+            self.buffer = buffer
+
+    def __len__(self):
+        """Duration in milliseconds."""
+        return int(1000.0 * self.frames / self.sample_rate)
+
+    def overlay(self, samples, position=0.0):
+        """Add mono float32 `samples` at `position` seconds."""
+        samples = np.asarray(samples, dtype=np.float32)
+        if not len(samples):
+            return self
+
+        if self.normalize_parts:
+            peak = np.max(np.abs(samples))
+            if peak > 0:
+                samples = samples / peak
+
+        start = max(0, int(round(position * self.sample_rate)))
+        end = start + len(samples)
+        self._ensure_capacity(end)
+        self.buffer[start:end] += samples
+        self.frames = max(self.frames, end)
+        return self
 
-    def to_audio_segment(self):
-        parts = self._sync()
-        seg = parts[0][1]
-        channels = seg.channels
+    def overlay_file(self, audio_file, position=0.0):
+        samples = read_audio_clip(audio_file, self.sample_rate)
+        self.overlay(samples, position)
+        return len(samples) / self.sample_rate
 
-        frame_count = max(offset + seg.frame_count() for offset, seg in parts)
-        sample_count = int(frame_count * seg.channels)
+    def iter_chunks(self, chunk_frames=MIXER_CHUNK_FRAMES):
+        for start in range(0, self.frames, chunk_frames):
+            yield self.buffer[start:min(start + chunk_frames, self.frames)]
 
-        output = np.zeros(sample_count, dtype="int32")
-        for offset, seg in parts:
-            sample_offset = offset * channels
-            samples = np.frombuffer(seg.get_array_of_samples(), dtype="int32")
-            samples = np.int16(samples/np.max(np.abs(samples)) * 32767)
-            start = sample_offset
-            end = start + len(samples)
-            output[start:end] += samples
+    def peak(self):
+        return max(
+            (float(np.max(np.abs(chunk))) for chunk in self.iter_chunks()),
+            default=0.0,
+        )
 
-        return seg._spawn(
-            output, overrides={"sample_width": 4}).normalize(headroom=0.0)
+    def export(self, final_file, headroom=0.0, subtype="PCM_16"):
+        """Peak-normalize and write the timeline as WAV, chunk by chunk."""
+        peak = self.peak()
+        gain = (10 ** (-headroom / 20.0)) / peak if peak > 0 else 1.0
+
+        with sf.SoundFile(
+            final_file, "w", self.sample_rate, 1, subtype, format="WAV"
+        ) as f:
+            for chunk in self.iter_chunks():
+                f.write(np.clip(chunk * gain, -1.0, 1.0))
+
+    def close(self):
+        if self._scratch:
+            del self.buffer
+            self.buffer = np.zeros(0, dtype=np.float32)
+            try:
+                os.remove(self._scratch)
+            except OSError as error:
+                logger.debug(str(error))
+            self._scratch = None
 
 
 def create_translated_audio(
-    result_diarize, audio_files, final_file, concat=False, avoid_overlap=False,
+    result_diarize,
+    audio_files,
+    final_file,
+    concat=False,
+    avoid_overlap=False,
+    workspace=None,
 ):
+    """
+    Place the clips of the segments on the timeline and write it to
+    `final_file`. The clips are taken from the clip store of the
+    workspace, decoding only those that are not in it.
+    """
+    workspace = workspace or Workspace()
     total_duration = result_diarize["segments"][-1]["end"]  # in seconds
 
     if concat:
@@ -67,9 +166,13 @@ def create_translated_audio(
         ...
         """
 
-        # Write the file paths to list.txt
-        with open("list.txt", "w") as file:
+        # Write the file paths to list.txt, absolute because ffmpeg
+        # resolves them from the list directory
+        workspace.clips.persist(audio_files)
+        list_file = workspace.path("list.txt")
+        with open(list_file, "w") as file:
             for i, audio_file in enumerate(audio_files):
+                audio_file = os.path.abspath(audio_file)
                 if i == len(audio_files) - 1:  # Check if it's the last item
                     file.write(f"file {audio_file}")
                 else:
@@ -77,17 +180,14 @@ def create_translated_audio(
 
         # command = f"ffmpeg -f concat -safe 0 -i list.txt {final_file}"
         command = (
-            f"ffmpeg -f concat -safe 0 -i list.txt -c:a pcm_s16le {final_file}"
+            f"ffmpeg -f concat -safe 0 -i {list_file} "
+            f"-c:a pcm_s16le {final_file}"
         )
         run_command(command)
 
     else:
-        # silent audio with total_duration
-        base_audio = AudioSegment.silent(
-            duration=int(total_duration * 1000), frame_rate=41000
-        )
-        combined_audio = Mixer()
-        combined_audio.overlay(base_audio)
+        # silent timeline with total_duration
+        combined_audio = Mixer(duration=total_duration)
 
         logger.debug(
             f"Audio duration: {total_duration // 60} "
@@ -96,46 +196,46 @@ def create_translated_audio(
 
         last_end_time = 0
         previous_speaker = ""
-        for line, audio_file in tqdm(
-            zip(result_diarize["segments"], audio_files)
-        ):
-            start = float(line["start"])
-
-            # Overlay each audio at the corresponding time
-            try:
-                audio = AudioSegment.from_file(audio_file)
-                # audio_a = audio.speedup(playback_speed=1.5)
-
-                if avoid_overlap:
-                    speaker = line["speaker"]
-                    if (last_end_time - 0.500) > start:
-                        overlap_time = last_end_time - start
-                        if previous_speaker and previous_speaker != speaker:
-                            start = (last_end_time - 0.500)
-                        else:
-                            start = (last_end_time - 0.200)
-                        if overlap_time > 2.5:
-                            start = start - 0.3
-                        logger.info(
-                              f"Avoid overlap for {str(audio_file)} "
-                              f"with {str(start)}"
+        try:
+            for line, audio_file in tqdm(
+                zip(result_diarize["segments"], audio_files)
+            ):
+                start = float(line["start"])
+
+                # Overlay each audio at the corresponding time
+                try:
+                    audio = workspace.clips.get(audio_file).resampled(
+                        combined_audio.sample_rate
+                    )
+
+                    if avoid_overlap:
+                        speaker = line["speaker"]
+                        if (last_end_time - 0.500) > start:
+                            overlap_time = last_end_time - start
+                            if previous_speaker and previous_speaker != speaker:
+                                start = (last_end_time - 0.500)
+                            else:
+                                start = (last_end_time - 0.200)
+                            if overlap_time > 2.5:
+                                start = start - 0.3
+                            logger.info(
+                                  f"Avoid overlap for {str(audio_file)} "
+                                  f"with {str(start)}"
+                            )
+
+                        previous_speaker = speaker
+
+                        duration_tts_seconds = (
+                            len(audio) / combined_audio.sample_rate
                         )
+                        last_end_time = (start + duration_tts_seconds)
 
-                    previous_speaker = speaker
-
-                    duration_tts_seconds = len(audio) / 1000.0  # to sec
-                    last_end_time = (start + duration_tts_seconds)
-
-                start_time = start * 1000  # to ms
-                combined_audio = combined_audio.overlay(
-                    audio, position=start_time
-                )
-            except Exception as error:
-                logger.debug(str(error))
-                logger.error(f"Error audio file {audio_file}")
+                    combined_audio.overlay(audio, position=start)
+                except Exception as error:
+                    logger.debug(str(error))
+                    logger.error(f"Error audio file {audio_file}")
 
-        # combined audio as a file
-        combined_audio_data = combined_audio.to_audio_segment()
-        combined_audio_data.export(
-            final_file, format="wav"
-        )  # best than ogg, change if the audio is anomalous
+            # combined audio as a file
+            combined_audio.export(final_file)
+        finally:
+            combined_audio.close()
@@ -0,0 +1,243 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .workspace import Workspace
+from .logging_setup import logger
+
+# Files converted at once, each in its own worker process with its own
+# copy of the models; 1 keeps batches in the calling process
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 1))
+BATCH_WORK_DIR = os.environ.get(
+    "BATCH_WORK_DIR", os.path.join(os.getcwd(), "batch_jobs")
+)
+# Jobs allowed inside a stage at once. GPU-heavy stages take one job,
+# network-bound ones several. Overridden with e.g. "translate=8,tts=4"
+BATCH_STAGE_LIMITS = os.environ.get("BATCH_STAGE_LIMITS", "")
+DEFAULT_STAGE_LIMITS = {
+    "media": 2,
+    "refine_vocals": 1,
+    "transcript_align": 1,
+    "break_align": 2,
+    "diarize": 1,
+    "translate": 4,
+    "subs_and_edit": 2,
+    "tts": 2,
+    "acc_and_vc": 1,
+    "output": 2,
+}
+
+
+def parse_stage_limits(value=BATCH_STAGE_LIMITS):
+    """DEFAULT_STAGE_LIMITS updated with "stage=limit" pairs."""
+    limits = dict(DEFAULT_STAGE_LIMITS)
+    for item in filter(None, (x.strip() for x in value.split(","))):
+        stage, _, limit = item.partition("=")
+        if stage.strip() not in limits:
+            logger.warning(f"Unknown batch stage: {stage}")
+            continue
+        limits[stage.strip()] = max(1, int(limit))
+    return limits
+
+
+class StageGate:
+    """Admission of a job into the pipeline stages.
+
+    Each stage has a semaphore shared by the worker processes, so at most
+    its limit of jobs are inside it while the other jobs go on with other
+    stages. Time spent waiting for and inside every stage is recorded.
+    """
+
+    def __init__(self, semaphores):
+        self.semaphores = semaphores
+        self.current = None
+        self._started = 0.0
+        self.timings = {}
+        self.waits = {}
+
+    def enter(self, step):
+        self.leave()
+        semaphore = self.semaphores.get(step)
+        time_start = time.perf_counter()
+        if semaphore is not None:
+            semaphore.acquire()
+        self._started = time.perf_counter()
+        self.waits[step] = (
+            self.waits.get(step, 0.0) + self._started - time_start
+        )
+        self.current = step
+
+    def leave(self):
+        if self.current is None:
+            return
+        self.timings[self.current] = (
+            self.timings.get(self.current, 0.0)
+            + time.perf_counter() - self._started
+        )
+        semaphore = self.semaphores.get(self.current)
+        if semaphore is not None:
+            semaphore.release()
+        self.current = None
+
+    def reset(self):
+        self.leave()
+        self.timings = {}
+        self.waits = {}
+
+
+# Batch worker process state
+_worker_sonitr = None
+_worker_gate = None
+
+
+def _init_batch_worker(semaphores, cpu_mode):
+    global _worker_sonitr, _worker_gate
+    from .startup import create_engine
+
+    # A worker converts one file after another: the stages keep their
+    # models (MDX sessions, RVC models) loaded for the next file
+    os.environ.setdefault("KEEP_MODELS_WARM", "1")
+
+    _worker_sonitr = create_engine(cpu_mode=cpu_mode)
+    _worker_gate = StageGate(semaphores)
+    _worker_sonitr.stage_gate = _worker_gate
+
+
+def _run_batch_job(job_index, media, args, work_dir):
+    workspace = Workspace.create(f"job_{job_index:04d}", work_dir)
+
+    _worker_gate.reset()
+    time_start = time.perf_counter()
+    try:
+        output = _worker_sonitr.multilingual_media_conversion(
+            media, "", "", *args, workspace=workspace
+        )
+        if isinstance(output, str):
+            output = [output]
+    finally:
+        _worker_gate.leave()
+        # The outputs are already copied to the outputs directory
+        workspace.cleanup()
+
+    return output, {
+        "media": media,
+        "elapsed": time.perf_counter() - time_start,
+        "stages": dict(_worker_gate.timings),
+        "waits": dict(_worker_gate.waits),
+    }
+
+
+class BatchEngine:
+    """
+    Converts several media files at once. Every job runs in its own worker
+    process and workspace, and the stage limits let file N+1 be demuxed
+    and transcribed while file N is in TTS or mixing.
+
+    Parameters:
+    - workers (int): Jobs running at once.
+    - stage_limits (dict or None): Jobs allowed inside each stage at once.
+    - work_dir (str): Directory of the job workspaces.
+    - cpu_mode (bool): Run the workers on CPU.
+    """
+
+    def __init__(
+        self,
+        workers=BATCH_WORKERS,
+        stage_limits=None,
+        work_dir=BATCH_WORK_DIR,
+        cpu_mode=False,
+    ):
+        self.workers = max(1, workers)
+        self.stage_limits = stage_limits or parse_stage_limits()
+        self.work_dir = work_dir
+        self.cpu_mode = cpu_mode
+
+    def run(self, media_batch, args, on_done=None):
+        """
+        Convert every media with the same multilingual_media_conversion
+        arguments.
+
+        Returns:
+        - results (list): Output files of each media, in batch order.
+        - report (dict): Throughput report.
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        media_batch = [
+            os.path.abspath(media)
+            if isinstance(media, str) and os.path.exists(media)
+            else media
+            for media in media_batch
+        ]
+
+        context = multiprocessing.get_context("spawn")
+        semaphores = {
+            stage: context.Semaphore(limit)
+            for stage, limit in self.stage_limits.items()
+        }
+
+        results = [None] * len(media_batch)
+        jobs = [None] * len(media_batch)
+        time_start = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=min(self.workers, len(media_batch)),
+            mp_context=context,
+            initializer=_init_batch_worker,
+            initargs=(semaphores, self.cpu_mode),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _run_batch_job,
+                    i,
+                    media,
+                    args,
+                    self.work_dir,
+                ): i
+                for i, media in enumerate(media_batch)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i], jobs[i] = future.result()
+                except Exception as error:
+                    logger.error(f"Batch job {media_batch[i]}: {str(error)}")
+                    results[i] = []
+                    jobs[i] = {"media": media_batch[i], "error": str(error)}
+                if on_done:
+                    on_done(i, results[i])
+
+        report = self.throughput_report(jobs, time.perf_counter() - time_start)
+        return results, report
+
+    @staticmethod
+    def throughput_report(jobs, wall_time):
+        done = [job for job in jobs if job and "error" not in job]
+        busy = sum(job["elapsed"] for job in done)
+        stages = {}
+        for job in done:
+            for stage, seconds in job["stages"].items():
+                stage_times = stages.setdefault(stage, [0.0, 0.0])
+                stage_times[0] += seconds
+                stage_times[1] += job["waits"].get(stage, 0.0)
+
+        report = {
+            "files": len(jobs),
+            "failed": len(jobs) - len(done),
+            "wall_time": wall_time,
+            "files_per_hour": 3600 * len(done) / max(wall_time, 1e-6),
+            # Job time over wall time: how much the jobs overlapped
+            "overlap": busy / max(wall_time, 1e-6),
+            "stages": stages,
+            "jobs": jobs,
+        }
+
+        logger.info(
+            f"Batch: {len(done)}/{len(jobs)} files in {wall_time:.1f}s, "
+            f"{report['files_per_hour']:.1f} files/hour, "
+            f"overlap {report['overlap']:.2f}x"
+        )
+        for stage, (seconds, waited) in stages.items():
+            logger.info(
+                f"  {stage}: {seconds / max(1, len(done)):.1f}s per file, "
+                f"{waited / max(1, len(done)):.1f}s waiting"
+            )
+        return report
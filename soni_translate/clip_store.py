@@ -0,0 +1,403 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
+from .utils import write_chunked
+from .logging_setup import logger
+
+# Resident PCM of a job; clips added past it live in memory-mapped
+# scratch files
+CLIP_STORE_MEMORY_MB = int(os.environ.get("CLIP_STORE_MEMORY_MB", 1024))
+# Directory of the scratch files, the system temporary one if unset
+CLIP_STORE_DIR = os.environ.get("CLIP_STORE_DIR") or None
+# Clips decoded or encoded at once
+CLIP_STORE_WORKERS = int(
+    os.environ.get("CLIP_STORE_WORKERS", min(8, os.cpu_count() or 1))
+)
+# Encoding of a clip persisted with each extension
+PERSIST_FORMATS = {
+    ".ogg": ("OGG", "VORBIS"),
+    ".wav": ("WAV", "PCM_16"),
+    ".flac": ("FLAC", "PCM_16"),
+}
+# Lossless encoding of the clips kept in the caches, about ten times
+# cheaper than Vorbis
+CACHE_FORMAT = ("FLAC", "PCM_16")
+
+
+def decode_audio(audio_file):
+    """Mono float32 samples and sample rate of an audio file."""
+    try:
+        data, sr = sf.read(audio_file, dtype="float32", always_2d=True)
+    except Exception as error:
+        # Formats not handled by libsndfile
+        logger.debug(f"soundfile fallback for {audio_file}: {str(error)}")
+        from pydub import AudioSegment
+
+        seg = AudioSegment.from_file(audio_file)
+        data = np.array(seg.get_array_of_samples(), dtype=np.float32)
+        data = data.reshape(-1, seg.channels)
+        data /= float(1 << (8 * seg.sample_width - 1))
+        sr = seg.frame_rate
+
+    data = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+    return np.ascontiguousarray(data, dtype=np.float32), sr
+
+
+def to_float32(samples):
+    """Mono float32 samples from int or float PCM, 1D or (frames,
+    channels)."""
+    samples = np.asarray(samples)
+    if np.issubdtype(samples.dtype, np.integer):
+        scale = float(1 << (8 * samples.dtype.itemsize - 1))
+        samples = samples.astype(np.float32) / scale
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+
+class Clip:
+    """Mono float32 PCM with its sample rate. The samples are an array in
+    memory or a read-only memory map of a raw scratch file."""
+
+    def __init__(self, samples, sample_rate, scratch=None):
+        self.samples = samples
+        self.sample_rate = int(sample_rate)
+        self.scratch = scratch
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def duration(self):
+        """Duration in seconds."""
+        return len(self.samples) / self.sample_rate
+
+    @property
+    def resident_bytes(self):
+        return 0 if self.scratch else self.samples.nbytes
+
+    def resampled(self, sample_rate):
+        """The samples at `sample_rate`."""
+        if sample_rate == self.sample_rate or not len(self.samples):
+            return self.samples
+        import librosa
+
+        return librosa.resample(
+            np.asarray(self.samples),
+            orig_sr=self.sample_rate,
+            target_sr=sample_rate,
+        ).astype(np.float32)
+
+
+class ClipStore:
+    """
+    Audio clips of a job (TTS output, tempo-adjusted clips...) kept as
+    float32 PCM and passed between the stages by path, without encoding
+    or decoding in between.
+
+    The path of a clip is the file it would be written to; the file only
+    exists once the clip is persisted (for the caches, the voice
+    conversion or the outputs), which is the only lossy step. Clips not in
+    the store are decoded from their file on first access.
+
+    Parameters:
+    - memory_mb (int): Resident PCM before new clips go to scratch files.
+    - scratch_dir (str or None): Parent directory of the scratch files.
+    """
+
+    def __init__(self, memory_mb=None, scratch_dir=None):
+        if memory_mb is None:
+            memory_mb = CLIP_STORE_MEMORY_MB
+        self.memory_bytes = max(0, memory_mb) << 20
+        self.scratch_dir = scratch_dir or CLIP_STORE_DIR
+
+        self.decoded = 0
+        self.persisted = 0
+
+        self._lock = threading.Lock()
+        self._clips = {}  # path -> Clip
+        self._persisted = set()  # paths whose file matches the clip
+        self._resident = 0
+        self._scratch = None
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    def _scratch_file(self):
+        with self._lock:
+            if self._scratch is None:
+                if self.scratch_dir:
+                    os.makedirs(self.scratch_dir, exist_ok=True)
+                self._scratch = tempfile.mkdtemp(
+                    prefix="sonitr_clips_", dir=self.scratch_dir
+                )
+            scratch = self._scratch
+        fd, path = tempfile.mkstemp(dir=scratch, suffix=".f32")
+        os.close(fd)
+        return path
+
+    @staticmethod
+    def _map(scratch):
+        if not os.path.getsize(scratch):
+            raise ValueError(f"Empty clip: {scratch}")
+        return np.memmap(scratch, dtype=np.float32, mode="r")
+
+    def _spill(self, samples):
+        scratch = self._scratch_file()
+        samples.tofile(scratch)
+        return scratch, self._map(scratch)
+
+    def _set(self, key, clip, persisted=False):
+        """Register `clip` under `key`. Called with the lock held."""
+        if not any(other is clip for other in self._clips.values()):
+            self._resident += clip.resident_bytes
+        previous = self._clips.get(key)
+        self._clips[key] = clip
+        if persisted:
+            self._persisted.add(key)
+        else:
+            self._persisted.discard(key)
+        if previous is not None and previous is not clip:
+            self._release(previous)
+
+    def _release(self, clip):
+        """Forget a clip no path refers to anymore. Called with the lock
+        held."""
+        if any(other is clip for other in self._clips.values()):
+            return
+        self._resident -= clip.resident_bytes
+        if clip.scratch:
+            scratch = clip.scratch
+            clip.samples = np.zeros(0, dtype=np.float32)
+            clip.scratch = None
+            try:
+                os.remove(scratch)
+            except OSError as error:
+                logger.debug(str(error))
+
+    def put(self, path, samples, sample_rate):
+        """Store `samples` as the clip of `path`. Returns the Clip."""
+        samples = to_float32(samples)
+        if not len(samples):
+            raise ValueError(f"The clip {path} does not contain any data")
+
+        with self._lock:
+            spill = self._resident + samples.nbytes > self.memory_bytes
+        if spill:
+            scratch, samples = self._spill(samples)
+            clip = Clip(samples, sample_rate, scratch)
+        else:
+            clip = Clip(samples, sample_rate)
+
+        with self._lock:
+            self._set(self._key(path), clip)
+        return clip
+
+    def put_raw(self, path, raw_file, sample_rate):
+        """Store a raw float32 file written in the scratch directory (by
+        raw_output) as the clip of `path`, without copying it."""
+        clip = Clip(self._map(raw_file), sample_rate, raw_file)
+        with self._lock:
+            self._set(self._key(path), clip)
+        return clip
+
+    def link(self, source, path):
+        """The clip of `source` also becomes the clip of `path`. Both paths
+        share the same samples."""
+        clip = self.get(source)
+        with self._lock:
+            self._set(self._key(path), clip)
+        return clip
+
+    def get(self, path):
+        """The Clip of `path`, decoded from the file if not stored."""
+        key = self._key(path)
+        with self._lock:
+            clip = self._clips.get(key)
+        if clip is not None:
+            return clip
+
+        samples, sample_rate = decode_audio(path)
+        clip = Clip(samples, sample_rate)
+        with self._lock:
+            if key in self._clips:
+                return self._clips[key]
+            self._set(key, clip, persisted=True)
+            self.decoded += 1
+        return clip
+
+    def get_many(self, paths, workers=CLIP_STORE_WORKERS):
+        """Clips of `paths`, the missing ones decoded in parallel."""
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(self.get, paths))
+
+    def __contains__(self, path):
+        with self._lock:
+            return self._key(path) in self._clips
+
+    def raw_input(self, path):
+        """Raw float32 file with the samples of `path` (for ffmpeg -f
+        f32le). A clip in memory moves to a scratch file for it."""
+        clip = self.get(path)
+        with self._lock:
+            if clip.scratch:
+                return clip.scratch, clip.sample_rate
+        scratch, samples = self._spill(clip.samples)
+        with self._lock:
+            if clip.scratch:
+                # Spilled by another thread meanwhile
+                os.remove(scratch)
+            else:
+                self._resident -= clip.resident_bytes
+                clip.samples, clip.scratch = samples, scratch
+            return clip.scratch, clip.sample_rate
+
+    def raw_output(self):
+        """Path in the scratch directory for a raw float32 result, to be
+        stored with put_raw."""
+        return self._scratch_file()
+
+    def encode(self, path):
+        """The clip of `path` encoded in CACHE_FORMAT, as bytes."""
+        clip = self.get(path)
+        file_format, subtype = CACHE_FORMAT
+        buffer = io.BytesIO()
+        sf.write(
+            buffer,
+            np.asarray(clip.samples),
+            clip.sample_rate,
+            format=file_format,
+            subtype=subtype,
+        )
+        return buffer.getvalue()
+
+    def put_encoded(self, path, content):
+        """Store audio bytes (from encode) as the clip of `path`."""
+        samples, sample_rate = sf.read(io.BytesIO(content), dtype="float32")
+        return self.put(path, samples, sample_rate)
+
+    def discard(self, paths):
+        """Forget the clips of `paths`; their files are read again on the
+        next access."""
+        with self._lock:
+            for path in paths:
+                key = self._key(path)
+                clip = self._clips.pop(key, None)
+                self._persisted.discard(key)
+                if clip is not None:
+                    self._release(clip)
+
+    def discard_directory(self, directory):
+        with self._lock:
+            paths = self._in_directory(directory)
+        self.discard(paths)
+
+    def in_directory(self, directory):
+        """Paths of the clips stored in `directory`."""
+        with self._lock:
+            return self._in_directory(directory)
+
+    def _in_directory(self, directory):
+        directory = self._key(directory)
+        return [
+            key for key in self._clips
+            if os.path.dirname(key) == directory
+        ]
+
+    def persist(self, paths, release=False, workers=CLIP_STORE_WORKERS):
+        """
+        Encode the clips of `paths` to their files, in the format of the
+        extension. Clips already written or not stored are skipped.
+
+        Parameters:
+        - release (bool): Forget the clips afterwards, for stages that
+          rewrite the files (voice conversion).
+        """
+        with self._lock:
+            pending = [
+                (key, self._clips[key]) for key in map(self._key, paths)
+                if key in self._clips and key not in self._persisted
+            ]
+
+        def encode(item):
+            key, clip = item
+            file_format, subtype = PERSIST_FORMATS.get(
+                os.path.splitext(key)[1].lower(), (None, None)
+            )
+            write_chunked(
+                file=key,
+                samplerate=clip.sample_rate,
+                data=np.asarray(clip.samples),
+                format=file_format,
+                subtype=subtype,
+            )
+            return key
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                written = list(executor.map(encode, pending))
+            with self._lock:
+                self._persisted.update(written)
+                self.persisted += len(written)
+            logger.debug(f"Clip store: {len(written)} clips persisted")
+
+        if release:
+            self.discard(paths)
+
+    def persist_directory(self, directory, release=False):
+        with self._lock:
+            paths = self._in_directory(directory)
+        self.persist(paths, release=release)
+
+    def clear(self):
+        """Forget every clip and remove the scratch files."""
+        with self._lock:
+            clips = list(self._clips.values())
+            self._clips.clear()
+            self._persisted.clear()
+            for clip in clips:
+                self._release(clip)
+            self._resident = 0
+            scratch, self._scratch = self._scratch, None
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "clips": len(self._clips),
+                "mapped": sum(
+                    1 for clip in self._clips.values() if clip.scratch
+                ),
+                "resident_mb": round(self._resident / (1 << 20), 1),
+                "decoded": self.decoded,
+                "persisted": self.persisted,
+            }
+
+
+# Clip store of each workspace root
+_clip_stores = {}
+_clip_stores_lock = threading.Lock()
+
+
+def get_clip_store(root=os.curdir):
+    """Get the clip store of the workspace at `root`."""
+    root = os.path.abspath(root)
+    with _clip_stores_lock:
+        if root not in _clip_stores:
+            _clip_stores[root] = ClipStore()
+        return _clip_stores[root]
+
+
+def release_clip_store(root=os.curdir):
+    """Clear and forget the clip store of the workspace at `root`."""
+    with _clip_stores_lock:
+        store = _clip_stores.pop(os.path.abspath(root), None)
+    if store is not None:
+        store.clear()
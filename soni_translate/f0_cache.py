@@ -0,0 +1,155 @@
+import os
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional
+from .logging_setup import logger
+
+F0_CACHE_DIR = os.environ.get(
+    "F0_CACHE_DIR", os.path.join(os.getcwd(), ".f0-cache")
+)
+F0_CACHE_MAX_SIZE_MB = int(os.environ.get("F0_CACHE_MAX_SIZE_MB", 512))
+F0_CACHE_EXTENSION = ".npy"
+
+
+class F0Cache:
+    """Pitch curves stored on disk by audio content and extraction
+    settings, bounded in size with least-recently-used eviction."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_size_mb: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir or F0_CACHE_DIR
+        if max_size_mb is None:
+            max_size_mb = F0_CACHE_MAX_SIZE_MB
+        self.max_size = max_size_mb * 1024 * 1024
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self._size = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Index the curves already on disk, ordered by last use."""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(F0_CACHE_EXTENSION):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            key = name[:-len(F0_CACHE_EXTENSION)]
+            found.append((stat.st_mtime, key, stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+    @staticmethod
+    def make_key(
+        audio: np.ndarray,
+        method: str,
+        sample_rate: int,
+        hop: int,
+        p_len: int,
+        filter_radius: int = 0,
+        precision: str = "",
+    ) -> str:
+        """Hash of the audio samples and everything that changes the curve.
+        `precision` names the device and dtype of the model-based methods
+        (rmvpe, crepe), whose curves differ between them."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(np.ascontiguousarray(audio).tobytes())
+        settings = (
+            f"{audio.dtype}|{method}|{sample_rate}|{hop}|{p_len}|"
+            f"{filter_radius}"
+        )
+        if precision:
+            settings += f"|{precision}"
+        digest.update(settings.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + F0_CACHE_EXTENSION)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def load(self, key: str) -> Optional[np.ndarray]:
+        path = self._path(key)
+        try:
+            f0 = np.load(path)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                if key in self._entries:
+                    self._size -= self._entries.pop(key)
+            return None
+        except Exception as error:
+            logger.warning(f"Invalid F0 cache entry {path}: {error}")
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                # Stored by another process
+                size = os.path.getsize(path)
+                self._entries[key] = size
+                self._size += size
+        return f0
+
+    def save(self, key: str, f0: np.ndarray):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, f0)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        size = os.path.getsize(self._path(key))
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self._size > self.max_size and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                try:
+                    os.remove(self._path(old_key))
+                except FileNotFoundError:
+                    pass
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+            }
+
+
+# Global cache instance
+_f0_cache = None
+
+
+def get_f0_cache() -> F0Cache:
+    """Get the global F0 cache instance."""
+    global _f0_cache
+    if _f0_cache is None:
+        _f0_cache = F0Cache()
+    return _f0_cache
@@ -21,7 +21,18 @@ def configure_logging_libs(debug=False):
         for module in modules:
             logging.getLogger(module).setLevel(logging.WARNING)
         os.environ['TF_CPP_MIN_LOG_LEVEL'] = "3" if not debug else "1"
+    except Exception as error:
+        logger.error(str(error))
+
+    # pyannote imports torch and lightning, seconds at startup: it is
+    # quieted by the stages that load its models
+    if "pyannote.audio.core.model" in sys.modules:
+        quiet_pyannote()
 
+
+def quiet_pyannote():
+    """Silence the version check of the pyannote models."""
+    try:
         # fix verbose pyannote audio
         def fix_verbose_pyannote(*args, what=""):
             pass
@@ -1,37 +1,50 @@
 import gc
 import hashlib
 import os
-import queue
+import time
 import threading
 import json
 import shlex
 import sys
 import subprocess
-import librosa
 import numpy as np
 import soundfile as sf
-import torch
 from tqdm import tqdm
+from collections import OrderedDict
 
 try:
     from .utils import (
         remove_directory_contents,
         create_directories,
+        download_manager,
     )
 except:  # noqa
     from utils import (
         remove_directory_contents,
         create_directories,
+        download_manager,
     )
 from .logging_setup import logger
+from .startup import lazy_import
+from .model_pool import keep_models_warm
 
-try:
-    import onnxruntime as ort
-except Exception as error:
-    logger.error(str(error))
+torch = lazy_import("torch")
+librosa = lazy_import("librosa")
+ort = lazy_import("onnxruntime")
 # import warnings
 # warnings.filterwarnings("ignore")
 
+# STFT frames (chunks) per onnxruntime call
+MDX_BATCH_SIZE = int(os.environ.get("MDX_BATCH_SIZE", 4))
+# CPU threads inside one operator; 0 lets onnxruntime use all cores
+MDX_INTRA_OP_THREADS = int(os.environ.get("MDX_INTRA_OP_THREADS", 0))
+# Loaded models kept between calls
+MDX_SESSION_POOL_SIZE = int(os.environ.get("MDX_SESSION_POOL_SIZE", 4))
+# Inputs longer than this (in seconds) are separated window by window
+MDX_STREAM_THRESHOLD = float(os.environ.get("MDX_STREAM_THRESHOLD", 600))
+MDX_STREAM_WINDOW = float(os.environ.get("MDX_STREAM_WINDOW", 60))
+MDX_STREAM_OVERLAP = float(os.environ.get("MDX_STREAM_OVERLAP", 2))
+
 stem_naming = {
     "Vocals": "Instrumental",
     "Other": "Instruments",
@@ -120,7 +133,11 @@ class MDX:
     DEFAULT_MARGIN_SIZE = 1 * DEFAULT_SR
 
     def __init__(
-        self, model_path: str, params: MDXModel, processor=0
+        self,
+        model_path: str,
+        params: MDXModel,
+        processor=0,
+        batch_size=MDX_BATCH_SIZE,
     ):
         # Set the device and the provider (CPU or CUDA)
         self.device = (
@@ -136,8 +153,26 @@ class MDX:
 
         self.model = params
 
+        # One op runs at a time; its kernels use the intra-op threads
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = MDX_INTRA_OP_THREADS
+        sess_options.inter_op_num_threads = 1
+        sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        sess_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+
         # Load the ONNX model using ONNX Runtime
-        self.ort = ort.InferenceSession(model_path, providers=self.provider)
+        self.ort = ort.InferenceSession(
+            model_path, sess_options=sess_options, providers=self.provider
+        )
+
+        # Models exported with a fixed batch dimension take one frame
+        batch_dim = self.ort.get_inputs()[0].shape[0]
+        self.batch_size = (
+            max(1, batch_size) if not isinstance(batch_dim, int) else batch_dim
+        )
+
         # Preload the model for faster performance
         self.ort.run(
             None,
@@ -147,7 +182,8 @@ class MDX:
             None, {"input": spec.cpu().numpy()}
         )[0]
 
-        self.prog = None
+        # Serializes callers sharing this session from the pool
+        self.lock = threading.Lock()
 
     @staticmethod
     def get_hash(model_path):
@@ -229,10 +265,11 @@ class MDX:
             wave: (np.array) Wave array to be padded
 
         Returns:
-            tuple: (padded_wave, pad, trim)
+            tuple: (padded_wave, pad, trim, n_chunks)
                 - padded_wave: Padded wave array
                 - pad: Number of samples that were padded
                 - trim: Number of samples that were trimmed
+                - n_chunks: Number of chunks of the padded wave
         """
         n_sample = wave.shape[1]
         trim = self.model.n_fft // 2
@@ -240,106 +277,237 @@ class MDX:
         pad = gen_size - n_sample % gen_size
 
         # Padded wave
-        wave_p = np.concatenate(
-            (
-                np.zeros((2, trim)),
-                wave,
-                np.zeros((2, pad)),
-                np.zeros((2, trim)),
-            ),
-            1,
-        )
-
-        mix_waves = []
-        for i in range(0, n_sample + pad, gen_size):
-            waves = np.array(wave_p[:, i:i + self.model.chunk_size])
-            mix_waves.append(waves)
-
-        mix_waves = torch.tensor(mix_waves, dtype=torch.float32).to(
-            self.device
+        wave_p = np.pad(
+            wave.astype(np.float32, copy=False), ((0, 0), (trim, pad + trim))
         )
+        n_chunks = (n_sample + pad) // gen_size
 
-        return mix_waves, pad, trim
+        return wave_p, pad, trim, n_chunks
 
-    def _process_wave(self, mix_waves, trim, pad, q: queue.Queue, _id: int):
+    def _process_batch(self, mix_waves, trim):
         """
-        Process each wave segment in a multi-threaded environment
+        Separate a batch of chunks
 
         Args:
-            mix_waves: (torch.Tensor) Wave segments to be processed
-            trim: (int) Number of samples trimmed during padding
-            pad: (int) Number of samples padded during padding
-            q: (queue.Queue) Queue to hold the processed wave segments
-            _id: (int) Identifier of the processed wave segment
+            mix_waves: (torch.Tensor) Chunks with shape (batch, 2, chunk_size)
+            trim: (int) Number of samples trimmed on each side of a chunk
 
         Returns:
-            numpy array: Processed wave segment
+            numpy array: Processed samples with shape (2, batch * gen_size)
         """
-        mix_waves = mix_waves.split(1)
-        with torch.no_grad():
-            pw = []
-            for mix_wave in mix_waves:
-                self.prog.update()
-                spec = self.model.stft(mix_wave)
-                processed_spec = torch.tensor(self.process(spec))
-                processed_wav = self.model.istft(
-                    processed_spec.to(self.device)
-                )
-                processed_wav = (
-                    processed_wav[:, :, trim:-trim]
-                    .transpose(0, 1)
-                    .reshape(2, -1)
-                    .cpu()
-                    .numpy()
-                )
-                pw.append(processed_wav)
-        processed_signal = np.concatenate(pw, axis=-1)[:, :-pad]
-        q.put({_id: processed_signal})
-        return processed_signal
+        spec = self.model.stft(mix_waves)
+        processed_spec = torch.from_numpy(self.process(spec))
+        processed_wav = self.model.istft(processed_spec.to(self.device))
+        return (
+            processed_wav[:, :, trim:-trim]
+            .transpose(0, 1)
+            .reshape(2, -1)
+            .cpu()
+            .numpy()
+        )
 
-    def process_wave(self, wave: np.array, mt_threads=1):
+    def process_wave(self, wave: np.array, batch_size=None):
         """
-        Process the wave array in a multi-threaded environment
+        Process the wave array in batches of chunks
 
         Args:
             wave: (np.array) Wave array to be processed
-            mt_threads: (int) Number of threads to be used for processing
+            batch_size: (int) Chunks per onnxruntime call, the session
+                default if None
 
         Returns:
             numpy array: Processed wave array
         """
-        self.prog = tqdm(total=0)
-        chunk = wave.shape[-1] // mt_threads
-        waves = self.segment(wave, False, chunk)
-
-        # Create a queue to hold the processed wave segments
-        q = queue.Queue()
-        threads = []
-        for c, batch in enumerate(waves):
-            mix_waves, pad, trim = self.pad_wave(batch)
-            self.prog.total = len(mix_waves) * mt_threads
-            thread = threading.Thread(
-                target=self._process_wave, args=(mix_waves, trim, pad, q, c)
-            )
-            thread.start()
-            threads.append(thread)
-        for thread in threads:
-            thread.join()
-        self.prog.close()
-
-        processed_batches = []
-        while not q.empty():
-            processed_batches.append(q.get())
-        processed_batches = [
-            list(wave.values())[0]
-            for wave in sorted(
-                processed_batches, key=lambda d: list(d.keys())[0]
-            )
-        ]
-        assert len(processed_batches) == len(
-            waves
-        ), "Incomplete processed batches, please reduce batch size!"
-        return self.segment(processed_batches, True, chunk)
+        batch_size = min(batch_size or self.batch_size, self.batch_size)
+        n_sample = wave.shape[-1]
+        wave_p, pad, trim, n_chunks = self.pad_wave(wave)
+        chunk_size = self.model.chunk_size
+        gen_size = chunk_size - 2 * trim
+
+        # Written in place, no concatenation of the processed chunks
+        processed = np.empty((2, n_chunks * gen_size), dtype=np.float32)
+
+        prog = tqdm(total=n_chunks)
+        with self.lock, torch.no_grad():
+            for first in range(0, n_chunks, batch_size):
+                last = min(first + batch_size, n_chunks)
+                mix_waves = np.stack([
+                    wave_p[:, i * gen_size:i * gen_size + chunk_size]
+                    for i in range(first, last)
+                ])
+                mix_waves = torch.from_numpy(mix_waves).to(self.device)
+                processed[:, first * gen_size:last * gen_size] = (
+                    self._process_batch(mix_waves, trim)
+                )
+                prog.update(last - first)
+        prog.close()
+
+        return processed[:, :n_sample]
+
+
+_mdx_sessions = OrderedDict()
+_mdx_sessions_lock = threading.Lock()
+
+
+def load_mdx_model(model_params, model_path, device):
+    """MDXModel with the parameters of the model file."""
+    mp = model_params.get(MDX.get_hash(model_path))
+    return MDXModel(
+        device,
+        dim_f=mp["mdx_dim_f_set"],
+        dim_t=2 ** mp["mdx_dim_t_set"],
+        n_fft=mp["mdx_n_fft_scale_set"],
+        stem_name=mp["primary_stem"],
+        compensation=mp["compensate"],
+    )
+
+
+def get_mdx_session(model_params, model_path, processor_num, device):
+    """MDX session of the model, loaded once and kept in an LRU pool until
+    release_mdx_sessions."""
+    key = (os.path.abspath(model_path), processor_num)
+    with _mdx_sessions_lock:
+        if key in _mdx_sessions:
+            _mdx_sessions.move_to_end(key)
+            return _mdx_sessions[key]
+
+        model = load_mdx_model(model_params, model_path, device)
+
+        batch_size = MDX_BATCH_SIZE
+        if processor_num >= 0:
+            device_properties = torch.cuda.get_device_properties(device)
+            vram_gb = device_properties.total_memory / 1024**3
+            batch_size = min(batch_size, 2) if vram_gb < 8 else batch_size
+
+        logger.debug(f"Loading MDX session {os.path.basename(model_path)}")
+        _mdx_sessions[key] = MDX(
+            model_path, model, processor=processor_num, batch_size=batch_size
+        )
+        while len(_mdx_sessions) > max(1, MDX_SESSION_POOL_SIZE):
+            _mdx_sessions.popitem(last=False)
+        return _mdx_sessions[key]
+
+
+def release_mdx_sessions(force=False):
+    """
+    Drop the loaded MDX sessions and free their (CUDA) memory. Called when
+    a separation stage ends; the sessions are kept for the next file when
+    the models are kept warm, unless `force`.
+    """
+    if keep_models_warm() and not force:
+        return
+    with _mdx_sessions_lock:
+        if not _mdx_sessions:
+            return
+        _mdx_sessions.clear()
+    gc.collect()
+    torch.cuda.empty_cache()
+
+
+def can_stream_audio(filename, sample_rate=MDX.DEFAULT_SR):
+    """Whether soundfile reads the file at the separation sample rate."""
+    try:
+        info = sf.info(filename)
+    except Exception as error:
+        logger.debug(f"Not streamable {filename}: {str(error)}")
+        return False
+    return info.samplerate == sample_rate and info.channels in (1, 2)
+
+
+def _stream_peak(filename, blocksize):
+    peak = 0.0
+    for block in sf.blocks(
+        filename, blocksize=blocksize, dtype="float32", always_2d=True
+    ):
+        peak = max(peak, float(np.max(np.abs(block))))
+    return peak
+
+
+def separate_stream(
+    mdx_sess,
+    filename,
+    main_filepath=None,
+    invert_filepath=None,
+    denoise=False,
+    batch_size=None,
+    window=MDX_STREAM_WINDOW,
+    overlap=MDX_STREAM_OVERLAP,
+):
+    """
+    Separate the file in overlapping windows read with soundfile and write
+    the stems as they are produced, so memory does not depend on the input
+    length. Windows are cross-faded linearly over the overlap.
+
+    Parameters:
+    - mdx_sess (MDX): Session of the model.
+    - filename (str): Input audio at MDX.DEFAULT_SR, mono or stereo.
+    - main_filepath (str or None): Output of the model stem.
+    - invert_filepath (str or None): Output of the input minus the stem.
+    - denoise (bool): Average the outputs of the input and its inverse.
+    - batch_size (int or None): Chunks per onnxruntime call.
+    - window (float): Window length in seconds.
+    - overlap (float): Overlap between windows in seconds.
+    """
+    sr = MDX.DEFAULT_SR
+    window_frames = int(window * sr)
+    overlap_frames = min(int(overlap * sr), window_frames // 2)
+    compensation = mdx_sess.model.compensation
+
+    peak = _stream_peak(filename, window_frames) or 1.0
+
+    fade_in = np.linspace(0.0, 1.0, overlap_frames, dtype=np.float32)[:, None]
+    fade_out = 1.0 - fade_in
+
+    outputs = []
+    for path in (main_filepath, invert_filepath):
+        outputs.append(sf.SoundFile(path, "w", sr, 2) if path else None)
+
+    tails = [None, None]
+    try:
+        for block in tqdm(
+            sf.blocks(
+                filename,
+                blocksize=window_frames,
+                overlap=overlap_frames,
+                dtype="float32",
+                always_2d=True,
+            ),
+            desc="MDX windows",
+        ):
+            if block.shape[1] == 1:
+                block = np.repeat(block, 2, axis=1)
+            wave = block.T / peak
+
+            if denoise:
+                processed = -(mdx_sess.process_wave(-wave, batch_size)) + (
+                    mdx_sess.process_wave(wave, batch_size)
+                )
+                processed *= 0.5
+            else:
+                processed = mdx_sess.process_wave(wave, batch_size)
+
+            stems = [processed.T * peak, None]
+            if outputs[1]:
+                stems[1] = (-processed.T * compensation + wave.T) * peak
+
+            for i, (stem, output) in enumerate(zip(stems, outputs)):
+                if output is None:
+                    continue
+                tail = tails[i]
+                if tail is not None:
+                    n = min(len(tail), len(stem))
+                    stem[:n] = tail[:n] * fade_out[:n] + stem[:n] * fade_in[:n]
+                keep = min(overlap_frames, len(stem))
+                output.write(stem[:len(stem) - keep])
+                tails[i] = stem[len(stem) - keep:]
+
+        for tail, output in zip(tails, outputs):
+            if output is not None and tail is not None:
+                output.write(tail)
+    finally:
+        for output in outputs:
+            if output is not None:
+                output.close()
 
 
 def run_mdx(
@@ -353,54 +521,28 @@ def run_mdx(
     invert_suffix=None,
     denoise=False,
     keep_orig=True,
-    m_threads=2,
+    batch_size=None,
     device_base="cuda",
+    stream=None,
 ):
     if device_base == "cuda":
         device = torch.device("cuda:0")
         processor_num = 0
-        device_properties = torch.cuda.get_device_properties(device)
-        vram_gb = device_properties.total_memory / 1024**3
-        m_threads = 1 if vram_gb < 8 else 2
     else:
         device = torch.device("cpu")
         processor_num = -1
-        m_threads = 1
 
-    model_hash = MDX.get_hash(model_path)
-    mp = model_params.get(model_hash)
-    model = MDXModel(
-        device,
-        dim_f=mp["mdx_dim_f_set"],
-        dim_t=2 ** mp["mdx_dim_t_set"],
-        n_fft=mp["mdx_n_fft_scale_set"],
-        stem_name=mp["primary_stem"],
-        compensation=mp["compensate"],
-    )
+    mdx_sess = get_mdx_session(model_params, model_path, processor_num, device)
+    model = mdx_sess.model
 
-    mdx_sess = MDX(model_path, model, processor=processor_num)
-    wave, sr = librosa.load(filename, mono=False, sr=44100)
-    # normalizing input wave gives better output
-    peak = max(np.max(wave), abs(np.min(wave)))
-    wave /= peak
-    if denoise:
-        wave_processed = -(mdx_sess.process_wave(-wave, m_threads)) + (
-            mdx_sess.process_wave(wave, m_threads)
-        )
-        wave_processed *= 0.5
-    else:
-        wave_processed = mdx_sess.process_wave(wave, m_threads)
-    # return to previous peak
-    wave_processed *= peak
     stem_name = model.stem_name if suffix is None else suffix
+    base_name = os.path.basename(os.path.splitext(filename)[0])
 
     main_filepath = None
     if not exclude_main:
         main_filepath = os.path.join(
-            output_dir,
-            f"{os.path.basename(os.path.splitext(filename)[0])}_{stem_name}.wav",
+            output_dir, f"{base_name}_{stem_name}.wav"
         )
-        sf.write(main_filepath, wave_processed.T, sr)
 
     invert_filepath = None
     if not exclude_inversion:
@@ -409,28 +551,116 @@ def run_mdx(
             if invert_suffix is None
             else invert_suffix
         )
-        stem_name = (
+        diff_stem_name = (
             f"{stem_name}_diff" if diff_stem_name is None else diff_stem_name
         )
         invert_filepath = os.path.join(
-            output_dir,
-            f"{os.path.basename(os.path.splitext(filename)[0])}_{stem_name}.wav",
+            output_dir, f"{base_name}_{diff_stem_name}.wav"
+        )
+
+    if stream is None:
+        stream = (
+            can_stream_audio(filename)
+            and sf.info(filename).duration > MDX_STREAM_THRESHOLD
         )
-        sf.write(
+
+    if stream:
+        logger.debug(f"Streaming MDX separation of {filename}")
+        separate_stream(
+            mdx_sess,
+            filename,
+            main_filepath,
             invert_filepath,
-            (-wave_processed.T * model.compensation) + wave.T,
-            sr,
+            denoise=denoise,
+            batch_size=batch_size,
         )
+    else:
+        wave, sr = librosa.load(filename, mono=False, sr=44100)
+        # normalizing input wave gives better output
+        peak = max(np.max(wave), abs(np.min(wave)))
+        wave /= peak
+        if denoise:
+            wave_processed = -(mdx_sess.process_wave(-wave, batch_size)) + (
+                mdx_sess.process_wave(wave, batch_size)
+            )
+            wave_processed *= 0.5
+        else:
+            wave_processed = mdx_sess.process_wave(wave, batch_size)
+        # return to previous peak
+        wave_processed *= peak
+
+        if main_filepath:
+            sf.write(main_filepath, wave_processed.T, sr)
+
+        if invert_filepath:
+            # Input minus the stem, both at the input level, as
+            # separate_stream writes it
+            sf.write(
+                invert_filepath,
+                (-wave_processed.T * model.compensation) + wave.T * peak,
+                sr,
+            )
+
+        del wave_processed, wave
 
     if not keep_orig:
         os.remove(filename)
 
-    del mdx_sess, wave_processed, wave
     gc.collect()
-    torch.cuda.empty_cache()
     return main_filepath, invert_filepath
 
 
+def benchmark_mdx_separation(
+    model_name="UVR-MDX-NET-Voc_FT.onnx",
+    seconds=600,
+    batch_sizes=(1, 4, 8),
+):
+    """
+    CPU throughput of the separation on a fixed synthetic stereo clip.
+
+    The benchmark loads its own session, sized for the largest batch, so
+    the pooled sessions used by the jobs are not touched.
+
+    Returns:
+        dict: batch size -> (elapsed seconds, audio seconds per second)
+    """
+    download_uvr_models()
+    with open(os.path.join(mdxnet_models_dir, "data.json")) as infile:
+        mdx_model_params = json.load(infile)
+    model_path = os.path.join(mdxnet_models_dir, model_name)
+    device = torch.device("cpu")
+    mdx_sess = MDX(
+        model_path,
+        load_mdx_model(mdx_model_params, model_path, device),
+        processor=-1,
+        batch_size=max(batch_sizes),
+    )
+
+    rng = np.random.default_rng(0)
+    wave = rng.uniform(-0.5, 0.5, (2, seconds * MDX.DEFAULT_SR))
+    wave = wave.astype(np.float32)
+
+    results = {}
+    for batch_size in batch_sizes:
+        if batch_size > mdx_sess.batch_size:
+            logger.info(
+                f"MDX batch {batch_size}: skipped, the model takes "
+                f"{mdx_sess.batch_size} chunks per call"
+            )
+            continue
+        time_start = time.perf_counter()
+        mdx_sess.process_wave(wave, batch_size)
+        elapsed = time.perf_counter() - time_start
+        results[batch_size] = (elapsed, seconds / elapsed)
+        logger.info(
+            f"MDX batch {batch_size}: {elapsed:.1f}s, "
+            f"{seconds / elapsed:.1f}x real time"
+        )
+    del mdx_sess
+    gc.collect()
+    return results
+
+
 MDX_DOWNLOAD_LINK = "https://github.com/TRvlvr/model_repo/releases/download/all_public_uvr_models/"
 UVR_MODELS = [
     "UVR-MDX-NET-Voc_FT.onnx",
@@ -441,15 +671,30 @@ UVR_MODELS = [
 BASE_DIR = "."  # os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 mdxnet_models_dir = os.path.join(BASE_DIR, "mdx_models")
 output_dir = os.path.join(BASE_DIR, "clean_song_output")
+_uvr_models_checked = False
+
 
+def download_uvr_models():
+    """Download the missing UVR models, checked once per process so
+    startup doesn't wait for it."""
+    global _uvr_models_checked
+    if _uvr_models_checked:
+        return
+    for id_model in UVR_MODELS:
+        download_manager(
+            os.path.join(MDX_DOWNLOAD_LINK, id_model), mdxnet_models_dir
+        )
+    _uvr_models_checked = True
 
-def convert_to_stereo_and_wav(audio_path):
+
+def convert_to_stereo_and_wav(audio_path, directory=output_dir):
     wave, sr = librosa.load(audio_path, mono=False, sr=44100)
 
     # check if mono
     if type(wave[0]) != np.ndarray or audio_path[-4:].lower() != ".wav": # noqa
-        stereo_path = f"{os.path.splitext(audio_path)[0]}_stereo.wav"
-        stereo_path = os.path.join(output_dir, stereo_path)
+        base_name = os.path.splitext(os.path.basename(audio_path))[0]
+        stereo_path = f"{base_name}_stereo.wav"
+        stereo_path = os.path.join(directory, stereo_path)
 
         command = shlex.split(
             f'ffmpeg -y -loglevel error -i "{audio_path}" -ac 2 -f wav "{stereo_path}"'
@@ -478,6 +723,7 @@ def process_uvr_task(
     song_id: str = "mdx",  # folder output name
     only_voiceless: bool = False,
     remove_files_output_dir: bool = False,
+    output_path: str = output_dir,  # job workspace directory
 ):
     if os.environ.get("SONITR_DEVICE") == "cpu":
         device_base = "cpu"
@@ -485,14 +731,15 @@ def process_uvr_task(
         device_base = "cuda" if torch.cuda.is_available() else "cpu"
 
     if remove_files_output_dir:
-        remove_directory_contents(output_dir)
+        remove_directory_contents(output_path)
 
+    download_uvr_models()
     with open(os.path.join(mdxnet_models_dir, "data.json")) as infile:
         mdx_model_params = json.load(infile)
 
-    song_output_dir = os.path.join(output_dir, song_id)
+    song_output_dir = os.path.join(output_path, song_id)
     create_directories(song_output_dir)
-    orig_song_path = convert_to_stereo_and_wav(orig_song_path)
+    orig_song_path = convert_to_stereo_and_wav(orig_song_path, output_path)
 
     logger.debug(f"onnxruntime device >> {ort.get_device()}")
 
@@ -561,12 +808,11 @@ def process_uvr_task(
 
 
 if __name__ == "__main__":
-    from utils import download_manager
+    if "--benchmark" in sys.argv:
+        benchmark_mdx_separation()
+        sys.exit(0)
 
-    for id_model in UVR_MODELS:
-        download_manager(
-            os.path.join(MDX_DOWNLOAD_LINK, id_model), mdxnet_models_dir
-        )
+    download_uvr_models()
     (
         vocals_path_,
         instrumentals_path_,
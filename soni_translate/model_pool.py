@@ -0,0 +1,189 @@
+import os
+import gc
+import time
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from .logging_setup import logger
+
+MODEL_POOL_MAX_SIZE_MB = int(os.environ.get("MODEL_POOL_MAX_SIZE_MB", 6144))
+
+
+def memory_in_use():
+    """Resident memory of the process plus the memory used on the current
+    CUDA device, in bytes."""
+    rss = 0
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    device = 0
+    try:
+        import torch
+
+        if torch.cuda.is_available():
+            free, total = torch.cuda.mem_get_info()
+            device = total - free
+    except Exception as error:
+        logger.debug(str(error))
+
+    return rss + device
+
+
+# Open models_warm() blocks of the process
+_warm_blocks = 0
+_warm_lock = threading.Lock()
+
+
+def keep_models_warm():
+    """Whether the models stay loaded after the stage that used them. Set
+    (KEEP_MODELS_WARM=1) in the batch engine workers, which convert one
+    file after another, and inside models_warm(); otherwise every stage
+    frees its memory."""
+    if _warm_blocks > 0:
+        return True
+    return os.environ.get("KEEP_MODELS_WARM", "0") == "1"
+
+
+@contextmanager
+def models_warm():
+    """Keep the pooled models loaded inside the block (a stream
+    transcribing window after window) and release them at its end."""
+    global _warm_blocks
+    with _warm_lock:
+        _warm_blocks += 1
+    try:
+        yield
+    finally:
+        with _warm_lock:
+            _warm_blocks -= 1
+        get_model_pool().release()
+
+
+def release_memory():
+    gc.collect()
+    try:
+        import torch
+
+        torch.cuda.empty_cache()
+    except Exception as error:
+        logger.debug(str(error))
+
+
+class ModelPool:
+    """Loaded models kept warm between calls.
+
+    Entries are keyed by what identifies a model (name, device, compute
+    type, language...) and evicted least recently used first once their
+    footprint passes the memory budget. The footprint of an entry is how
+    much process and device memory grew while loading it.
+    """
+
+    def __init__(self, max_size_mb: Optional[int] = None):
+        if max_size_mb is None:
+            max_size_mb = MODEL_POOL_MAX_SIZE_MB
+        self.max_size = max_size_mb * 1024 * 1024
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+        self._lock = threading.RLock()
+        # key -> (model, size in bytes, load seconds), oldest first
+        self._entries = OrderedDict()
+        # key -> lock held while the model is in use
+        self._model_locks = {}
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """The model of `key`, calling `loader` on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                model, _, load_time = self._entries[key]
+                logger.info(
+                    f"Model pool hit {key} (saved {load_time:.1f}s)"
+                )
+                return model
+
+            release_memory()
+            before = memory_in_use()
+            time_start = time.perf_counter()
+            model = loader()
+            load_time = time.perf_counter() - time_start
+            size = max(0, memory_in_use() - before)
+
+            self.loads += 1
+            self._entries[key] = (model, size, load_time)
+            logger.info(
+                f"Model pool loaded {key} in {load_time:.1f}s "
+                f"(~{size / 1024 / 1024:.0f} MB)"
+            )
+            self._evict(keep=1)
+            return model
+
+    def model_lock(self, key: Hashable) -> threading.Lock:
+        """Lock of the model of `key`. Models with per-call state (a
+        whisperx pipeline keeps its tokenizer) are used under it by
+        concurrent jobs."""
+        with self._lock:
+            return self._model_locks.setdefault(key, threading.Lock())
+
+    def _evict(self, keep):
+        total = sum(size for _, size, _ in self._entries.values())
+        while total > self.max_size and len(self._entries) > keep:
+            time_start = time.perf_counter()
+            key, (model, size, _) = self._entries.popitem(last=False)
+            del model
+            release_memory()
+            total -= size
+            self.evictions += 1
+            logger.info(
+                f"Model pool evicted {key} in "
+                f"{time.perf_counter() - time_start:.1f}s"
+            )
+
+    def trim(self):
+        """Evict down to the budget; a zero budget drops every model."""
+        with self._lock:
+            self._evict(keep=0)
+
+    def release(self):
+        """End of a stage: evict down to the budget while the models are
+        kept warm, otherwise drop every model."""
+        if keep_models_warm():
+            self.trim()
+        else:
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        release_memory()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_bytes": sum(
+                    size for _, size, _ in self._entries.values()
+                ),
+            }
+
+
+# Global pool instance
+_model_pool = None
+
+
+def get_model_pool() -> ModelPool:
+    """Get the global model pool instance."""
+    global _model_pool
+    if _model_pool is None:
+        _model_pool = ModelPool()
+    return _model_pool
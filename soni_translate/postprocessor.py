@@ -1,5 +1,7 @@
 from .utils import remove_files, run_command
 from .text_multiformat_processor import get_subtitle
+from .workspace import Workspace
+from .preprocessor import link_or_copy
 from .logging_setup import logger
 import unicodedata
 import shutil
@@ -79,8 +81,22 @@ def get_output_file(
         new_file_name,
         soft_subtitles,
         output_directory="",
+        workspace=None,
+        link=False,
 ):
+    """
+    Publish `original_file` as `new_file_name` in the output directory,
+    converted when the extension asks for it.
+
+    Parameters:
+    - link (bool): Hardlink the file instead of copying it when no
+      conversion is needed. Only for files that are replaced, never
+      rewritten in place, by later runs (the final render).
+    """
     directory_base = "."  # default directory
+    workspace = workspace or Workspace()
+    sub_tra = workspace.path("sub_tra.srt")
+    sub_ori = workspace.path("sub_ori.srt")
 
     if output_directory and os.path.isdir(output_directory):
         new_file_path = os.path.join(output_directory, new_file_name)
@@ -91,14 +107,14 @@ def get_output_file(
     cm = None
     if soft_subtitles and original_file.endswith(".mp4"):
         if new_file_path.endswith(".mp4"):
-            cm = f'ffmpeg -y -i "{original_file}" -i sub_tra.srt -i sub_ori.srt -map 0:v -map 0:a -map 1 -map 2 -c:v copy -c:a copy -c:s mov_text "{new_file_path}"'
+            cm = f'ffmpeg -y -i "{original_file}" -i "{sub_tra}" -i "{sub_ori}" -map 0:v -map 0:a -map 1 -map 2 -c:v copy -c:a copy -c:s mov_text "{new_file_path}"'
         else:
-            cm = f'ffmpeg -y -i "{original_file}" -i sub_tra.srt -i sub_ori.srt -map 0:v -map 0:a -map 1 -map 2 -c:v copy -c:a copy -c:s srt -movflags use_metadata_tags -map_metadata 0 "{new_file_path}"'
-    elif new_file_path.endswith(".mkv"):
+            cm = f'ffmpeg -y -i "{original_file}" -i "{sub_tra}" -i "{sub_ori}" -map 0:v -map 0:a -map 1 -map 2 -c:v copy -c:a copy -c:s srt -movflags use_metadata_tags -map_metadata 0 "{new_file_path}"'
+    elif new_file_path.endswith(".mkv") and not original_file.endswith(".mkv"):
         cm = f'ffmpeg -i "{original_file}" -c:v copy -c:a copy "{new_file_path}"'
     elif new_file_path.endswith(".wav") and not original_file.endswith(".wav"):
         cm = f'ffmpeg -y -i "{original_file}" -acodec pcm_s16le -ar 44100 -ac 2 "{new_file_path}"'
-    elif new_file_path.endswith(".ogg"):
+    elif new_file_path.endswith(".ogg") and not original_file.endswith(".ogg"):
         cm = f'ffmpeg -i "{original_file}" -c:a libvorbis "{new_file_path}"'
     elif new_file_path.endswith(".mp3") and not original_file.endswith(".mp3"):
         cm = f'ffmpeg -y -i "{original_file}" -codec:a libmp3lame -qscale:a 2 "{new_file_path}"'
@@ -110,6 +126,9 @@ def get_output_file(
             logger.error(str(error))
             remove_files(new_file_path)
             shutil.copy2(original_file, new_file_path)
+    elif link:
+        method = link_or_copy(original_file, new_file_path)
+        logger.debug(f"Output {new_file_path}: {method}")
     else:
         shutil.copy2(original_file, new_file_path)
 
@@ -124,7 +143,10 @@ def media_out(
     file_obj="video_dub.mp4",
     soft_subtitles=False,
     subtitle_files="disable",
+    workspace=None,
+    link=False,
 ):
+    workspace = workspace or Workspace()
     if media_out_name:
         base_name = media_out_name + "_origin"
     else:
@@ -138,21 +160,32 @@ def media_out(
     f_name = f"{sanitize_file_name(media_out_name)}.{extension}"
 
     if subtitle_files != "disable":
-        final_media = [get_output_file(file_obj, f_name, soft_subtitles)]
+        final_media = [
+            get_output_file(
+                file_obj, f_name, soft_subtitles, workspace=workspace,
+                link=link,
+            )
+        ]
         name_tra = f"{sanitize_file_name(media_out_name)}.{subtitle_files}"
         name_ori = f"{sanitize_file_name(base_name)}.{subtitle_files}"
-        tgt_subs = f"sub_tra.{subtitle_files}"
-        ori_subs = f"sub_ori.{subtitle_files}"
+        tgt_subs = workspace.path(f"sub_tra.{subtitle_files}")
+        ori_subs = workspace.path(f"sub_ori.{subtitle_files}")
         final_subtitles = [
             get_output_file(tgt_subs, name_tra, False),
             get_output_file(ori_subs, name_ori, False)
         ]
         return final_media + final_subtitles
     else:
-        return get_output_file(file_obj, f_name, soft_subtitles)
+        return get_output_file(
+            file_obj, f_name, soft_subtitles, workspace=workspace,
+            link=link,
+        )
 
 
-def get_subtitle_speaker(media_file, result, language, extension, base_name):
+def get_subtitle_speaker(
+    media_file, result, language, extension, base_name, workspace=None
+):
+    workspace = workspace or Workspace()
 
     segments_base = copy.deepcopy(result)
 
@@ -177,7 +210,7 @@ def get_subtitle_speaker(media_file, result, language, extension, base_name):
             language,
             {"segments": segments},
             extension,
-            filename=name_sk,
+            filename=workspace.path(name_sk),
         )
 
         media_out_name = f"{base_name}_{language}_{name_sk}"
@@ -195,8 +228,10 @@ def get_subtitle_speaker(media_file, result, language, extension, base_name):
     return files_subs
 
 
-def sound_separate(media_file, task_uvr):
-    from .mdx_net import process_uvr_task
+def sound_separate(media_file, task_uvr, workspace=None):
+    from .mdx_net import process_uvr_task, release_mdx_sessions
+
+    output_path = (workspace or Workspace()).path("clean_song_output")
 
     outputs = []
 
@@ -207,6 +242,7 @@ def sound_separate(media_file, task_uvr):
                 main_vocals=False,
                 dereverb=True if "dereverb" in task_uvr else False,
                 remove_files_output_dir=True,
+                output_path=output_path,
             )
             outputs.append(vocal_audio)
         except Exception as error:
@@ -219,12 +255,15 @@ def sound_separate(media_file, task_uvr):
                 song_id="voiceless",
                 only_voiceless=True,
                 remove_files_output_dir=False if "vocal" in task_uvr else True,
+                output_path=output_path,
             )
             # copy_files(background_audio, ".")
             outputs.append(background_audio)
         except Exception as error:
             logger.error(str(error))
 
+    release_mdx_sessions()
+
     if not outputs:
         raise Exception("Error in uvr process")
 
@@ -22,176 +22,230 @@ TESTED_CODECS = [
 ]
 
 
+# Audio track of every job: 16-bit stereo PCM at 44.1 kHz
+WAV_OUTPUT_ARGS = ["-vn", "-acodec", "pcm_s16le", "-ar", "44100", "-ac", "2"]
+PREVIEW_ARGS = ["-ss", "00:00:20", "-t", "00:00:10"]
+TRANSCODE_ARGS = [
+    "-c:v", "libx264", "-c:a", "aac", "-strict", "experimental"
+]
+REMUX_ARGS = [
+    "-map", "0:v:0", "-map", "0:a:0?", "-c:v", "copy", "-c:a", "aac"
+]
+FICLONE = 0x40049409  # Linux ioctl sharing the extents of a file
+
+SUB_PARAMS = {
+    "stdout": subprocess.PIPE,
+    "stderr": subprocess.PIPE,
+    "creationflags": subprocess.CREATE_NO_WINDOW
+    if sys.platform == "win32"
+    else 0,
+}
+
+
 class OperationFailedError(Exception):
     def __init__(self, message="The operation did not complete successfully."):
         self.message = message
         super().__init__(self.message)
 
 
-def get_video_codec(video_file):
-    command_base = rf'ffprobe -v error -select_streams v:0 -show_entries stream=codec_name -of json "{video_file}"'
-    command = shlex.split(command_base)
+def probe_media(media_file):
+    """Container and first video and audio codecs, from one ffprobe call."""
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "stream=codec_type,codec_name:format=format_name",
+        "-of",
+        "json",
+        media_file,
+    ]
     try:
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0,
-        )
-        output, _ = process.communicate()
-        codec_info = json.loads(output.decode('utf-8'))
-        codec_name = codec_info['streams'][0]['codec_name']
-        return codec_name
+        process = subprocess.run(command, **SUB_PARAMS)
+        info = json.loads(process.stdout.decode("utf-8") or "{}")
     except Exception as error:
         logger.debug(str(error))
+        return {}
+
+    def first_codec(codec_type):
+        for stream in info.get("streams", []):
+            if stream.get("codec_type") == codec_type:
+                return stream.get("codec_name")
         return None
 
+    return {
+        "format": info.get("format", {}).get("format_name", ""),
+        "video_codec": first_codec("video"),
+        "audio_codec": first_codec("audio"),
+    }
+
+
+def get_video_codec(video_file):
+    return probe_media(video_file).get("video_codec")
+
+
+def link_or_copy(source, destination):
+    """
+    Make `destination` a hardlink or reflink of `source`, copying the data
+    only when the filesystem supports neither. Returns the method used.
+    """
+    try:
+        os.link(source, destination)
+        return "hardlink"
+    except OSError:
+        pass
+
+    try:
+        import fcntl
+
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        pass
+
+    shutil.copyfile(source, destination)
+    return "copy"
+
+
+def run_media_command(command, error_message, *output_files):
+    """Run a command and check that it created every output file."""
+    if isinstance(command, str):
+        command = shlex.split(command)
+    logger.debug(" ".join(command))
+
+    process = subprocess.run(command, **SUB_PARAMS)
+    if process.returncode != 0 or not all(
+        os.path.exists(output) for output in output_files
+    ):
+        raise OperationFailedError(
+            f"{error_message}:\n{process.stderr.decode('utf-8', 'replace')}"
+        )
+
 
 def audio_preprocessor(preview, base_audio, audio_wav, use_cuda=False):
     base_audio = base_audio.strip()
     previous_files_to_remove = [audio_wav]
     remove_files(previous_files_to_remove)
 
+    command = ["ffmpeg", "-y", "-i", base_audio]
     if preview:
         logger.warning(
             "Creating a preview video of 10 seconds, to disable "
             "this option, go to advanced settings and turn off preview."
         )
-        wav_ = f'ffmpeg -y -i "{base_audio}" -ss 00:00:20 -t 00:00:10 -vn -acodec pcm_s16le -ar 44100 -ac 2 audio.wav'
+        command += PREVIEW_ARGS
+    command += WAV_OUTPUT_ARGS + [audio_wav]
+
+    run_media_command(
+        command, "Error can't create the audio file", audio_wav
+    )
+
+
+def demux_local_video(preview, video, OutputFile, audio_wav):
+    """
+    Video file and PCM audio of a local media in a single ffmpeg pass.
+
+    The input is probed once. An mp4 is linked instead of copied and only
+    its audio is decoded; a supported codec in another container is
+    remuxed, and anything else is transcoded to h264, always in the same
+    ffmpeg call that writes the WAV.
+    """
+    info = probe_media(video)
+    video_codec = info.get("video_codec")
+    if not video_codec:
+        logger.debug("No video codec found in video")
     else:
-        wav_ = f'ffmpeg -y -i "{base_audio}" -vn -acodec pcm_s16le -ar 44100 -ac 2 audio.wav'
-
-    # Run cmd process
-    sub_params = {
-        "stdout": subprocess.PIPE,
-        "stderr": subprocess.PIPE,
-        "creationflags": subprocess.CREATE_NO_WINDOW
-        if sys.platform == "win32"
-        else 0,
-    }
-    wav_ = shlex.split(wav_)
-    result_convert_audio = subprocess.Popen(wav_, **sub_params)
-    output, errors = result_convert_audio.communicate()
-    time.sleep(1)
-    if result_convert_audio.returncode in [1, 2] or not os.path.exists(
-        audio_wav
-    ):
-        raise OperationFailedError(f"Error can't create the audio file:\n{errors.decode('utf-8')}")
+        logger.info(f"Video codec: {video_codec}")
+
+    trim_args = []
+    remux = False
+    if preview:
+        logger.warning(
+            "Creating a preview video of 10 seconds, "
+            "to disable this option, go to advanced "
+            "settings and turn off preview."
+        )
+        trim_args = PREVIEW_ARGS
+        video_args = TRANSCODE_ARGS
+    elif video.endswith(".mp4"):
+        video_args = None
+    elif video_codec in TESTED_CODECS:
+        video_args = REMUX_ARGS
+        remux = True
+    else:
+        logger.warning(
+            "File does not have the '.mp4' extension  or a "
+            "supported codec. Converting video to mp4 (codec: h264)."
+        )
+        video_args = TRANSCODE_ARGS
+
+    if video_args is None:
+        method = link_or_copy(video, OutputFile)
+        logger.debug(f"Video {method}: {OutputFile}")
+
+    command = ["ffmpeg", "-y", "-i", video]
+    if video_args is not None:
+        command += trim_args + video_args + [OutputFile]
+    command += trim_args + WAV_OUTPUT_ARGS + [audio_wav]
+
+    logger.info("Process video and audio...")
+    try:
+        run_media_command(
+            command, "Error processing video", OutputFile, audio_wav
+        )
+    except OperationFailedError as error:
+        if not remux:
+            raise
+        # Streams the mp4 muxer can't take, use the file as it is
+        logger.warning(f"Remux failed, using the original file: {error}")
+        remove_files([OutputFile, audio_wav])
+        link_or_copy(video, OutputFile)
+        run_media_command(
+            ["ffmpeg", "-y", "-i", video] + WAV_OUTPUT_ARGS + [audio_wav],
+            "Error can't create the audio file",
+            audio_wav,
+        )
 
 
 def audio_video_preprocessor(
     preview, video, OutputFile, audio_wav, use_cuda=False
 ):
     video = video.strip()
-    previous_files_to_remove = [OutputFile, "audio.webm", audio_wav]
+    audio_webm = os.path.join(os.path.dirname(audio_wav), "audio.webm")
+    previous_files_to_remove = [OutputFile, audio_webm, audio_wav]
     remove_files(previous_files_to_remove)
 
+    time_start = time.perf_counter()
     if os.path.exists(video):
-        if preview:
-            logger.warning(
-                "Creating a preview video of 10 seconds, "
-                "to disable this option, go to advanced "
-                "settings and turn off preview."
-            )
-            mp4_ = f'ffmpeg -y -i "{video}" -ss 00:00:20 -t 00:00:10 -c:v libx264 -c:a aac -strict experimental Video.mp4'
-        else:
-            video_codec = get_video_codec(video)
-            if not video_codec:
-                logger.debug("No video codec found in video")
-            else:
-                logger.info(f"Video codec: {video_codec}")
-
-            # Check if the file ends with ".mp4" extension or is valid codec
-            if video.endswith(".mp4") or video_codec in TESTED_CODECS:
-                destination_path = os.path.join(os.getcwd(), "Video.mp4")
-                shutil.copy(video, destination_path)
-                time.sleep(0.5)
-                if os.path.exists(OutputFile):
-                    mp4_ = "ffmpeg -h"
-                else:
-                    mp4_ = f'ffmpeg -y -i "{video}" -c copy Video.mp4'
-            else:
-                logger.warning(
-                    "File does not have the '.mp4' extension  or a "
-                    "supported codec. Converting video to mp4 (codec: h264)."
-                )
-                mp4_ = f'ffmpeg -y -i "{video}" -c:v libx264 -c:a aac -strict experimental Video.mp4'
+        demux_local_video(preview, video, OutputFile, audio_wav)
+    elif preview:
+        logger.warning(
+            "Creating a preview from the link, 10 seconds "
+            "to disable this option, go to advanced "
+            "settings and turn off preview."
+        )
+        # https://github.com/yt-dlp/yt-dlp/issues/2220
+        mp4_ = f'yt-dlp -f "mp4" --downloader ffmpeg --downloader-args "ffmpeg_i: -ss 00:00:20 -t 00:00:10" --force-overwrites --max-downloads 1 --no-warnings --no-playlist --no-abort-on-error --ignore-no-formats-error --restrict-filenames -o "{OutputFile}" {video}'
+        run_media_command(
+            mp4_, "Error can't download the preview", OutputFile
+        )
+        run_media_command(
+            ["ffmpeg", "-y", "-i", OutputFile] + WAV_OUTPUT_ARGS + [audio_wav],
+            "Error can't create the preview file",
+            audio_wav,
+        )
     else:
-        if preview:
-            logger.warning(
-                "Creating a preview from the link, 10 seconds "
-                "to disable this option, go to advanced "
-                "settings and turn off preview."
-            )
-            # https://github.com/yt-dlp/yt-dlp/issues/2220
-            mp4_ = f'yt-dlp -f "mp4" --downloader ffmpeg --downloader-args "ffmpeg_i: -ss 00:00:20 -t 00:00:10" --force-overwrites --max-downloads 1 --no-warnings --no-playlist --no-abort-on-error --ignore-no-formats-error --restrict-filenames -o {OutputFile} {video}'
-            wav_ = "ffmpeg -y -i Video.mp4 -vn -acodec pcm_s16le -ar 44100 -ac 2 audio.wav"
-        else:
-            mp4_ = f'yt-dlp -f "mp4" --force-overwrites --max-downloads 1 --no-warnings --no-playlist --no-abort-on-error --ignore-no-formats-error --restrict-filenames -o {OutputFile} {video}'
-            wav_ = f"python -m yt_dlp --output {audio_wav} --force-overwrites --max-downloads 1 --no-warnings --no-playlist --no-abort-on-error --ignore-no-formats-error --extract-audio --audio-format wav {video}"
-
-    # Run cmd process
-    mp4_ = shlex.split(mp4_)
-    sub_params = {
-        "stdout": subprocess.PIPE,
-        "stderr": subprocess.PIPE,
-        "creationflags": subprocess.CREATE_NO_WINDOW
-        if sys.platform == "win32"
-        else 0,
-    }
-
-    if os.path.exists(video):
-        logger.info("Process video...")
-        result_convert_video = subprocess.Popen(mp4_, **sub_params)
-        # result_convert_video.wait()
-        output, errors = result_convert_video.communicate()
-        time.sleep(1)
-        if result_convert_video.returncode in [1, 2] or not os.path.exists(
-            OutputFile
-        ):
-            raise OperationFailedError(f"Error processing video:\n{errors.decode('utf-8')}")
+        mp4_ = f'yt-dlp -f "mp4" --force-overwrites --max-downloads 1 --no-warnings --no-playlist --no-abort-on-error --ignore-no-formats-error --restrict-filenames -o "{OutputFile}" {video}'
+        wav_ = f"python -m yt_dlp --output \"{audio_wav}\" --force-overwrites --max-downloads 1 --no-warnings --no-playlist --no-abort-on-error --ignore-no-formats-error --extract-audio --audio-format wav {video}"
         logger.info("Process audio...")
-        wav_ = "ffmpeg -y -i Video.mp4 -vn -acodec pcm_s16le -ar 44100 -ac 2 audio.wav"
-        wav_ = shlex.split(wav_)
-        result_convert_audio = subprocess.Popen(wav_, **sub_params)
-        output, errors = result_convert_audio.communicate()
-        time.sleep(1)
-        if result_convert_audio.returncode in [1, 2] or not os.path.exists(
-            audio_wav
-        ):
-            raise OperationFailedError(f"Error can't create the audio file:\n{errors.decode('utf-8')}")
+        run_media_command(wav_, "Error can't download the audio", audio_wav)
+        logger.info("Process video...")
+        run_media_command(mp4_, "Error can't download the video", OutputFile)
 
-    else:
-        wav_ = shlex.split(wav_)
-        if preview:
-            result_convert_video = subprocess.Popen(mp4_, **sub_params)
-            output, errors = result_convert_video.communicate()
-            time.sleep(0.5)
-            result_convert_audio = subprocess.Popen(wav_, **sub_params)
-            output, errors = result_convert_audio.communicate()
-            time.sleep(0.5)
-            if result_convert_audio.returncode in [1, 2] or not os.path.exists(
-                audio_wav
-            ):
-                raise OperationFailedError(
-                    f"Error can't create the preview file:\n{errors.decode('utf-8')}"
-                )
-        else:
-            logger.info("Process audio...")
-            result_convert_audio = subprocess.Popen(wav_, **sub_params)
-            output, errors = result_convert_audio.communicate()
-            time.sleep(1)
-            if result_convert_audio.returncode in [1, 2] or not os.path.exists(
-                audio_wav
-            ):
-                raise OperationFailedError(f"Error can't download the audio:\n{errors.decode('utf-8')}")
-            logger.info("Process video...")
-            result_convert_video = subprocess.Popen(mp4_, **sub_params)
-            output, errors = result_convert_video.communicate()
-            time.sleep(1)
-            if result_convert_video.returncode in [1, 2] or not os.path.exists(
-                OutputFile
-            ):
-                raise OperationFailedError(f"Error can't download the video:\n{errors.decode('utf-8')}")
+    logger.debug(
+        f"Media preprocessed in {time.perf_counter() - time_start:.2f}s"
+    )
 
 
 def old_audio_video_preprocessor(preview, video, OutputFile, audio_wav):
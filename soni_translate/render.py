@@ -0,0 +1,220 @@
+import os
+import re
+import sys
+import time
+import subprocess
+from .logging_setup import logger
+
+# Encoder used when the video is re-encoded to burn the subtitles
+RENDER_VIDEO_PRESET = os.environ.get("RENDER_VIDEO_PRESET", "libx264")
+VIDEO_ENCODER_PRESETS = {
+    "libx264": ["-c:v", "libx264"],
+    "libx264_fast": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20"],
+    "libx264_hq": ["-c:v", "libx264", "-preset", "slow", "-crf", "17"],
+    "nvenc": ["-c:v", "h264_nvenc", "-preset", "p5", "-cq", "21"],
+    "qsv": ["-c:v", "h264_qsv", "-global_quality", "21"],
+    "amf": ["-c:v", "h264_amf", "-quality", "balanced"],
+    "videotoolbox": ["-c:v", "h264_videotoolbox", "-q:v", "60"],
+}
+AUDIO_ENCODERS = {
+    "mp4": ["-c:a", "aac", "-b:a", "192k"],
+    "mkv": ["-c:a", "aac", "-b:a", "192k"],
+    "mp3": ["-c:a", "libmp3lame", "-qscale:a", "2"],
+    "ogg": ["-c:a", "libvorbis", "-qscale:a", "5"],
+    "wav": ["-c:a", "pcm_s16le", "-ar", "44100", "-ac", "2"],
+}
+SUBTITLE_ENCODERS = {
+    "mp4": ["-c:s", "mov_text"],
+    "mkv": ["-c:s", "srt"],
+}
+VOLUME_MIX = "Adjusting volumes and mixing audio"
+# Seconds of audio mixed to tell a failed mix from a failed video render
+MIX_PROBE_SECONDS = 10
+
+
+def mix_graph(mix_method, volume_original, volume_translated, original, dub):
+    """Filter graph mixing the original and dubbed audio inputs into
+    [aout]."""
+    if mix_method == VOLUME_MIX:
+        return (
+            f"[{original}:a]volume={volume_original}[a];"
+            f"[{dub}:a]volume={volume_translated}[b];"
+            "[a][b]amix=inputs=2:duration=longest[aout]"
+        )
+    # Both inputs as stereo, so that the merged channels (background
+    # then dub) can be summed back into a stereo track
+    return (
+        f"[{dub}:a]aformat=channel_layouts=stereo,asplit=2[sc][mix];"
+        f"[{original}:a]aformat=channel_layouts=stereo[ori];"
+        "[ori][sc]sidechaincompress=threshold=0.003:ratio=20[bg];"
+        "[bg][mix]amerge=inputs=2,pan=stereo|c0<c0+c2|c1<c1+c3[aout]"
+    )
+
+
+def escape_filter_path(path):
+    """Path quoted for a filter option such as subtitles=."""
+    path = path.replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+    return f"'{path}'"
+
+
+def render_command(
+    output_file,
+    base_audio,
+    dub_audio,
+    base_video=None,
+    mix_method=VOLUME_MIX,
+    volume_original=0.25,
+    volume_translated=1.80,
+    burn_subtitles=None,
+    soft_subtitles=(),
+    video_preset=RENDER_VIDEO_PRESET,
+):
+    """
+    One ffmpeg call with the whole final render: mix, optional subtitle
+    burn and mux into the container of `output_file`.
+
+    Parameters:
+    - base_video (str or None): Video input; None renders audio only.
+    - burn_subtitles (str or None): Subtitle file drawn on the video.
+    - soft_subtitles (list): Subtitle files added as tracks.
+    - video_preset (str): Key of VIDEO_ENCODER_PRESETS used when burning.
+    """
+    extension = os.path.splitext(output_file)[1][1:].lower()
+    command = ["ffmpeg", "-y", "-hide_banner", "-nostats", "-benchmark"]
+
+    inputs = [base_video] if base_video else []
+    inputs += [base_audio, dub_audio]
+    if base_video:
+        inputs += list(soft_subtitles)
+    for media in inputs:
+        command += ["-i", media]
+
+    original = 1 if base_video else 0
+    graph = mix_graph(
+        mix_method, volume_original, volume_translated, original, original + 1
+    )
+    if base_video and burn_subtitles:
+        graph += f";[0:v]subtitles={escape_filter_path(burn_subtitles)}[vout]"
+    command += ["-filter_complex", graph]
+
+    if base_video:
+        if burn_subtitles:
+            command += ["-map", "[vout]"]
+            command += VIDEO_ENCODER_PRESETS.get(
+                video_preset, VIDEO_ENCODER_PRESETS["libx264"]
+            )
+        else:
+            command += ["-map", "0:v", "-c:v", "copy"]
+    command += ["-map", "[aout]"]
+    command += AUDIO_ENCODERS.get(extension, [])
+
+    if base_video and soft_subtitles:
+        for i in range(len(soft_subtitles)):
+            command += ["-map", str(original + 2 + i)]
+        command += SUBTITLE_ENCODERS.get(extension, ["-c:s", "srt"])
+        if extension != "mp4":
+            command += ["-movflags", "use_metadata_tags", "-map_metadata", "0"]
+
+    if base_video:
+        command += ["-shortest"]
+    command += [output_file]
+    return command
+
+
+def run_render(command):
+    """Run a render command. Returns the wall time and ffmpeg's own
+    benchmark line."""
+    logger.debug(" ".join(command))
+    time_start = time.perf_counter()
+    process = subprocess.run(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        creationflags=subprocess.CREATE_NO_WINDOW
+        if sys.platform == "win32"
+        else 0,
+    )
+    elapsed = time.perf_counter() - time_start
+
+    stderr = process.stderr.decode("utf-8", "replace")
+    if process.returncode != 0:
+        raise Exception(stderr)
+    bench = re.findall(r"bench: (utime=.*)", stderr)
+    return elapsed, bench[-1].strip() if bench else ""
+
+
+def mix_works(
+    base_audio,
+    dub_audio,
+    mix_method=VOLUME_MIX,
+    volume_original=0.25,
+    volume_translated=1.80,
+    **kwargs,
+):
+    """Whether the mix of render_command runs on its own, over the first
+    MIX_PROBE_SECONDS of the audio."""
+    command = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", base_audio, "-i", dub_audio,
+        "-filter_complex",
+        mix_graph(mix_method, volume_original, volume_translated, 0, 1),
+        "-map", "[aout]", "-t", str(MIX_PROBE_SECONDS), "-f", "null", "-",
+    ]
+    try:
+        run_render(command)
+    except Exception as error:
+        logger.debug(f"Mix probe failed: {str(error)}")
+        return False
+    return True
+
+
+def render_final_media(output_file, base_audio, dub_audio, **kwargs):
+    """
+    Render the final media with render_command. When it fails, the mix is
+    run on its own to find the failing part. A failed mix falls back to
+    the volume mix; otherwise the video is burned again with the libx264
+    preset and then goes without the burned subtitles.
+
+    Returns:
+    - timings (dict): Wall time in seconds of each stage.
+    """
+    timings = {}
+    time_start = time.perf_counter()
+    command = render_command(output_file, base_audio, dub_audio, **kwargs)
+    timings["build"] = time.perf_counter() - time_start
+
+    while True:
+        try:
+            timings["render"], bench = run_render(command)
+            break
+        except Exception as error:
+            logger.error(str(error))
+            if not mix_works(base_audio, dub_audio, **kwargs):
+                if kwargs.get("mix_method", VOLUME_MIX) == VOLUME_MIX:
+                    raise
+                logger.warning("Mix failed, using the volume mix")
+                kwargs["mix_method"] = VOLUME_MIX
+            elif not (kwargs.get("base_video") and kwargs.get(
+                "burn_subtitles"
+            )):
+                raise
+            elif kwargs.get("video_preset", RENDER_VIDEO_PRESET) != "libx264":
+                logger.warning("Burn failed, using the libx264 preset")
+                kwargs["video_preset"] = "libx264"
+            else:
+                logger.warning("Burn failed, rendering without it")
+                kwargs["burn_subtitles"] = None
+            command = render_command(
+                output_file, base_audio, dub_audio, **kwargs
+            )
+
+    stages = ["mix"]
+    if kwargs.get("base_video"):
+        if kwargs.get("burn_subtitles"):
+            stages.append("burn")
+        stages.append("mux")
+    logger.info(
+        f"Final render ({' + '.join(stages)}) in {timings['render']:.2f}s"
+        + (f", {bench}" if bench else "")
+    )
+    return timings
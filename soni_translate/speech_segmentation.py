@@ -1,18 +1,15 @@
-from whisperx.alignment import (
-    DEFAULT_ALIGN_MODELS_TORCH as DAMT,
-    DEFAULT_ALIGN_MODELS_HF as DAMHF,
-)
-from whisperx.utils import TO_LANGUAGE_CODE
-import whisperx
-import torch
 import gc
 import os
 import soundfile as sf
-from IPython.utils import capture # noqa
 from .language_configuration import EXTRA_ALIGN, INVERTED_LANGUAGES
-from .logging_setup import logger
+from .logging_setup import logger, quiet_pyannote
 from .postprocessor import sanitize_file_name
 from .utils import remove_directory_contents, run_command
+from .model_pool import get_model_pool
+from .startup import lazy_import
+
+whisperx = lazy_import("whisperx")
+torch = lazy_import("torch")
 
 ASR_MODEL_OPTIONS = [
     "tiny",
@@ -67,7 +64,10 @@ def openai_api_whisper(
     info = sf.info(input_audio_file)
     duration = info.duration
 
-    output_directory = "./whisper_api_audio_parts"
+    # Next to the input, inside the workspace of the job
+    output_directory = os.path.join(
+        os.path.dirname(input_audio_file) or ".", "whisper_api_audio_parts"
+    )
     os.makedirs(output_directory, exist_ok=True)
     remove_directory_contents(output_directory)
 
@@ -107,6 +107,8 @@ def openai_api_whisper(
             transcript_dict = transcription.to_dict()
 
         if language is None:
+            from whisperx.utils import TO_LANGUAGE_CODE
+
             logger.info(f'Language detected: {transcript_dict["language"]}')
             language = TO_LANGUAGE_CODE[transcript_dict["language"]]
 
@@ -157,11 +159,14 @@ def transcribe_speech(
     Transcribe speech using a whisper model.
 
     Parameters:
-    - audio_wav (str): Path to the audio file in WAV format.
+    - audio_wav (str or array): Path to the audio file in WAV format, or
+        16 kHz mono float32 samples (streaming windows).
     - asr_model (str): The whisper model to be loaded.
     - compute_type (str): Type of compute to be used (e.g., 'int8', 'float16').
     - batch_size (int): Batch size for transcription.
-    - SOURCE_LANGUAGE (str): Source language for transcription.
+    - SOURCE_LANGUAGE (str): Source language for transcription, None to
+        detect it. "zh-TW" is transcribed as whisper "zh" without the
+        Simplified Chinese prompt.
 
     Returns:
     - Tuple containing:
@@ -170,6 +175,8 @@ def transcribe_speech(
     """
 
     if asr_model == "OpenAI_API_Whisper":
+        if not isinstance(audio_wav, str):
+            raise ValueError("OpenAI's API Whisper needs an audio file.")
         if literalize_numbers:
             logger.info(
                 "OpenAI's API Whisper does not support "
@@ -228,27 +235,52 @@ def transcribe_speech(
         asr_model = model_dir
         logger.info(f"ASR Model: {str(model_dir)}")
 
-    model = whisperx.load_model(
+    # The language is not part of the key: it is passed on every call, so
+    # one pooled model serves every language and automatic detection
+    device = os.environ.get("SONITR_DEVICE")
+    pool_key = (
+        "asr",
         asr_model,
-        os.environ.get("SONITR_DEVICE"),
-        compute_type=compute_type,
-        language=SOURCE_LANGUAGE,
-        asr_options=asr_options,
+        device,
+        compute_type,
+        tuple(sorted(asr_options.items())),
+    )
+    # The VAD model of whisperx is a pyannote model
+    quiet_pyannote()
+    model = get_model_pool().get(
+        pool_key,
+        lambda: whisperx.load_model(
+            asr_model,
+            device,
+            compute_type=compute_type,
+            language=None,
+            asr_options=asr_options,
+        ),
     )
 
-    audio = whisperx.load_audio(audio_wav)
-    result = model.transcribe(
-        audio,
-        batch_size=batch_size,
-        chunk_size=segment_duration_limit,
-        print_progress=True,
+    audio = (
+        whisperx.load_audio(audio_wav)
+        if isinstance(audio_wav, str)
+        else audio_wav
     )
+    with get_model_pool().model_lock(pool_key):
+        # The pipeline keeps the tokenizer of its previous call, and with
+        # it the language detected for another file
+        model.tokenizer = None
+        result = model.transcribe(
+            audio,
+            batch_size=batch_size,
+            chunk_size=segment_duration_limit,
+            print_progress=True,
+            language=SOURCE_LANGUAGE,
+        )
 
     if result["language"] == "zh" and not prompt:
         result["language"] = "zh-TW"
         logger.info("Chinese - Traditional (zh-TW)")
 
     del model
+    get_model_pool().release()
     gc.collect()
     torch.cuda.empty_cache()  # noqa
     return audio, result
@@ -272,8 +304,13 @@ def align_speech(audio, result):
     - This function uses language-specific models to align speech segments.
     - It performs language compatibility checks and selects the
         appropriate alignment model.
-    - Cleans up memory by releasing resources after alignment.
+    - The model stays loaded in the model pool within its memory budget.
     """
+    from whisperx.alignment import (
+        DEFAULT_ALIGN_MODELS_TORCH as DAMT,
+        DEFAULT_ALIGN_MODELS_HF as DAMHF,
+    )
+
     DAMHF.update(DAMT)  # lang align
     if (
         not result["language"] in DAMHF.keys()
@@ -301,12 +338,19 @@ def align_speech(audio, result):
         )
         return result
 
-    model_a, metadata = whisperx.load_align_model(
-        language_code=result["language"],
-        device=os.environ.get("SONITR_DEVICE"),
-        model_name=None
+    device = os.environ.get("SONITR_DEVICE")
+    model_name = (
+        None
         if result["language"] in DAMHF.keys()
-        else EXTRA_ALIGN[result["language"]],
+        else EXTRA_ALIGN[result["language"]]
+    )
+    model_a, metadata = get_model_pool().get(
+        ("align", result["language"], model_name, device),
+        lambda: whisperx.load_align_model(
+            language_code=result["language"],
+            device=device,
+            model_name=model_name,
+        ),
     )
     result = whisperx.align(
         result["segments"],
@@ -318,6 +362,7 @@ def align_speech(audio, result):
         print_progress=False,
     )
     del model_a
+    get_model_pool().release()
     gc.collect()
     torch.cuda.empty_cache()  # noqa
     return result
@@ -381,7 +426,7 @@ def diarize_speech(
     - This function utilizes a speaker diarization model to label speaker
         segments in the audio.
     - It assigns speakers to word-level segments based on diarization results.
-    - Cleans up memory by releasing resources after diarization.
+    - The model stays loaded in the model pool within its memory budget.
     - If only one speaker is specified, each segment is automatically assigned
         as the first speaker, eliminating the need for diarization inference.
     """
@@ -389,10 +434,15 @@ def diarize_speech(
     if max(min_speakers, max_speakers) > 1 and model_name:
         try:
 
-            diarize_model = whisperx.DiarizationPipeline(
-                model_name=model_name,
-                use_auth_token=YOUR_HF_TOKEN,
-                device=os.environ.get("SONITR_DEVICE"),
+            device = os.environ.get("SONITR_DEVICE")
+            quiet_pyannote()
+            diarize_model = get_model_pool().get(
+                ("diarize", model_name, device),
+                lambda: whisperx.DiarizationPipeline(
+                    model_name=model_name,
+                    use_auth_token=YOUR_HF_TOKEN,
+                    device=device,
+                ),
             )
 
         except Exception as error:
@@ -436,6 +486,7 @@ def diarize_speech(
                 )
 
         del diarize_model
+        get_model_pool().release()
         gc.collect()
         torch.cuda.empty_cache()  # noqa
     else:
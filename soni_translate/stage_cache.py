@@ -0,0 +1,157 @@
+import os
+import json
+import zlib
+import struct
+import hashlib
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+from .logging_setup import logger
+
+STAGE_CACHE_DIR = os.environ.get(
+    "STAGE_CACHE_DIR", os.path.join(os.getcwd(), ".stage-cache")
+)
+STAGE_CACHE_MAX_SIZE_MB = int(os.environ.get("STAGE_CACHE_MAX_SIZE_MB", 1024))
+STAGE_CACHE_EXTENSION = ".stz"
+# Length of the compressed JSON header at the start of an entry
+HEADER_SIZE = struct.Struct(">Q")
+
+
+def _json_default(value):
+    """NumPy scalars and arrays found in the stage results."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class StageCache:
+    """Disk store of pipeline stage results.
+
+    Each entry is a zlib-compressed JSON header with the stage variables
+    and the names and sizes of the files the stage produced, followed by
+    the raw content of those files. Nothing in an entry is executed when
+    it is loaded, so the directory can be shared by several processes or
+    machines; writes are atomic and the least recently used entries are
+    evicted past the size limit.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_size_mb: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir or STAGE_CACHE_DIR
+        if max_size_mb is None:
+            max_size_mb = STAGE_CACHE_MAX_SIZE_MB
+        self.max_size = max_size_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(step: str, params_chain: list) -> str:
+        """Key of a stage from its params and those of every earlier stage,
+        the media hash included."""
+        payload = json.dumps(
+            [step, params_chain], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + STAGE_CACHE_EXTENSION)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                (size,) = HEADER_SIZE.unpack(f.read(HEADER_SIZE.size))
+                header = json.loads(zlib.decompress(f.read(size)))
+                files = {}
+                for name, size in header["files"]:
+                    files[name] = f.read(size)
+                    if len(files[name]) != size:
+                        raise ValueError(f"Truncated file {name}")
+            entry = {"data": header["data"], "files": files}
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            logger.warning(f"Invalid stage cache entry {path}: {error}")
+            self._remove(path)
+            return None
+        return entry
+
+    def save(
+        self,
+        key: str,
+        data: Dict[str, Any],
+        files: Optional[Dict[str, bytes]] = None,
+    ):
+        files = files or {}
+        header = json.dumps(
+            {
+                "data": data,
+                "files": [[name, len(blob)] for name, blob in files.items()],
+            },
+            default=_json_default,
+        )
+        header = zlib.compress(header.encode("utf-8"), 6)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER_SIZE.pack(len(header)))
+                f.write(header)
+                for blob in files.values():
+                    f.write(blob)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+
+        logger.debug(f"Stage cache saved {key[:12]} ({size} bytes)")
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(STAGE_CACHE_EXTENSION):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+                total += stat.st_size
+
+            for _, path, size in sorted(entries)[:-1]:
+                if total <= self.max_size:
+                    break
+                self._remove(path)
+                total -= size
+                logger.debug(f"Stage cache evicted {os.path.basename(path)}")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Global cache instance
+_stage_cache = None
+
+
+def get_stage_cache() -> StageCache:
+    """Get the global stage cache instance."""
+    global _stage_cache
+    if _stage_cache is None:
+        _stage_cache = StageCache()
+    return _stage_cache
@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import types
+import importlib
+import importlib.abc
+from .logging_setup import logger
+
+# Log the import cost of every module when the process starts up
+IMPORT_COST_REPORT = os.environ.get("IMPORT_COST_REPORT", "0") == "1"
+# No GUI: gradio is never imported. Set by the headless engine entry point
+HEADLESS = os.environ.get("SONITR_HEADLESS", "0") == "1"
+
+
+class LazyModule(types.ModuleType):
+    """Module imported on the first access to one of its attributes, so
+    heavy backends (torch, whisperx, gradio...) are only loaded by the
+    stages that use them."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            time_start = time.perf_counter()
+            self._module = importlib.import_module(self.__name__)
+            logger.debug(
+                f"Lazy import {self.__name__}: "
+                f"{time.perf_counter() - time_start:.2f}s"
+            )
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name):
+    """The module `name` if already imported, otherwise a LazyModule."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+class ImportCostReport(importlib.abc.MetaPathFinder):
+    """Import time of each module, measured around its execution.
+
+    Installed first in sys.meta_path, it finds the spec with the other
+    finders and times the module code. The cumulative time includes the
+    modules it imports; the own time doesn't.
+    """
+
+    def __init__(self):
+        self.cumulative = {}
+        self.own = {}
+        self._stack = []
+        self._finding = set()
+        self._started = None
+
+    def start(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+            self._started = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname in self._finding:
+            return None
+        self._finding.add(fullname)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.discard(fullname)
+
+        loader = spec.loader
+        if (
+            loader is None
+            or isinstance(loader, type)
+            or not hasattr(loader, "exec_module")
+        ):
+            return spec
+
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            self._stack.append(0.0)
+            time_start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - time_start
+                children = self._stack.pop()
+                if self._stack:
+                    self._stack[-1] += elapsed
+                self.cumulative[fullname] = elapsed
+                self.own[fullname] = elapsed - children
+
+        loader.exec_module = timed_exec_module
+        return spec
+
+    def log(self, top=20):
+        """Log the modules with the highest cumulative import time."""
+        if self._started is not None:
+            logger.info(
+                "Startup: "
+                f"{time.perf_counter() - self._started:.2f}s since the "
+                f"import report started, {len(self.cumulative)} modules"
+            )
+        slowest = sorted(
+            self.cumulative.items(), key=lambda item: item[1], reverse=True
+        )
+        for name, seconds in slowest[:top]:
+            logger.info(
+                f"  import {name}: {seconds:.3f}s "
+                f"(own {self.own.get(name, 0.0):.3f}s)"
+            )
+        return slowest
+
+
+# Global report instance
+_import_report = None
+
+
+def start_import_report():
+    """Start timing the imports, once per process."""
+    global _import_report
+    if _import_report is None:
+        _import_report = ImportCostReport().start()
+    return _import_report
+
+
+def log_import_report(top=20):
+    if _import_report is not None:
+        _import_report.stop()
+        return _import_report.log(top)
+    return []
+
+
+def create_engine(cpu_mode=False):
+    """
+    SoniTranslate for scripts, the CLI and batch workers, without the GUI.
+
+    Only the modules of the pipeline itself are imported; torch, whisperx,
+    the TTS engines and the voice conversion models are loaded by the
+    stages that need them, and the voice lists come from the catalog cache.
+    """
+    global HEADLESS
+    HEADLESS = True
+    # Inherited by the batch worker processes
+    os.environ["SONITR_HEADLESS"] = "1"
+
+    time_start = time.perf_counter()
+    from app_rvc import SoniTranslate
+
+    engine = SoniTranslate(cpu_mode=cpu_mode)
+    logger.info(
+        f"Engine ready in {time.perf_counter() - time_start:.2f}s"
+    )
+    return engine
+
+
+# Global engine instance
+_engine = None
+
+
+def get_engine(cpu_mode=False):
+    """Get the global headless engine instance."""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(cpu_mode=cpu_mode)
+    return _engine
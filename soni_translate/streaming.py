@@ -0,0 +1,601 @@
+import os
+import sys
+import time
+import queue
+import threading
+import subprocess
+import numpy as np
+import soundfile as sf
+from collections import deque
+from .speech_segmentation import transcribe_speech
+from .translate_segments_cached import translate_text
+from .text_to_speech import audio_segmentation_to_voice, accelerate_segments
+from .workspace import Workspace
+from .model_pool import models_warm
+from .logging_setup import logger
+
+# Sample rate of the audio read from the source (ASR input)
+STREAM_SAMPLE_RATE = 16000
+# Audio transcribed at once; a window is processed when it is this long
+STREAM_WINDOW_SECONDS = float(os.environ.get("STREAM_WINDOW_SECONDS", 6.0))
+# New audio needed before a window that committed nothing is retried
+STREAM_HOP_SECONDS = float(os.environ.get("STREAM_HOP_SECONDS", 2.0))
+# Segments ending this close to the window end may have cut words; they
+# are transcribed again with the next window
+STREAM_COMMIT_GUARD = float(os.environ.get("STREAM_COMMIT_GUARD", 1.0))
+# Uncommitted audio above this is committed anyway, bounding the latency
+STREAM_MAX_BUFFER_SECONDS = float(
+    os.environ.get("STREAM_MAX_BUFFER_SECONDS", 20.0)
+)
+STREAM_CHUNK_SECONDS = 0.25
+STREAM_OUTPUT_SAMPLE_RATE = int(
+    os.environ.get("STREAM_OUTPUT_SAMPLE_RATE", 24000)
+)
+STREAM_HLS_SEGMENT_SECONDS = int(
+    os.environ.get("STREAM_HLS_SEGMENT_SECONDS", 2)
+)
+
+
+def pcm_source_command(source, realtime=False, follow=False):
+    """
+    ffmpeg call decoding `source` to mono float32 PCM on stdout.
+
+    Parameters:
+    - source (str): Media file, URL, or "-" for stdin.
+    - realtime (bool): Read at the native rate (-re), to feed a local file
+      as a live input.
+    - follow (bool): Keep reading a file that is still being written.
+    """
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+    if realtime:
+        command += ["-re"]
+    if source == "-":
+        command.remove("-nostdin")
+        source = "pipe:0"
+    elif follow:
+        command += ["-follow", "1"]
+    command += ["-i", source, "-vn", "-ac", "1"]
+    command += ["-ar", str(STREAM_SAMPLE_RATE), "-f", "f32le", "pipe:1"]
+    return command
+
+
+class PCMSource:
+    """
+    Source decoded by ffmpeg in a thread. The (samples, arrival time)
+    chunks are put in `chunks` as they come, then None at the end of the
+    source, or the error instead.
+    """
+
+    def __init__(self, source, realtime=False, follow=False):
+        self.source = source
+        self.command = pcm_source_command(source, realtime, follow)
+        self.chunks = queue.Queue()
+        self.process = None
+        self._thread = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            creationflags=subprocess.CREATE_NO_WINDOW
+            if sys.platform == "win32"
+            else 0,
+        )
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+        return self
+
+    def _read(self):
+        chunk_bytes = int(STREAM_CHUNK_SECONDS * STREAM_SAMPLE_RATE) * 4
+        try:
+            pending = b""
+            while True:
+                data = self.process.stdout.read1(chunk_bytes)
+                if not data:
+                    break
+                data = pending + data
+                usable = len(data) - len(data) % 4
+                pending = data[usable:]
+                if usable:
+                    self.chunks.put((
+                        np.frombuffer(data[:usable], dtype=np.float32),
+                        time.perf_counter(),
+                    ))
+
+            self.process.wait()
+            if self.process.returncode:
+                error = self.process.stderr.read().decode("utf-8", "replace")
+                raise Exception(f"Stream source {self.source}: {error}")
+            self.chunks.put(None)
+        except Exception as error:
+            self.chunks.put(error)
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+
+class OutputTimeline:
+    """Dubbed audio not yet emitted. Clips are added at their media time
+    and the audio is taken out from the front once committed; clips
+    ending past that point stay for the next emission."""
+
+    def __init__(self, sample_rate=STREAM_OUTPUT_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.start = 0.0  # media time of buffer[0]
+        self.buffer = np.zeros(0, dtype=np.float32)
+
+    @property
+    def end(self):
+        return self.start + len(self.buffer) / self.sample_rate
+
+    def _ensure(self, frames):
+        if frames > len(self.buffer):
+            self.buffer = np.concatenate(
+                [self.buffer, np.zeros(frames - len(self.buffer), np.float32)]
+            )
+
+    def overlay(self, samples, position, headroom=0.9):
+        """Add a clip at `position` seconds, peak-normalized."""
+        samples = np.asarray(samples, dtype=np.float32)
+        peak = np.max(np.abs(samples)) if len(samples) else 0.0
+        if peak > 0:
+            samples = samples * (headroom / peak)
+
+        offset = int(round((position - self.start) * self.sample_rate))
+        if offset < 0:
+            # Already emitted
+            samples = samples[-offset:]
+            offset = 0
+        self._ensure(offset + len(samples))
+        self.buffer[offset:offset + len(samples)] += samples
+
+    def pop(self, until):
+        """The audio from the last emission up to `until` seconds."""
+        frames = max(0, int(round((until - self.start) * self.sample_rate)))
+        self._ensure(frames)
+        samples = np.clip(self.buffer[:frames], -1.0, 1.0)
+        self.buffer = self.buffer[frames:]
+        self.start += frames / self.sample_rate
+        return samples
+
+
+class WavSink:
+    """Dubbed audio written to a WAV file as it is emitted."""
+
+    def __init__(self, path, sample_rate):
+        self.path = path
+        self.file = sf.SoundFile(path, "w", sample_rate, 1, "PCM_16")
+
+    def write(self, samples, start):
+        self.file.write(samples)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class HLSSink:
+    """
+    Dubbed audio encoded to AAC in fragmented-MP4 HLS segments. ffmpeg
+    reads the raw PCM as it is emitted and keeps the playlist updated, so
+    a player can follow the stream while it is produced.
+    """
+
+    def __init__(
+        self,
+        directory,
+        sample_rate,
+        segment_seconds=STREAM_HLS_SEGMENT_SECONDS,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.playlist = os.path.join(directory, "playlist.m3u8")
+        command = [
+            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "f32le", "-ar", str(sample_rate), "-ac", "1",
+            "-i", "pipe:0",
+            "-c:a", "aac", "-b:a", "128k",
+            "-f", "hls",
+            "-hls_time", str(segment_seconds),
+            "-hls_segment_type", "fmp4",
+            "-hls_playlist_type", "event",
+            "-hls_flags", "independent_segments",
+            "-hls_segment_filename",
+            os.path.join(directory, "segment_%05d.m4s"),
+            self.playlist,
+        ]
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            creationflags=subprocess.CREATE_NO_WINDOW
+            if sys.platform == "win32"
+            else 0,
+        )
+
+    def write(self, samples, start):
+        self.process.stdin.write(
+            np.ascontiguousarray(samples, dtype=np.float32).tobytes()
+        )
+        self.process.stdin.flush()
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+        if self.process.returncode:
+            error = self.process.stderr.read().decode("utf-8", "replace")
+            logger.error(f"HLS output {self.playlist}: {error}")
+
+
+class CallbackSink:
+    def __init__(self, on_audio):
+        self.on_audio = on_audio
+
+    def write(self, samples, start):
+        self.on_audio(samples, start)
+
+    def close(self):
+        pass
+
+
+def latency_summary(windows, audio_seconds, wall_time):
+    """Totals of the per-window reports."""
+    latencies = sorted(w["latency"] for w in windows if "latency" in w)
+    busy = sum(w["processing"] for w in windows)
+    summary = {
+        "windows": len(windows),
+        "audio_seconds": audio_seconds,
+        "wall_time": wall_time,
+        # Processing time over audio time; above 1 the stream falls behind
+        "real_time_factor": busy / max(audio_seconds, 1e-6),
+    }
+    if latencies:
+        summary.update({
+            "latency_mean": sum(latencies) / len(latencies),
+            "latency_p95": latencies[
+                min(len(latencies) - 1, int(0.95 * len(latencies)))
+            ],
+            "latency_max": latencies[-1],
+        })
+    return summary
+
+
+class StreamingDubber:
+    """
+    Dubbing of a live or growing input in rolling windows.
+
+    The source is decoded by ffmpeg as it arrives. Every window is
+    transcribed; the segments that end before the commit guard are
+    translated, synthesized and placed on the output timeline, and the
+    rest of the audio is transcribed again with the next window. The
+    dubbed audio up to the last committed segment is emitted to the sinks
+    (WAV, HLS, callback) right away, and each window reports its
+    latency: the time from the arrival of the first emitted source sample
+    to its emission.
+
+    A single voice (tts_voice00) is used: there is no diarization while
+    streaming.
+
+    Parameters:
+    - target_language (str): Language code of the dub.
+    - source_language (str or None): Language code of the source, detected
+      on the first window if None.
+    - workspace (Workspace or None): Directory of the TTS clips.
+    """
+
+    def __init__(
+        self,
+        target_language,
+        source_language=None,
+        tts_voice00="en-US-EmmaMultilingualNeural-Female",
+        transcriber_model="large-v3",
+        compute_type="float32",
+        batch_size=4,
+        literalize_numbers=True,
+        segment_duration_limit=15,
+        translate_process="google_translator_batch",
+        max_accelerate_audio=2.1,
+        window_seconds=STREAM_WINDOW_SECONDS,
+        hop_seconds=STREAM_HOP_SECONDS,
+        commit_guard=STREAM_COMMIT_GUARD,
+        max_buffer_seconds=STREAM_MAX_BUFFER_SECONDS,
+        output_sample_rate=STREAM_OUTPUT_SAMPLE_RATE,
+        workspace=None,
+    ):
+        self.target_language = target_language
+        self.source_language = source_language
+        # Language given to the ASR on every window. The pooled model does
+        # not depend on it, so the stream keeps using a single model
+        self.asr_language = source_language
+        self.tts_voice00 = tts_voice00
+        self.transcriber_model = transcriber_model
+        self.compute_type = compute_type
+        self.batch_size = batch_size
+        self.literalize_numbers = literalize_numbers
+        self.segment_duration_limit = segment_duration_limit
+        self.translate_process = translate_process
+        self.max_accelerate_audio = max_accelerate_audio
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        self.commit_guard = commit_guard
+        self.max_buffer_seconds = max(max_buffer_seconds, window_seconds)
+        self.output_sample_rate = output_sample_rate
+        self.workspace = workspace or Workspace()
+
+    def transcribe(self, samples, offset, final):
+        """
+        Segments of the window starting at `offset` seconds that can be
+        committed, and the media time up to which the audio is done.
+        """
+        end = offset + len(samples) / STREAM_SAMPLE_RATE
+        _, result = transcribe_speech(
+            samples,
+            self.transcriber_model,
+            self.compute_type,
+            self.batch_size,
+            self.asr_language,
+            self.literalize_numbers,
+            self.segment_duration_limit,
+        )
+        if self.asr_language is None and result.get("language"):
+            # Detected once, the next windows are too short to be reliable.
+            # A detected "zh" comes back as "zh-TW", which transcribe_speech
+            # takes as whisper "zh" without the Simplified Chinese prompt,
+            # the same options (and pooled model) as the detection
+            self.asr_language = result["language"]
+            if self.source_language is None:
+                self.source_language = result["language"]
+            logger.info(f"Stream language: {self.source_language}")
+
+        force = final or end - offset >= self.max_buffer_seconds
+        segments = []
+        commit = offset
+        for segment in result["segments"]:
+            start = offset + float(segment["start"])
+            segment_end = offset + float(segment["end"])
+            if not force and segment_end > end - self.commit_guard:
+                break
+            commit = segment_end
+            if segment["text"].strip():
+                segments.append({
+                    "start": round(start, 3),
+                    "end": round(segment_end, 3),
+                    "text": segment["text"].strip(),
+                    "speaker": "SPEAKER_00",
+                })
+
+        if force:
+            commit = end
+        elif not result["segments"]:
+            # Silence; a word may begin at the end of the window
+            commit = max(offset, end - self.commit_guard)
+        return segments, commit
+
+    def dub(self, segments, timeline):
+        """Translate and synthesize `segments` onto the timeline.
+        Returns the time spent in each stage."""
+        timings = {}
+        time_start = time.perf_counter()
+        segments = translate_text(
+            segments,
+            self.target_language,
+            self.translate_process,
+            chunk_size=1800,
+            source=self.source_language,
+        )
+        timings["translate"] = time.perf_counter() - time_start
+
+        time_start = time.perf_counter()
+        result = {"segments": segments}
+        valid_speakers = audio_segmentation_to_voice(
+            result,
+            self.target_language,
+            False,
+            self.tts_voice00,
+            workspace=self.workspace,
+        )
+        audio_files, _ = accelerate_segments(
+            result,
+            self.max_accelerate_audio,
+            valid_speakers,
+            workspace=self.workspace,
+        )
+        timings["tts"] = time.perf_counter() - time_start
+
+        time_start = time.perf_counter()
+        clips = self.workspace.clips
+        for segment, audio_file in zip(result["segments"], audio_files):
+            try:
+                timeline.overlay(
+                    clips.get(audio_file).resampled(self.output_sample_rate),
+                    segment["start"],
+                )
+            except Exception as error:
+                logger.error(f"Stream clip {audio_file}: {str(error)}")
+        clips.discard(audio_files + [
+            self.workspace.tts_clip(segment["start"])
+            for segment in result["segments"]
+        ])
+        timings["mix"] = time.perf_counter() - time_start
+        return timings
+
+    def run(
+        self,
+        source,
+        output_file=None,
+        hls_directory=None,
+        on_audio=None,
+        realtime=False,
+        follow=False,
+    ):
+        """
+        Dub `source` until it ends.
+
+        Parameters:
+        - source (str): Media file, URL, or "-" for stdin.
+        - output_file (str or None): WAV file of the dubbed audio.
+        - hls_directory (str or None): Directory of an HLS (fMP4) output.
+        - on_audio (callable or None): Called with (samples, start) for
+          every emitted piece of audio.
+        - realtime (bool): Feed the source at real-time pace (offline
+          tests of the live latency).
+        - follow (bool): Keep reading a file that is still being written.
+
+        Returns:
+        - report (dict): Per-window reports ("windows") and totals.
+        """
+        sinks = []
+        if output_file:
+            sinks.append(WavSink(output_file, self.output_sample_rate))
+        if hls_directory:
+            sinks.append(HLSSink(hls_directory, self.output_sample_rate))
+        if on_audio:
+            sinks.append(CallbackSink(on_audio))
+
+        reader = PCMSource(source, realtime, follow)
+        chunks = reader.chunks
+
+        timeline = OutputTimeline(self.output_sample_rate)
+        arrivals = deque()  # (media end time of a chunk, arrival time)
+        buffer = np.zeros(0, dtype=np.float32)
+        buffer_start = 0.0
+        received = 0.0
+        new_audio = 0.0
+        windows = []
+
+        time_start = time.perf_counter()
+        # The ASR model serves every window
+        with models_warm():
+            reader.start()
+            try:
+                final = False
+                while not final:
+                    item = chunks.get()
+                    pieces = []
+                    while True:
+                        if item is None:
+                            final = True
+                        elif isinstance(item, Exception):
+                            raise item
+                        else:
+                            samples, arrived = item
+                            received += len(samples) / STREAM_SAMPLE_RATE
+                            arrivals.append((received, arrived))
+                            pieces.append(samples)
+                        if final:
+                            break
+                        try:
+                            item = chunks.get_nowait()
+                        except queue.Empty:
+                            break
+
+                    if pieces:
+                        buffer = np.concatenate([buffer] + pieces)
+                        new_audio += sum(len(p) for p in pieces)
+                    buffered = len(buffer) / STREAM_SAMPLE_RATE
+                    ready = (
+                        buffered >= self.window_seconds
+                        and new_audio / STREAM_SAMPLE_RATE >= min(
+                            self.hop_seconds, buffered
+                        )
+                    )
+                    if not len(buffer) or not (ready or final):
+                        continue
+
+                    window = self.process_window(
+                        buffer, buffer_start, final, timeline
+                    )
+                    new_audio = 0.0
+                    commit = window["committed"]
+                    if commit > buffer_start:
+                        drop = int(
+                            round((commit - buffer_start) * STREAM_SAMPLE_RATE)
+                        )
+                        buffer = buffer[drop:]
+                        buffer_start = commit
+                        self.emit(commit, timeline, sinks, arrivals, window)
+                    windows.append(window)
+
+                # Clips ending past the input
+                if timeline.end > timeline.start:
+                    emitted_from = timeline.start
+                    samples = timeline.pop(timeline.end)
+                    for sink in sinks:
+                        sink.write(samples, emitted_from)
+            finally:
+                reader.close()
+                for sink in sinks:
+                    try:
+                        sink.close()
+                    except Exception as error:
+                        logger.error(str(error))
+
+        report = latency_summary(
+            windows, received, time.perf_counter() - time_start
+        )
+        logger.info(
+            f"Stream: {report['windows']} windows, "
+            f"{received:.1f}s of audio, "
+            f"real-time factor {report['real_time_factor']:.2f}"
+            + (
+                f", latency mean {report['latency_mean']:.2f}s "
+                f"p95 {report['latency_p95']:.2f}s "
+                f"max {report['latency_max']:.2f}s"
+                if "latency_mean" in report else ""
+            )
+        )
+        report["windows_report"] = windows
+        return report
+
+    def process_window(self, buffer, buffer_start, final, timeline):
+        window = {
+            "start": buffer_start,
+            "end": buffer_start + len(buffer) / STREAM_SAMPLE_RATE,
+            "segments": 0,
+        }
+        time_start = time.perf_counter()
+        segments, window["committed"] = self.transcribe(
+            buffer, buffer_start, final
+        )
+        window["asr"] = time.perf_counter() - time_start
+
+        if segments:
+            window["segments"] = len(segments)
+            window.update(self.dub(segments, timeline))
+        window["processing"] = time.perf_counter() - time_start
+        return window
+
+    def emit(self, until, timeline, sinks, arrivals, window):
+        """Write the dubbed audio up to `until` and record the latency of
+        the window."""
+        emitted_from = timeline.start
+        samples = timeline.pop(until)
+        for sink in sinks:
+            sink.write(samples, emitted_from)
+        emitted = time.perf_counter()
+
+        # Arrival of the first source sample of the emitted audio
+        while len(arrivals) > 1 and arrivals[0][0] <= emitted_from:
+            arrivals.popleft()
+        if arrivals:
+            window["latency"] = emitted - arrivals[0][1]
+
+        logger.info(
+            f"Stream window {window['start']:.1f}-{window['end']:.1f}s: "
+            f"{window['segments']} segments, emitted up to {until:.1f}s"
+            + (
+                f", latency {window['latency']:.2f}s"
+                if "latency" in window else ""
+            )
+            + f" (asr {window['asr']:.2f}s"
+            + (
+                f", translate {window['translate']:.2f}s, "
+                f"tts {window['tts']:.2f}s, mix {window['mix']:.2f}s"
+                if "tts" in window else ""
+            )
+            + ")"
+        )
@@ -1,14 +1,19 @@
 from .logging_setup import logger
-from whisperx.utils import get_writer
 from .utils import remove_files, run_command, remove_directory_contents
+from .workspace import Workspace
+from .startup import lazy_import
 from typing import List
 import srt
 import re
 import os
 import copy
 import string
-import soundfile as sf
-from PIL import Image, ImageOps, ImageDraw, ImageFont
+
+# Only the document pipeline draws pages
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+ImageDraw = lazy_import("PIL.ImageDraw")
+ImageFont = lazy_import("PIL.ImageFont")
 
 punctuation_list = list(
     string.punctuation + "¡¿«»„”“”‚‘’「」『』《》（）【】〈〉〔〕〖〗〘〙〚〛⸤⸥⸨⸩"
@@ -169,7 +174,9 @@ def replace_multiple_elements(text, replacements):
     return replaced_text
 
 
-def document_preprocessor(file_path, is_string, start_page, end_page):
+def document_preprocessor(
+    file_path, is_string, start_page, end_page, workspace=None
+):
     if not is_string:
         file_ext = os.path.splitext(file_path)[1].lower()
 
@@ -197,7 +204,7 @@ def document_preprocessor(file_path, is_string, start_page, end_page):
 
     # Save text to a .txt file
     # file_name = os.path.splitext(os.path.basename(file_path))[0]
-    txt_file_path = "./text_preprocessor.txt"
+    txt_file_path = (workspace or Workspace()).path("text_preprocessor.txt")
 
     with open(
         txt_file_path, "w", encoding='utf-8', errors='replace'
@@ -266,14 +273,14 @@ def plain_text_to_segments(result_text=None, chunk_size=None):
     return result_diarize
 
 
-def segments_to_plain_text(result_diarize):
+def segments_to_plain_text(result_diarize, workspace=None):
     complete_text = ""
     for seg in result_diarize["segments"]:
         complete_text += seg["text"] + " "  # issue
 
     # Save text to a .txt file
     # file_name = os.path.splitext(os.path.basename(file_path))[0]
-    txt_file_path = "./text_translation.txt"
+    txt_file_path = (workspace or Workspace()).path("text_translation.txt")
 
     with open(
         txt_file_path, "w", encoding='utf-8', errors='replace'
@@ -462,11 +469,13 @@ def doc_to_txtximg_pages(
     height,
     start_page,
     end_page,
-    bcolor
+    bcolor,
+    workspace=None,
 ):
     from pypdf import PdfReader
 
-    images_folder = "pdf_images/"
+    workspace = workspace or Workspace()
+    images_folder = workspace.path("pdf_images", "")
     os.makedirs(images_folder, exist_ok=True)
     remove_directory_contents(images_folder)
 
@@ -475,7 +484,7 @@ def doc_to_txtximg_pages(
     subimages = [("./assets/logo.jpeg", "top-left")]
     text_color = (255, 255, 255) if bcolor == "black" else (0, 0, 0)  # w|b
     background_color = COLORS.get(bcolor, (255, 255, 255))  # dynamic white
-    first_image = "pdf_images/0000_00_aaa.png"
+    first_image = f"{images_folder}0000_00_aaa.png"
 
     create_image_with_text_and_subimages(
         text_image,
@@ -578,11 +587,12 @@ def update_page_data(result_diarize, doc_data):
     return doc_data
 
 
-def fix_timestamps_docs(result_diarize, audio_files):
+def fix_timestamps_docs(result_diarize, audio_files, workspace=None):
+    workspace = workspace or Workspace()
     current_start = 0.0
 
     for seg, audio in zip(result_diarize["segments"], audio_files):
-        duration = round(sf.info(audio).duration, 2)
+        duration = round(workspace.clips.get(audio).duration, 2)
 
         seg["start"] = current_start
         current_start += duration
@@ -593,11 +603,13 @@ def fix_timestamps_docs(result_diarize, audio_files):
 
 def create_video_from_images(
     doc_data,
-    result_diarize
+    result_diarize,
+    workspace=None,
 ):
+    workspace = workspace or Workspace()
 
     # First image path
-    first_image = "pdf_images/0000_00_aaa.png"
+    first_image = workspace.path("pdf_images", "0000_00_aaa.png")
 
     # Time segments and images
     max_pages_idx = len(doc_data) - 1
@@ -645,25 +657,28 @@ def create_video_from_images(
         time_duration_per_image = round((duration_page / len(images)), 2)
         doc_data[current_page]["time_per_image"] = time_duration_per_image
 
-    # Timestamped image video.
-    with open("list.txt", "w") as file:
+    # Timestamped image video. ffmpeg reads the image paths relative to
+    # the list file, both inside the workspace.
+    list_file = workspace.path("list.txt")
+    with open(list_file, "w") as file:
 
         for i, page in enumerate(doc_data.values()):
 
             duration = page["time_per_image"]
             for img in page["images"]:
+                img_path = os.path.relpath(img, workspace.root)
                 if i == len(doc_data) - 1 and img == page["images"][-1]:  # Check if it's the last item
-                    file.write(f"file {img}\n")
+                    file.write(f"file {img_path}\n")
                     file.write(f"outpoint {duration}")
                 else:
-                    file.write(f"file {img}\n")
+                    file.write(f"file {img_path}\n")
                     file.write(f"outpoint {duration}\n")
 
-    out_video = "video_from_images.mp4"
+    out_video = workspace.path("video_from_images.mp4")
     remove_files(out_video)
 
-    cm = f"ffmpeg -y -f concat -i list.txt -c:v libx264 -preset veryfast -crf 18 -pix_fmt yuv420p {out_video}"
-    cm_alt = f"ffmpeg -f concat -i list.txt -c:v libx264 -r 30 -pix_fmt yuv420p -y {out_video}"
+    cm = f"ffmpeg -y -f concat -i {list_file} -c:v libx264 -preset veryfast -crf 18 -pix_fmt yuv420p {out_video}"
+    cm_alt = f"ffmpeg -f concat -i {list_file} -c:v libx264 -r 30 -pix_fmt yuv420p -y {out_video}"
     try:
         run_command(cm)
     except Exception as error:
@@ -674,14 +689,15 @@ def create_video_from_images(
     return out_video
 
 
-def merge_video_and_audio(video_doc, final_wav_file):
+def merge_video_and_audio(video_doc, final_wav_file, workspace=None):
 
-    fixed_audio = "fixed_audio.mp3"
+    workspace = workspace or Workspace()
+    fixed_audio = workspace.path("fixed_audio.mp3")
     remove_files(fixed_audio)
     cm = f"ffmpeg -i {final_wav_file} -c:a libmp3lame {fixed_audio}"
     run_command(cm)
 
-    vid_out = "video_book.mp4"
+    vid_out = workspace.path("video_book.mp4")
     remove_files(vid_out)
     cm = f"ffmpeg -i {video_doc} -i {fixed_audio} -c:v copy -c:a copy -map 0:v -map 1:a -shortest {vid_out}"
     run_command(cm)
@@ -711,7 +727,11 @@ def get_subtitle(
     support_name = filename + ".mp3"
     remove_files(sub_file)
 
-    writer = get_writer(extension, output_dir=".")
+    from whisperx.utils import get_writer
+
+    writer = get_writer(
+        extension, output_dir=os.path.dirname(sub_file) or "."
+    )
     word_options = {
         "highlight_words": highlight_words,
         "max_line_count": None,
@@ -753,14 +773,18 @@ def process_subtitles(
     result_diarize,
     output_format_subtitle,
     TRANSLATE_AUDIO_TO,
+    workspace=None,
 ):
-    name_ori = "sub_ori."
-    name_tra = "sub_tra."
+    workspace = workspace or Workspace()
+    name_ori = workspace.path("sub_ori.")
+    name_tra = workspace.path("sub_tra.")
     remove_files(
         [name_ori + output_format_subtitle, name_tra + output_format_subtitle]
     )
 
-    writer = get_writer(output_format_subtitle, output_dir=".")
+    from whisperx.utils import get_writer
+
+    writer = get_writer(output_format_subtitle, output_dir=workspace.root)
     word_options = {
         "highlight_words": False,
         "max_line_count": None,
@@ -1,7 +1,6 @@
-from gtts import gTTS
-import edge_tts, asyncio, json, glob, shutil # noqa
+import asyncio, json, glob, shutil # noqa
 from tqdm import tqdm
-import librosa, os, re, torch, gc, subprocess, hashlib # noqa
+import os, re, gc, subprocess, hashlib # noqa
 from .language_configuration import (
     fix_code_language,
     BARK_VOICES_LIST,
@@ -12,37 +11,76 @@ from .utils import (
     create_directories,
     copy_files,
     rename_file,
-    remove_directory_contents,
     remove_files,
     run_command,
     write_chunked,
+    hash_file,
 )
 import numpy as np
 from typing import Any, Dict
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from itertools import groupby
+import threading
+import time
 import soundfile as sf
+import io
+import random
 import platform
 import logging
 import traceback
 from .logging_setup import logger
+from .tts_cache import TTSClipCache, get_tts_clip_cache
+from .xtts_latent_cache import get_xtts_latent_cache
+from .workspace import Workspace
+from .startup import lazy_import
+from .voice_catalog import cached_catalog
+
+torch = lazy_import("torch")
+librosa = lazy_import("librosa")
+edge_tts = lazy_import("edge_tts")
+
+# Requests in flight, retries per request and base backoff in seconds
+EDGE_TTS_CONCURRENCY = int(os.environ.get("EDGE_TTS_CONCURRENCY", 8))
+EDGE_TTS_RETRIES = int(os.environ.get("EDGE_TTS_RETRIES", 3))
+EDGE_TTS_BACKOFF = float(os.environ.get("EDGE_TTS_BACKOFF", 1.0))
+
+# ffmpeg processes running at once and clips stretched by each process
+ACCELERATE_WORKERS = int(
+    os.environ.get("ACCELERATE_WORKERS", min(8, os.cpu_count() or 1))
+)
+ACCELERATE_CHUNK_SIZE = int(os.environ.get("ACCELERATE_CHUNK_SIZE", 16))
+
+BARK_GENERATE_ARGS = {
+    "do_sample": True,
+    "fine_temperature": 0.4,
+    "coarse_temperature": 0.8,
+}
+# Segments of the same voice synthesized in one padded batch
+BARK_BATCH_SIZE = int(os.environ.get("BARK_BATCH_SIZE", 4))
+VITS_BATCH_SIZE = int(os.environ.get("VITS_BATCH_SIZE", 8))
+
+PIPER_SYNTHESIZE_ARGS = {
+    "speaker_id": None,
+    "length_scale": 1.0,
+    "noise_scale": 0.667,
+    "noise_w": 0.8,
+    "sentence_silence": 0.0,
+}
+# Segments synthesized at once and CPU threads of each onnxruntime call
+PIPER_WORKERS = int(
+    os.environ.get("PIPER_WORKERS", min(4, os.cpu_count() or 1))
+)
+PIPER_INTRA_OP_THREADS = int(
+    os.environ.get(
+        "PIPER_INTRA_OP_THREADS",
+        max(1, (os.cpu_count() or 1) // max(1, PIPER_WORKERS)),
+    )
+)
+# Loaded Piper voices kept between calls
+PIPER_SESSION_POOL_SIZE = int(os.environ.get("PIPER_SESSION_POOL_SIZE", 4))
 
-# --- Edge TTS Caching Configuration ---
-EDGE_TTS_CACHE_DIR = os.path.join(os.getcwd(), ".edge-tts-cache")
-os.makedirs(EDGE_TTS_CACHE_DIR, exist_ok=True)
-# ------------------------------------
-
-# Place this block right before the # ===================================== # EDGE TTS # ===================================== line
-
-def hash_text(text: str) -> str:
-    """Creates an MD5 hash of the given text."""
-    return hashlib.md5(text.encode("utf-8")).hexdigest()
-
-def make_edge_tts_cache_filename(lang: str, voice: str, text: str) -> str:
-    """Creates a unique, sanitized .ogg filename for caching."""
-    h = hash_text(text)
-    # Sanitize voice name by removing gender for consistency with command line
-    sanitized_voice = voice.replace("-Male", "").replace("-Female", "")
-    return f"{lang}-{sanitized_voice}-{h}.ogg"
 
 class TTS_OperationError(Exception):
     def __init__(self, message="The operation did not complete successfully."):
@@ -60,11 +98,25 @@ def verify_saved_file_and_size(filename):
         )
 
 
+def save_tts_clip(filename, data, sampling_rate, workspace):
+    """Keep the synthesized audio as the clip of `filename` in the clip
+    store of the workspace. It is encoded only if persisted."""
+    if not len(data):
+        raise TTS_OperationError(
+            f"The clip '{filename}' has no audio. "
+            "Related to incorrect TTS for the target language"
+        )
+    workspace.clips.put(filename, data, sampling_rate)
+
+
 def error_handling_in_tts(error, segment, TRANSLATE_AUDIO_TO, filename):
     traceback.print_exc()
     logger.error(f"Error: {str(error)}")
+    # The replacement audio must not be cached as the TTS result
+    segment["tts_error"] = True
     try:
         from tempfile import TemporaryFile
+        from gtts import gTTS
 
         tts = gTTS(segment["text"], lang=fix_code_language(TRANSLATE_AUDIO_TO))
         # tts.save(filename)
@@ -129,6 +181,11 @@ def pad_array(array, sr):
 
 
 def edge_tts_voices_list():
+    """Edge TTS voices, kept on disk to skip the subprocess."""
+    return cached_catalog("edge_tts", fetch_edge_tts_voices)
+
+
+def fetch_edge_tts_voices():
     try:
         completed_process = subprocess.run(
             ["edge-tts", "--list-voices"], capture_output=True, text=True
@@ -169,69 +226,141 @@ def edge_tts_voices_list():
     return formatted_voices
 
 
-def segments_egde_tts(filtered_edge_segments, TRANSLATE_AUDIO_TO, is_gui):
-    for segment in tqdm(filtered_edge_segments["segments"]):
-        speaker = segment["speaker"] # noqa
+def run_coroutine_sync(coro):
+    """Run `coro` to completion, also from a thread with a running loop
+    (gradio, notebooks)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+async def edge_tts_request(
+    communicate_cls, text, voice, retries, backoff
+):
+    """Stream one Edge TTS request to memory, retrying with backoff."""
+    for attempt in range(retries + 1):
+        try:
+            audio = bytearray()
+            async for chunk in communicate_cls(text, voice).stream():
+                if chunk["type"] == "audio":
+                    audio.extend(chunk["data"])
+            if not audio:
+                raise TTS_OperationError("No audio was received")
+            return bytes(audio)
+        except Exception as error:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            logger.debug(
+                f"Edge TTS retry {attempt + 1}/{retries} in {delay:.1f}s: "
+                f"{str(error)}"
+            )
+            await asyncio.sleep(delay)
+
+
+def edge_tts_process_audio(audio_bytes, filename, workspace):
+    """Decode the MP3 response, trim it and keep it in the clip store."""
+    data, sample_rate = sf.read(io.BytesIO(audio_bytes), dtype="float32")
+    data = pad_array(data, sample_rate)
+    save_tts_clip(filename, data, sample_rate, workspace)
+
+
+async def segments_egde_tts_async(
+    segments,
+    TRANSLATE_AUDIO_TO,
+    concurrency,
+    retries,
+    backoff,
+    communicate_cls,
+    executor,
+    workspace,
+):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    progress_bar = tqdm(total=len(segments))
+
+    async def synthesize(segment):
         text = segment["text"]
         start = segment["start"]
         tts_name = segment["tts_name"]
 
         # Final output path required by the rest of the script
-        filename = f"audio/{start}.ogg"
+        filename = workspace.tts_clip(start)
         logger.info(f"{text} >> {filename}")
 
         try:
-            # --- Caching Logic (for final .ogg file) ---
-            voice_for_cache = tts_name.replace("-Male", "").replace("-Female", "")
-            cached_filename = make_edge_tts_cache_filename(TRANSLATE_AUDIO_TO, voice_for_cache, text)
-            cached_filepath = os.path.join(EDGE_TTS_CACHE_DIR, cached_filename)
-
-            if os.path.exists(cached_filepath) and os.path.getsize(cached_filepath) > 0:
-                # CACHE HIT: Copy the cached OGG directly to the destination
-                logger.info(f"CACHE HIT for '{text[:40]}...'")
-                shutil.copy(cached_filepath, filename)
-                verify_saved_file_and_size(filename)
-                continue  # Skip to the next segment
-
-            # --- CACHE MISS: Generate, Process, and then Cache the final .ogg ---
-            logger.info(f"CACHE MISS for '{text[:40]}...'. Generating audio.")
-            temp_file = filename[:-3] + "mp3"
-
-            # 1. Generate MP3 from Edge TTS (no rate)
-            if is_gui:
-                loop = asyncio.get_event_loop()
-                loop.run_until_complete(
-                    edge_tts.Communicate(
-                        text, "-".join(tts_name.split("-")[:-1])
-                    ).save(temp_file)
+            voice = tts_name.replace("-Male", "").replace("-Female", "")
+            async with semaphore:
+                audio_bytes = await edge_tts_request(
+                    communicate_cls, text, voice, retries, backoff
                 )
-            else:
-                command = f'edge-tts -t "{text}" -v "{voice_for_cache}" --write-media "{temp_file}"'
-                run_command(command)
-
-            verify_saved_file_and_size(temp_file)
-
-            # 2. Process MP3 to OGG
-            data, sample_rate = sf.read(temp_file)
-            data = pad_array(data, sample_rate)
-            os.remove(temp_file) # Clean up the intermediate mp3
 
-            # 3. Save final OGG file to primary audio/ directory
-            write_chunked(
-                file=filename,
-                samplerate=sample_rate,
-                data=data,
-                format="ogg",
-                subtype="vorbis",
+            # CPU work runs on the pool while other requests are in flight
+            await loop.run_in_executor(
+                executor,
+                edge_tts_process_audio,
+                audio_bytes,
+                filename,
+                workspace,
             )
-            verify_saved_file_and_size(filename)
+        except Exception as error:
+            await loop.run_in_executor(
+                executor,
+                error_handling_in_tts,
+                error,
+                segment,
+                TRANSLATE_AUDIO_TO,
+                filename,
+            )
+        finally:
+            progress_bar.update(1)
 
-            # 4. Save the final OGG to the cache for future use
-            shutil.copy(filename, cached_filepath)
-            logger.info(f"Saved to cache: {cached_filepath}")
+    try:
+        await asyncio.gather(*(synthesize(seg) for seg in segments))
+    finally:
+        progress_bar.close()
 
-        except Exception as error:
-            error_handling_in_tts(error, segment, TRANSLATE_AUDIO_TO, filename)
+
+def segments_egde_tts(
+    filtered_edge_segments,
+    TRANSLATE_AUDIO_TO,
+    is_gui,
+    concurrency=EDGE_TTS_CONCURRENCY,
+    retries=EDGE_TTS_RETRIES,
+    backoff=EDGE_TTS_BACKOFF,
+    communicate_cls=None,
+    workspace=None,
+):
+    """
+    Synthesize the Edge TTS segments with up to `concurrency` requests in
+    flight. MP3 decoding and OGG encoding run on a worker pool, so network
+    waits and CPU work overlap. `communicate_cls` replaces
+    `edge_tts.Communicate` (e.g. a local fake for offline runs).
+    """
+    if communicate_cls is None:
+        communicate_cls = edge_tts.Communicate
+    workspace = workspace or Workspace()
+
+    segments = filtered_edge_segments["segments"]
+    workers = min(concurrency, os.cpu_count() or 1)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        run_coroutine_sync(
+            segments_egde_tts_async(
+                segments,
+                TRANSLATE_AUDIO_TO,
+                max(1, concurrency),
+                retries,
+                backoff,
+                communicate_cls,
+                executor,
+                workspace,
+            )
+        )
 
 
 # =====================================
@@ -239,13 +368,84 @@ def segments_egde_tts(filtered_edge_segments, TRANSLATE_AUDIO_TO, is_gui):
 # =====================================
 
 
-def segments_bark_tts(
-    filtered_bark_segments, TRANSLATE_AUDIO_TO, model_id_bark="suno/bark-small"
+def voice_batches(segments, batch_size):
+    """Segments grouped by `tts_name`, in batches of up to `batch_size`."""
+    by_voice = {}
+    for segment in segments:
+        by_voice.setdefault(segment["tts_name"], []).append(segment)
+
+    batch_size = max(1, batch_size)
+    for tts_name, voice_segments in by_voice.items():
+        for i in range(0, len(voice_segments), batch_size):
+            yield tts_name, voice_segments[i:i + batch_size]
+
+
+def write_tts_batch(
+    segments, outputs, sampling_rate, TRANSLATE_AUDIO_TO, workspace
+):
+    """Save the audio of each segment of a batch as its TTS clip."""
+    for segment, speech_output in zip(segments, outputs):
+        filename = workspace.tts_clip(segment["start"])
+        logger.info(f"{segment['text']} >> {filename}")
+        try:
+            data_tts = pad_array(speech_output, sampling_rate)
+            save_tts_clip(filename, data_tts, sampling_rate, workspace)
+        except Exception as error:
+            error_handling_in_tts(error, segment, TRANSLATE_AUDIO_TO, filename)
+
+
+def run_tts_batches(
+    batches, synthesize_batch, sampling_rate, TRANSLATE_AUDIO_TO, workspace
 ):
+    """
+    Synthesize and save every batch. A failed batch is retried segment by
+    segment, so only the failing segments fall back to the error audio.
+
+    Parameters:
+    - batches (list): (tts_name, segments) tuples.
+    - synthesize_batch (callable): (tts_name, texts) -> list of arrays.
+    """
+    done = 0
+    time_start = time.perf_counter()
+    for tts_name, segments in tqdm(batches):
+        try:
+            outputs = synthesize_batch(
+                tts_name, [segment["text"] for segment in segments]
+            )
+        except Exception as error:
+            if len(segments) == 1:
+                filename = workspace.tts_clip(segments[0]["start"])
+                error_handling_in_tts(
+                    error, segments[0], TRANSLATE_AUDIO_TO, filename
+                )
+                continue
+            logger.debug(f"Batch of {len(segments)} failed: {str(error)}")
+            run_tts_batches(
+                [(tts_name, [segment]) for segment in segments],
+                synthesize_batch,
+                sampling_rate,
+                TRANSLATE_AUDIO_TO,
+                workspace,
+            )
+            continue
+        write_tts_batch(
+            segments, outputs, sampling_rate, TRANSLATE_AUDIO_TO, workspace
+        )
+        done += len(segments)
+
+    elapsed = time.perf_counter() - time_start
+    if done:
+        logger.debug(
+            f"TTS batches: {done} segments in {elapsed:.1f}s, "
+            f"{done / max(elapsed, 1e-6):.2f} segments/s"
+        )
+
+
+def load_bark_model(model_id_bark="suno/bark-small", device=None):
     from transformers import AutoProcessor, BarkModel
     from optimum.bettertransformer import BetterTransformer
 
-    device = os.environ.get("SONITR_DEVICE")
+    device = device or os.environ.get("SONITR_DEVICE")
     torch_dtype_env = torch.float16 if device == "cuda" else torch.float32
 
     # load model bark
@@ -261,53 +461,61 @@ def segments_bark_tts(
         model = BetterTransformer.transform(model, keep_original_model=False)
         # enable CPU offload
         # model.enable_cpu_offload()
-    sampling_rate = model.generation_config.sample_rate
+    return model, processor
 
-    # filtered_segments = filtered_bark_segments['segments']
-    # Sorting the segments by 'tts_name'
-    # sorted_segments = sorted(filtered_segments, key=lambda x: x['tts_name'])
-    # logger.debug(sorted_segments)
 
-    for segment in tqdm(filtered_bark_segments["segments"]):
-        speaker = segment["speaker"] # noqa
-        text = segment["text"]
-        start = segment["start"]
-        tts_name = segment["tts_name"]
+def bark_synthesize_batch(model, processor, texts, voice_preset):
+    """
+    One generate call for texts sharing a voice preset. The batch is
+    padded with an attention mask and each output is cut to its own
+    length.
+    """
+    device = model.device
+    inputs = processor(texts, voice_preset=voice_preset).to(device)
+
+    with torch.inference_mode():
+        speech_output = model.generate(
+            **inputs,
+            **BARK_GENERATE_ARGS,
+            pad_token_id=processor.tokenizer.pad_token_id,
+            return_output_lengths=True,
+        )
 
-        inputs = processor(text, voice_preset=BARK_VOICES_LIST[tts_name]).to(
-            device
+    if isinstance(speech_output, tuple):
+        speech_output, lengths = speech_output
+        lengths = lengths.cpu().tolist()
+    else:
+        # Padded to the longest; pad_array trims the trailing silence
+        lengths = [speech_output.shape[-1]] * speech_output.shape[0]
+
+    audio = speech_output.cpu().float().numpy().reshape(len(texts), -1)
+    return [audio[i, :int(length)] for i, length in enumerate(lengths)]
+
+
+def segments_bark_tts(
+    filtered_bark_segments,
+    TRANSLATE_AUDIO_TO,
+    model_id_bark="suno/bark-small",
+    batch_size=BARK_BATCH_SIZE,
+    workspace=None,
+):
+    workspace = workspace or Workspace()
+
+    model, processor = load_bark_model(model_id_bark)
+    sampling_rate = model.generation_config.sample_rate
+
+    def synthesize_batch(tts_name, texts):
+        return bark_synthesize_batch(
+            model, processor, texts, BARK_VOICES_LIST[tts_name]
         )
 
-        # make the tts audio
-        filename = f"audio/{start}.ogg"
-        logger.info(f"{text} >> {filename}")
-        try:
-            # Infer
-            with torch.inference_mode():
-                speech_output = model.generate(
-                    **inputs,
-                    do_sample=True,
-                    fine_temperature=0.4,
-                    coarse_temperature=0.8,
-                    pad_token_id=processor.tokenizer.pad_token_id,
-                )
-            # Save file
-            data_tts = pad_array(
-                speech_output.cpu().numpy().squeeze().astype(np.float32),
-                sampling_rate,
-            )
-            write_chunked(
-                file=filename,
-                samplerate=sampling_rate,
-                data=data_tts,
-                format="ogg",
-                subtype="vorbis",
-            )
-            verify_saved_file_and_size(filename)
-        except Exception as error:
-            error_handling_in_tts(error, segment, TRANSLATE_AUDIO_TO, filename)
-        gc.collect()
-        torch.cuda.empty_cache()
+    run_tts_batches(
+        list(voice_batches(filtered_bark_segments["segments"], batch_size)),
+        synthesize_batch,
+        sampling_rate,
+        TRANSLATE_AUDIO_TO,
+        workspace,
+    )
     try:
         del processor
         del model
@@ -359,61 +567,60 @@ def uromanize(input_string):
     return stdout.decode()[:-1]
 
 
-def segments_vits_tts(filtered_vits_segments, TRANSLATE_AUDIO_TO):
+def vits_synthesize_batch(model, tokenizer, texts):
+    """
+    One forward pass for texts of the same VITS voice. The token batch is
+    padded with an attention mask and each waveform is cut to the
+    length the model reports for it.
+    """
+    if tokenizer.is_uroman:
+        texts = [uromanize(text) for text in texts]
+        logger.debug(f"Romanize text: {texts}")
+    inputs = tokenizer(texts, return_tensors="pt", padding=True)
+    inputs = inputs.to(model.device)
+
+    with torch.no_grad():
+        output = model(**inputs)
+
+    waveform = output.waveform.cpu().float().numpy()
+    lengths = getattr(output, "sequence_lengths", None)
+    if lengths is None:
+        # Padded to the longest; pad_array trims the trailing silence
+        lengths = [waveform.shape[-1]] * waveform.shape[0]
+    else:
+        lengths = lengths.cpu().tolist()
+    return [waveform[i, :int(length)] for i, length in enumerate(lengths)]
+
+
+def segments_vits_tts(
+    filtered_vits_segments,
+    TRANSLATE_AUDIO_TO,
+    batch_size=VITS_BATCH_SIZE,
+    workspace=None,
+):
     from transformers import VitsModel, AutoTokenizer
 
+    workspace = workspace or Workspace()
+
     filtered_segments = filtered_vits_segments["segments"]
     # Sorting the segments by 'tts_name'
     sorted_segments = sorted(filtered_segments, key=lambda x: x["tts_name"])
     logger.debug(sorted_segments)
 
-    model_name_key = None
-    for segment in tqdm(sorted_segments):
-        speaker = segment["speaker"] # noqa
-        text = segment["text"]
-        start = segment["start"]
-        tts_name = segment["tts_name"]
-
-        if tts_name != model_name_key:
-            model_name_key = tts_name
-            model = VitsModel.from_pretrained(VITS_VOICES_LIST[tts_name])
-            tokenizer = AutoTokenizer.from_pretrained(
-                VITS_VOICES_LIST[tts_name]
-            )
-            sampling_rate = model.config.sampling_rate
-
-        if tokenizer.is_uroman:
-            romanize_text = uromanize(text)
-            logger.debug(f"Romanize text: {romanize_text}")
-            inputs = tokenizer(romanize_text, return_tensors="pt")
-        else:
-            inputs = tokenizer(text, return_tensors="pt")
-
-        # make the tts audio
-        filename = f"audio/{start}.ogg"
-        logger.info(f"{text} >> {filename}")
-        try:
-            # Infer
-            with torch.no_grad():
-                speech_output = model(**inputs).waveform
-
-            data_tts = pad_array(
-                speech_output.cpu().numpy().squeeze().astype(np.float32),
-                sampling_rate,
-            )
-            # Save file
-            write_chunked(
-                file=filename,
-                samplerate=sampling_rate,
-                data=data_tts,
-                format="ogg",
-                subtype="vorbis",
-            )
-            verify_saved_file_and_size(filename)
-        except Exception as error:
-            error_handling_in_tts(error, segment, TRANSLATE_AUDIO_TO, filename)
-        gc.collect()
-        torch.cuda.empty_cache()
+    for tts_name, segments in groupby(
+        sorted_segments, key=lambda x: x["tts_name"]
+    ):
+        model = VitsModel.from_pretrained(VITS_VOICES_LIST[tts_name])
+        tokenizer = AutoTokenizer.from_pretrained(VITS_VOICES_LIST[tts_name])
+        sampling_rate = model.config.sampling_rate
+
+        run_tts_batches(
+            list(voice_batches(list(segments), batch_size)),
+            lambda _, texts: vits_synthesize_batch(model, tokenizer, texts),
+            sampling_rate,
+            TRANSLATE_AUDIO_TO,
+            workspace,
+        )
     try:
         del tokenizer
         del model
@@ -425,6 +632,59 @@ def segments_vits_tts(filtered_vits_segments, TRANSLATE_AUDIO_TO):
         torch.cuda.empty_cache()
 
 
+def benchmark_tts_batching(
+    backend="vits",
+    tts_name="en-facebook-mms VITS",
+    segments=16,
+    batch_sizes=(1, 4, 8),
+    device="cpu",
+):
+    """
+    Throughput of the batched VITS or Bark synthesis on short lines, on
+    `device` (CPU by default).
+
+    Returns:
+        dict: batch size -> (elapsed seconds, segments per second)
+    """
+    texts = [
+        "Hello there.",
+        "How are you doing today?",
+        "This is a short subtitle line.",
+        "Thanks for watching the video.",
+    ] * (segments // 4 + 1)
+    texts = texts[:segments]
+
+    if backend == "bark":
+        model, processor = load_bark_model(device=device)
+
+        def synthesize(batch):
+            return bark_synthesize_batch(
+                model, processor, batch, BARK_VOICES_LIST[tts_name]
+            )
+    else:
+        from transformers import VitsModel, AutoTokenizer
+
+        model = VitsModel.from_pretrained(VITS_VOICES_LIST[tts_name])
+        model = model.to(device)
+        tokenizer = AutoTokenizer.from_pretrained(VITS_VOICES_LIST[tts_name])
+
+        def synthesize(batch):
+            return vits_synthesize_batch(model, tokenizer, batch)
+
+    results = {}
+    for batch_size in batch_sizes:
+        time_start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            synthesize(texts[i:i + batch_size])
+        elapsed = time.perf_counter() - time_start
+        results[batch_size] = (elapsed, len(texts) / elapsed)
+        logger.info(
+            f"{backend} batch {batch_size}: {elapsed:.1f}s, "
+            f"{len(texts) / elapsed:.2f} segments/s"
+        )
+    return results
+
+
 # =====================================
 # Coqui XTTS
 # =====================================
@@ -514,16 +774,14 @@ def create_wav_file_vc(
     end=None,  # trim end
     output_final_path="_XTTS_",
     get_vocals_dereverb=True,
+    workspace=None,
 ):
     sample_name = sample_name if sample_name else "default_name"
     sample_name = sanitize_file_name(sample_name)
     audio_wav = audio_wav if isinstance(audio_wav, str) else audio_wav.name
+    workspace = workspace or Workspace()
 
-    BASE_DIR = (
-        "."  # os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    )
-
-    output_dir = os.path.join(BASE_DIR, "clean_song_output")  # remove content
+    output_dir = workspace.path("clean_song_output")  # remove content
     # remove_directory_contents(output_dir)
 
     if start or end:
@@ -540,6 +798,7 @@ def create_wav_file_vc(
             orig_song_path=audio_segment,
             main_vocals=True,
             dereverb=get_vocals_dereverb,
+            output_path=output_dir,
         )
     except Exception as error:
         logger.error(str(error))
@@ -559,14 +818,41 @@ def create_wav_file_vc(
         raise Exception(f"Error wav: {final_sample}")
 
 
+def automatic_reference_bounds(segments_base, speaker):
+    """Start and end in the source audio of the AUTOMATIC reference voice
+    of `speaker`: a line of 7 to 12 seconds trimmed by one second on each
+    side, or else the start of the first line. None without lines."""
+    filtered_speaker = [
+        segment
+        for segment in segments_base
+        if segment["speaker"] == speaker
+    ]
+    if not filtered_speaker:
+        return None
+    if len(filtered_speaker) > 4:
+        filtered_speaker = filtered_speaker[1:]
+
+    for seg in filtered_speaker:
+        duration = float(seg["end"]) - float(seg["start"])
+        if duration > 7.0 and duration < 12.0:
+            return float(seg["start"]) + 1.0, float(seg["end"]) - 1.0
+
+    logger.debug(f"Taking the first segment of {speaker}")
+    seg = filtered_speaker[0]
+    max_duration = float(seg["end"]) - float(seg["start"])
+    max_duration = max(2.0, min(max_duration, 9.0))
+    return float(seg["start"]), float(seg["start"]) + max_duration
+
+
 def create_new_files_for_vc(
     speakers_coqui,
     segments_base,
-    dereverb_automatic=True
+    dereverb_automatic=True,
+    workspace=None,
 ):
     # before function delete automatic delete_previous_automatic
-    output_dir = os.path.join(".", "clean_song_output")  # remove content
-    remove_directory_contents(output_dir)
+    workspace = workspace or Workspace()
+    workspace.clean("clean_song_output")
 
     for speaker in speakers_coqui:
         filtered_speaker = [
@@ -574,49 +860,32 @@ def create_new_files_for_vc(
             for segment in segments_base
             if segment["speaker"] == speaker
         ]
-        if len(filtered_speaker) > 4:
-            filtered_speaker = filtered_speaker[1:]
+        if not filtered_speaker:
+            continue
         if filtered_speaker[0]["tts_name"] == "_XTTS_/AUTOMATIC.wav":
             name_automatic_wav = f"AUTOMATIC_{speaker}"
-            if os.path.exists(f"_XTTS_/{name_automatic_wav}.wav"):
+            automatic_dir = workspace.path("_XTTS_")
+            if os.path.exists(
+                os.path.join(automatic_dir, f"{name_automatic_wav}.wav")
+            ):
                 logger.info(f"WAV automatic {speaker} exists")
                 # path_wav = path_automatic_wav
                 pass
             else:
                 # create wav
-                wav_ok = False
-                for seg in filtered_speaker:
-                    duration = float(seg["end"]) - float(seg["start"])
-                    if duration > 7.0 and duration < 12.0:
-                        logger.info(
-                            f'Processing segment: {seg["start"]}, {seg["end"]}, {seg["speaker"]}, {duration}, {seg["text"]}'
-                        )
-                        create_wav_file_vc(
-                            sample_name=name_automatic_wav,
-                            audio_wav="audio.wav",
-                            start=(float(seg["start"]) + 1.0),
-                            end=(float(seg["end"]) - 1.0),
-                            get_vocals_dereverb=dereverb_automatic,
-                        )
-                        wav_ok = True
-                        break
-
-                if not wav_ok:
-                    logger.info("Taking the first segment")
-                    seg = filtered_speaker[0]
-                    logger.info(
-                        f'Processing segment: {seg["start"]}, {seg["end"]}, {seg["speaker"]}, {seg["text"]}'
-                    )
-                    max_duration = float(seg["end"]) - float(seg["start"])
-                    max_duration = max(2.0, min(max_duration, 9.0))
-
-                    create_wav_file_vc(
-                        sample_name=name_automatic_wav,
-                        audio_wav="audio.wav",
-                        start=(float(seg["start"])),
-                        end=(float(seg["start"]) + max_duration),
-                        get_vocals_dereverb=dereverb_automatic,
-                    )
+                start, end = automatic_reference_bounds(
+                    filtered_speaker, speaker
+                )
+                logger.info(f"Processing segment: {start}, {end}, {speaker}")
+                create_wav_file_vc(
+                    sample_name=name_automatic_wav,
+                    audio_wav=workspace.path("audio.wav"),
+                    start=start,
+                    end=end,
+                    output_final_path=automatic_dir,
+                    get_vocals_dereverb=dereverb_automatic,
+                    workspace=workspace,
+                )
 
 
 def segments_coqui_tts(
@@ -627,6 +896,8 @@ def segments_coqui_tts(
     delete_previous_automatic=True,
     dereverb_automatic=True,
     emotion=None,
+    workspace=None,
+    reference_segments=None,
 ):
     """XTTS
     Install:
@@ -635,9 +906,13 @@ def segments_coqui_tts(
 
     Notes:
     - tts_name is the wav|mp3|ogg|m4a file for VC
+    - reference_segments: lines the AUTOMATIC voices are cut from, all of
+      them when only some are synthesized, so that the voice matches the
+      clip cache key
     """
     from TTS.api import TTS
 
+    workspace = workspace or Workspace()
     TRANSLATE_AUDIO_TO = fix_code_language(TRANSLATE_AUDIO_TO, syntax="coqui")
     supported_lang_coqui = [
         "zh-cn",
@@ -664,16 +939,20 @@ def segments_coqui_tts(
     # Emotion and speed can only be used with Coqui Studio models. discontinued
     # emotions = ["Neutral", "Happy", "Sad", "Angry", "Dull"]
 
+    # Voices cut from the source audio belong to the job
+    directory_audios_vc = workspace.path("_XTTS_")
     if delete_previous_automatic:
         for spk in speakers_coqui:
-            remove_files(f"_XTTS_/AUTOMATIC_{spk}.wav")
+            remove_files(
+                os.path.join(directory_audios_vc, f"AUTOMATIC_{spk}.wav")
+            )
 
-    directory_audios_vc = "_XTTS_"
     create_directories(directory_audios_vc)
     create_new_files_for_vc(
         speakers_coqui,
-        filtered_coqui_segments["segments"],
+        reference_segments or filtered_coqui_segments["segments"],
         dereverb_automatic,
+        workspace,
     )
 
     # Init TTS
@@ -681,44 +960,71 @@ def segments_coqui_tts(
     model = TTS(model_id_coqui).to(device)
     sampling_rate = 24000
 
-    # filtered_segments = filtered_coqui_segments['segments']
-    # Sorting the segments by 'tts_name'
-    # sorted_segments = sorted(filtered_segments, key=lambda x: x['tts_name'])
-    # logger.debug(sorted_segments)
+    def reference_wav(segment):
+        if segment["tts_name"] == "_XTTS_/AUTOMATIC.wav":
+            return os.path.join(
+                directory_audios_vc, f"AUTOMATIC_{segment['speaker']}.wav"
+            )
+        return segment["tts_name"]
+
+    # Lines of the same reference voice share its conditioning latents
+    segments_by_reference = {}
+    for segment in filtered_coqui_segments["segments"]:
+        segments_by_reference.setdefault(
+            reference_wav(segment), []
+        ).append(segment)
+
+    xtts = getattr(getattr(model, "synthesizer", None), "tts_model", None)
+    low_level = hasattr(xtts, "get_conditioning_latents")
+    if not low_level:
+        logger.debug("XTTS inference API not available, using TTS.tts")
+
+    with tqdm(total=len(filtered_coqui_segments["segments"])) as pbar:
+        for reference, segments in segments_by_reference.items():
+            synthesize = None
+            if low_level:
+                try:
+                    synthesize = xtts_speaker_synthesizer(
+                        model, reference, model_id_coqui, TRANSLATE_AUDIO_TO
+                    )
+                except Exception as error:
+                    logger.error(
+                        f"XTTS latents of {reference}: {str(error)}"
+                    )
+            if synthesize is None:
+                def synthesize(text, reference=reference):
+                    return model.tts(
+                        text=text,
+                        speaker_wav=reference,
+                        language=TRANSLATE_AUDIO_TO,
+                    )
 
-    for segment in tqdm(filtered_coqui_segments["segments"]):
-        speaker = segment["speaker"]
-        text = segment["text"]
-        start = segment["start"]
-        tts_name = segment["tts_name"]
-        if tts_name == "_XTTS_/AUTOMATIC.wav":
-            tts_name = f"_XTTS_/AUTOMATIC_{speaker}.wav"
+            for segment in segments:
+                text = segment["text"]
+                start = segment["start"]
+
+                # make the tts audio
+                filename = workspace.tts_clip(start)
+                logger.info(f"{text} >> {filename}")
+                try:
+                    # Infer
+                    wav = synthesize(text)
+                    data_tts = pad_array(
+                        wav,
+                        sampling_rate,
+                    )
+                    save_tts_clip(
+                        filename, data_tts, sampling_rate, workspace
+                    )
+                except Exception as error:
+                    error_handling_in_tts(
+                        error, segment, TRANSLATE_AUDIO_TO, filename
+                    )
+                pbar.update(1)
 
-        # make the tts audio
-        filename = f"audio/{start}.ogg"
-        logger.info(f"{text} >> {filename}")
-        try:
-            # Infer
-            wav = model.tts(
-                text=text, speaker_wav=tts_name, language=TRANSLATE_AUDIO_TO
-            )
-            data_tts = pad_array(
-                wav,
-                sampling_rate,
-            )
-            # Save file
-            write_chunked(
-                file=filename,
-                samplerate=sampling_rate,
-                data=data_tts,
-                format="ogg",
-                subtype="vorbis",
-            )
-            verify_saved_file_and_size(filename)
-        except Exception as error:
-            error_handling_in_tts(error, segment, TRANSLATE_AUDIO_TO, filename)
-        gc.collect()
-        torch.cuda.empty_cache()
+    logger.debug(
+        f"XTTS latent cache stats: {get_xtts_latent_cache().get_cache_stats()}"
+    )
     try:
         del model
         gc.collect()
@@ -729,12 +1035,83 @@ def segments_coqui_tts(
         torch.cuda.empty_cache()
 
 
+def xtts_speaker_synthesizer(model, reference, model_id, language):
+    """
+    Synthesis function of one reference voice through the XTTS inference
+    API. The conditioning latents come from the latent cache, so they are
+    computed once per reference audio instead of once per line.
+    """
+    xtts = model.synthesizer.tts_model
+    config = xtts.config
+    model_device = next(xtts.parameters()).device
+
+    conditioning = {
+        "gpt_cond_len": config.gpt_cond_len,
+        "gpt_cond_chunk_len": config.gpt_cond_chunk_len,
+        "max_ref_length": config.max_ref_len,
+        "sound_norm_refs": config.sound_norm_refs,
+    }
+    latent_cache = get_xtts_latent_cache()
+    key = latent_cache.make_key(
+        reference, model_id, json.dumps(conditioning, sort_keys=True)
+    )
+    latents = latent_cache.load(key)
+    if latents is None:
+        with torch.inference_mode():
+            gpt_cond_latent, speaker_embedding = (
+                xtts.get_conditioning_latents(
+                    audio_path=[reference], **conditioning
+                )
+            )
+        latents = (
+            gpt_cond_latent.cpu().float().numpy(),
+            speaker_embedding.cpu().float().numpy(),
+        )
+        latent_cache.save(key, *latents)
+
+    gpt_cond_latent = torch.from_numpy(latents[0]).to(model_device)
+    speaker_embedding = torch.from_numpy(latents[1]).to(model_device)
+    settings = {
+        "temperature": config.temperature,
+        "length_penalty": config.length_penalty,
+        "repetition_penalty": config.repetition_penalty,
+        "top_k": config.top_k,
+        "top_p": config.top_p,
+    }
+
+    def synthesize(text):
+        # Sentence by sentence with the same gap as TTS.tts
+        sentences = model.synthesizer.split_into_sentences(text)
+        wavs = []
+        for sentence in sentences:
+            with torch.inference_mode():
+                output = xtts.inference(
+                    sentence,
+                    language,
+                    gpt_cond_latent,
+                    speaker_embedding,
+                    **settings,
+                )
+            wav = output["wav"]
+            if torch.is_tensor(wav):
+                wav = wav.cpu().numpy()
+            wavs.append(np.asarray(wav, dtype=np.float32).squeeze())
+            wavs.append(np.zeros(10000, dtype=np.float32))
+        return np.concatenate(wavs[:-1]) if wavs else np.zeros(0)
+
+    return synthesize
+
+
 # =====================================
 # PIPER TTS
 # =====================================
 
 
 def piper_tts_voices_list():
+    return cached_catalog("piper_tts", fetch_piper_tts_voices)
+
+
+def fetch_piper_tts_voices():
     file_path = download_manager(
         url="https://huggingface.co/rhasspy/piper-voices/resolve/main/voices.json",
         path="./PIPER_MODELS",
@@ -769,15 +1146,7 @@ def replace_text_in_json(file_path, key_to_replace, new_text, condition=None):
         )  # Write the modified data back to the file with indentation for readability
 
 
-def load_piper_model(
-    model: str,
-    data_dir: list,
-    download_dir: str = "",
-    update_voices: bool = False,
-):
-    from piper import PiperVoice
-    from piper.download import ensure_voice_exists, find_voice, get_voices
-
+def piper_use_cuda():
     try:
         import onnxruntime as rt
 
@@ -797,17 +1166,19 @@ def load_piper_model(
         logger.info("Employing CPU exclusivity with Piper TTS")
         cuda = False
 
-    if not download_dir:
-        # Download to first data directory by default
-        download_dir = data_dir[0]
-    else:
-        data_dir = [os.path.join(data_dir[0], download_dir)]
+    return cuda
+
+
+_piper_voices_info = {}
 
-    # Download voice if file doesn't exist
-    model_path = Path(model)
-    if not model_path.exists():
-        # Load voice info
-        voices_info = get_voices(download_dir, update_voices=update_voices)
+
+def get_piper_voices_info(download_dir):
+    """Piper voice catalog, read once from the voices.json downloaded
+    with the voice list (or the one shipped with piper)."""
+    from piper.download import get_voices
+
+    if download_dir not in _piper_voices_info:
+        voices_info = get_voices(download_dir, update_voices=False)
 
         # Resolve aliases for backwards compatibility with old voice names
         aliases_info: Dict[str, Any] = {}
@@ -816,74 +1187,185 @@ def load_piper_model(
                 aliases_info[voice_alias] = {"_is_alias": True, **voice_info}
 
         voices_info.update(aliases_info)
+        _piper_voices_info[download_dir] = voices_info
+    return _piper_voices_info[download_dir]
+
+
+def load_piper_model(
+    model: str,
+    data_dir: list,
+    download_dir: str = "",
+    update_voices: bool = False,
+    cuda: bool = None,
+    intra_op_threads: int = PIPER_INTRA_OP_THREADS,
+):
+    from piper import PiperVoice
+    from piper.config import PiperConfig
+    from piper.download import ensure_voice_exists, find_voice
+    import onnxruntime as rt
+
+    if cuda is None:
+        cuda = piper_use_cuda()
+
+    if not download_dir:
+        # Download to first data directory by default
+        download_dir = data_dir[0]
+    else:
+        data_dir = [os.path.join(data_dir[0], download_dir)]
+
+    try:
+        model, config = find_voice(model, data_dir)
+    except ValueError:
+        # Download the voice, looked up in the local catalog
+        if update_voices:
+            _piper_voices_info.pop(download_dir, None)
+            from piper.download import get_voices
+
+            get_voices(download_dir, update_voices=True)
+        voices_info = get_piper_voices_info(download_dir)
         ensure_voice_exists(model, data_dir, download_dir, voices_info)
         model, config = find_voice(model, data_dir)
 
-        replace_text_in_json(
-            config, "phoneme_type", "espeak", "PhonemeType.ESPEAK"
-        )
+    replace_text_in_json(
+        config, "phoneme_type", "espeak", "PhonemeType.ESPEAK"
+    )
+
+    with open(config, "r", encoding="utf-8") as config_file:
+        config_dict = json.load(config_file)
+
+    # Each segment runs on its own thread; an op uses the intra-op threads
+    sess_options = rt.SessionOptions()
+    sess_options.intra_op_num_threads = max(1, intra_op_threads)
+    sess_options.inter_op_num_threads = 1
+    sess_options.execution_mode = rt.ExecutionMode.ORT_SEQUENTIAL
+    sess_options.graph_optimization_level = (
+        rt.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    providers = (
+        ["CUDAExecutionProvider"] if cuda else ["CPUExecutionProvider"]
+    )
 
     # Load voice
-    voice = PiperVoice.load(model, config_path=config, use_cuda=cuda)
+    voice = PiperVoice(
+        config=PiperConfig.from_dict(config_dict),
+        session=rt.InferenceSession(
+            str(model), sess_options=sess_options, providers=providers
+        ),
+    )
 
     return voice
 
 
-def synthesize_text_to_audio_np_array(voice, text, synthesize_args):
-    audio_stream = voice.synthesize_stream_raw(text, **synthesize_args)
+_piper_voices = OrderedDict()
+_piper_voices_lock = threading.Lock()
+# espeak-ng keeps global state, phonemization runs one text at a time
+_piper_phonemize_lock = threading.Lock()
+
+
+def get_piper_voice(model, data_dir, download_dir, cuda):
+    """Piper voice of the model, loaded once and kept in an LRU pool."""
+    key = (model, cuda)
+    with _piper_voices_lock:
+        if key in _piper_voices:
+            _piper_voices.move_to_end(key)
+            return _piper_voices[key]
+
+        logger.debug(f"Loading Piper voice {model}")
+        _piper_voices[key] = load_piper_model(
+            model, data_dir, download_dir, cuda=cuda
+        )
+        while len(_piper_voices) > max(1, PIPER_SESSION_POOL_SIZE):
+            _piper_voices.popitem(last=False)
+        return _piper_voices[key]
 
-    # Collect the audio bytes into a single NumPy array
-    audio_data = b""
-    for audio_bytes in audio_stream:
-        audio_data += audio_bytes
 
-    # Ensure correct data type and convert audio bytes to NumPy array
-    audio_np = np.frombuffer(audio_data, dtype=np.int16)
+def release_piper_voices():
+    """Drop the loaded Piper voices."""
+    with _piper_voices_lock:
+        _piper_voices.clear()
+    gc.collect()
+
+
+def synthesize_text_to_audio_np_array(voice, text, synthesize_args):
+    synthesize_args = dict(synthesize_args)
+    sentence_silence = synthesize_args.pop("sentence_silence", 0.0)
+
+    # Phonemes under the lock, the ONNX inference of each sentence runs
+    # in parallel with the other threads
+    with _piper_phonemize_lock:
+        sentence_phonemes = voice.phonemize(text)
+    sentences = [
+        np.frombuffer(
+            voice.synthesize_ids_to_raw(
+                voice.phonemes_to_ids(phonemes), **synthesize_args
+            ),
+            dtype=np.int16,
+        )
+        for phonemes in sentence_phonemes
+    ]
+
+    # Copy the sentences into one preallocated buffer, the silence
+    # between them is already zero
+    silence = int(sentence_silence * voice.config.sample_rate)
+    audio_np = np.zeros(
+        sum(len(sentence) + silence for sentence in sentences),
+        dtype=np.int16,
+    )
+    position = 0
+    for sentence in sentences:
+        audio_np[position:position + len(sentence)] = sentence
+        position += len(sentence) + silence
     return audio_np
 
 
-def segments_vits_onnx_tts(filtered_onnx_vits_segments, TRANSLATE_AUDIO_TO):
+def segments_vits_onnx_tts(
+    filtered_onnx_vits_segments,
+    TRANSLATE_AUDIO_TO,
+    workers=PIPER_WORKERS,
+    workspace=None,
+):
     """
+    Synthesize the Piper segments on a pool of `workers` threads. The
+    voices stay loaded between calls and are downloaded from the local
+    voice catalog when missing.
+
     Install:
     pip install -q piper-tts==1.2.0 onnxruntime-gpu # for cuda118
     """
 
+    workspace = workspace or Workspace()
+
     data_dir = [
         str(Path.cwd())
     ]  # "Data directory to check for downloaded models (default: current directory)"
     download_dir = "PIPER_MODELS"
     # model_name = "en_US-lessac-medium" tts_name in a dict like VITS
-    update_voices = True  # "Download latest voices.json during startup",
-
-    synthesize_args = {
-        "speaker_id": None,
-        "length_scale": 1.0,
-        "noise_scale": 0.667,
-        "noise_w": 0.8,
-        "sentence_silence": 0.0,
-    }
+
+    synthesize_args = PIPER_SYNTHESIZE_ARGS
 
     filtered_segments = filtered_onnx_vits_segments["segments"]
     # Sorting the segments by 'tts_name'
     sorted_segments = sorted(filtered_segments, key=lambda x: x["tts_name"])
     logger.debug(sorted_segments)
 
-    model_name_key = None
-    for segment in tqdm(sorted_segments):
-        speaker = segment["speaker"] # noqa
-        text = segment["text"]
-        start = segment["start"]
+    # Load every voice before the pool starts
+    cuda = piper_use_cuda()
+    models = {}
+    for segment in sorted_segments:
         tts_name = segment["tts_name"].replace(" VITS-onnx", "")
-
-        if tts_name != model_name_key:
-            model_name_key = tts_name
-            model = load_piper_model(
-                tts_name, data_dir, download_dir, update_voices
+        if tts_name not in models:
+            models[tts_name] = get_piper_voice(
+                tts_name, data_dir, download_dir, cuda
             )
-            sampling_rate = model.config.sample_rate
+
+    def synthesize_segment(segment):
+        text = segment["text"]
+        start = segment["start"]
+        model = models[segment["tts_name"].replace(" VITS-onnx", "")]
+        sampling_rate = model.config.sample_rate
 
         # make the tts audio
-        filename = f"audio/{start}.ogg"
+        filename = workspace.tts_clip(start)
         logger.info(f"{text} >> {filename}")
         try:
             # Infer
@@ -894,27 +1376,61 @@ def segments_vits_onnx_tts(filtered_onnx_vits_segments, TRANSLATE_AUDIO_TO):
                 speech_output,  # .cpu().numpy().squeeze().astype(np.float32),
                 sampling_rate,
             )
-            # Save file
-            write_chunked(
-                file=filename,
-                samplerate=sampling_rate,
-                data=data_tts,
-                format="ogg",
-                subtype="vorbis",
-            )
-            verify_saved_file_and_size(filename)
+            save_tts_clip(filename, data_tts, sampling_rate, workspace)
         except Exception as error:
             error_handling_in_tts(error, segment, TRANSLATE_AUDIO_TO, filename)
-        gc.collect()
-        torch.cuda.empty_cache()
-    try:
-        del model
-        gc.collect()
-        torch.cuda.empty_cache()
-    except Exception as error:
-        logger.error(str(error))
-        gc.collect()
-        torch.cuda.empty_cache()
+
+    time_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(
+            tqdm(
+                executor.map(synthesize_segment, sorted_segments),
+                total=len(sorted_segments),
+            )
+        )
+    elapsed = time.perf_counter() - time_start
+
+    logger.info(
+        f"Piper TTS: {len(sorted_segments)} segments in {elapsed:.1f}s, "
+        f"{len(sorted_segments) / max(elapsed, 1e-6):.2f} segments/s "
+        f"({'GPU' if cuda else 'CPU'}, {max(1, workers)} workers)"
+    )
+
+
+def benchmark_piper_tts(
+    model_name="en_US-lessac-medium",
+    segments=32,
+    workers=(1, 2, 4),
+):
+    """
+    CPU throughput of the Piper synthesis on the same sentence.
+
+    Returns:
+        dict: workers -> (elapsed seconds, segments per second)
+    """
+    data_dir = [str(Path.cwd())]
+    voice = get_piper_voice(model_name, data_dir, "PIPER_MODELS", False)
+    text = "The quick brown fox jumps over the lazy dog near the river."
+
+    results = {}
+    for num_workers in workers:
+        time_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+            list(
+                executor.map(
+                    lambda _: synthesize_text_to_audio_np_array(
+                        voice, text, PIPER_SYNTHESIZE_ARGS
+                    ),
+                    range(segments),
+                )
+            )
+        elapsed = time.perf_counter() - time_start
+        results[num_workers] = (elapsed, segments / elapsed)
+        logger.info(
+            f"Piper {num_workers} workers: {elapsed:.1f}s, "
+            f"{segments / elapsed:.2f} segments/s"
+        )
+    return results
 
 
 # =====================================
@@ -923,10 +1439,12 @@ def segments_vits_onnx_tts(filtered_onnx_vits_segments, TRANSLATE_AUDIO_TO):
 
 
 def segments_openai_tts(
-    filtered_openai_tts_segments, TRANSLATE_AUDIO_TO
+    filtered_openai_tts_segments, TRANSLATE_AUDIO_TO, workspace=None
 ):
     from openai import OpenAI
 
+    workspace = workspace or Workspace()
+
     client = OpenAI()
     sampling_rate = 24000
 
@@ -941,7 +1459,7 @@ def segments_openai_tts(
         tts_name = segment["tts_name"]
 
         # make the tts audio
-        filename = f"audio/{start}.ogg"
+        filename = workspace.tts_clip(start)
         logger.info(f"{text} >> {filename}")
 
         try:
@@ -953,26 +1471,15 @@ def segments_openai_tts(
                 input=text
             )
 
-            audio_bytes = b''
-            for data in response.iter_bytes(chunk_size=4096):
-                audio_bytes += data
+            audio_bytes = b"".join(response.iter_bytes(chunk_size=4096))
 
             speech_output = np.frombuffer(audio_bytes, dtype=np.int16)
 
-            # Save file
             data_tts = pad_array(
                 speech_output[240:],
                 sampling_rate,
             )
-
-            write_chunked(
-                file=filename,
-                samplerate=sampling_rate,
-                data=data_tts,
-                format="ogg",
-                subtype="vorbis",
-            )
-            verify_saved_file_and_size(filename)
+            save_tts_clip(filename, data_tts, sampling_rate, workspace)
 
         except Exception as error:
             error_handling_in_tts(error, segment, TRANSLATE_AUDIO_TO, filename)
@@ -1003,6 +1510,66 @@ def filter_by_speaker(speakers, segments):
     }
 
 
+def tts_cache_key(
+    segment,
+    TRANSLATE_AUDIO_TO,
+    model_id_bark,
+    model_id_coqui,
+    dereverb_automatic,
+    file_hashes,
+    source_audio="audio.wav",
+    reference_bounds=None,
+):
+    """Clip cache key for a segment, or None when it can't be cached.
+    `file_hashes` memoizes the reference audio hashes of one run and
+    `reference_bounds` has the automatic_reference_bounds of each
+    speaker."""
+    tts_name = segment["tts_name"]
+    text = segment["text"]
+    params = {"language": TRANSLATE_AUDIO_TO}
+
+    if re.match(r".*-(Male|Female)$", tts_name):
+        backend = "edge"
+        model = tts_name.replace("-Male", "").replace("-Female", "")
+    elif tts_name.endswith(" BARK"):
+        backend = "bark"
+        model = model_id_bark
+        params.update(BARK_GENERATE_ARGS, voice=BARK_VOICES_LIST[tts_name])
+    elif tts_name.endswith(" VITS"):
+        backend = "vits"
+        model = VITS_VOICES_LIST[tts_name]
+    elif tts_name.endswith(" VITS-onnx"):
+        backend = "piper"
+        model = tts_name.replace(" VITS-onnx", "")
+        params.update(PIPER_SYNTHESIZE_ARGS)
+    elif tts_name.endswith(" OpenAI-TTS"):
+        backend = "openai"
+        model = "tts-1-hd" if "HD" in tts_name else "tts-1"
+        params["voice"] = tts_name.split()[0][1:]
+        text = text.strip()
+    elif re.match(r".+\.(wav|mp3|ogg|m4a)$", tts_name):
+        backend = "xtts"
+        model = model_id_coqui
+        reference = tts_name
+        if tts_name == "_XTTS_/AUTOMATIC.wav":
+            # The reference is cut from the source audio of this speaker
+            reference = source_audio
+            bounds = (reference_bounds or {}).get(segment["speaker"])
+            if bounds is None:
+                return None
+            params["reference_bounds"] = [round(t, 3) for t in bounds]
+            params["dereverb"] = dereverb_automatic
+        if not os.path.exists(reference):
+            return None
+        if reference not in file_hashes:
+            file_hashes[reference] = hash_file(reference)
+        params["reference"] = file_hashes[reference]
+    else:
+        return None
+
+    return TTSClipCache.make_key(backend, model, params, text)
+
+
 def audio_segmentation_to_voice(
     result_diarize,
     TRANSLATE_AUDIO_TO,
@@ -1023,9 +1590,12 @@ def audio_segmentation_to_voice(
     model_id_bark="suno/bark-small",
     model_id_coqui="tts_models/multilingual/multi-dataset/xtts_v2",
     delete_previous_automatic=True,
+    use_clip_cache=True,
+    workspace=None,
 ):
 
-    remove_directory_contents("audio")
+    workspace = workspace or Workspace()
+    workspace.clean("audio")
 
     # Mapping speakers to voice variables
     speaker_to_voice = {
@@ -1075,44 +1645,116 @@ def audio_segmentation_to_voice(
         pattern_openai_tts, speaker_to_voice, all_segments
     )
 
+    # Clips already synthesized with the same text, voice and params
+    clip_cache = get_tts_clip_cache() if use_clip_cache else None
+    cache_keys = {}
+    file_hashes = {}
+    pending_segments = all_segments
+    if clip_cache:
+        reference_bounds = {
+            speaker: automatic_reference_bounds(all_segments, speaker)
+            for speaker in speakers_coqui
+        }
+        pending_segments = []
+        for segment in all_segments:
+            try:
+                key = tts_cache_key(
+                    segment,
+                    TRANSLATE_AUDIO_TO,
+                    model_id_bark,
+                    model_id_coqui,
+                    dereverb_automatic,
+                    file_hashes,
+                    workspace.path("audio.wav"),
+                    reference_bounds,
+                )
+            except Exception as error:
+                logger.debug(f"TTS cache key: {str(error)}")
+                key = None
+            content = clip_cache.fetch(key) if key else None
+            if content:
+                try:
+                    workspace.clips.put_encoded(
+                        workspace.tts_clip(segment["start"]), content
+                    )
+                    continue
+                except Exception as error:
+                    logger.warning(f"TTS cache entry {key}: {str(error)}")
+            cache_keys[id(segment)] = key
+            pending_segments.append(segment)
+        logger.info(
+            f"TTS cache: {len(all_segments) - len(pending_segments)} of "
+            f"{len(all_segments)} clips reused"
+        )
+
     # Filter method in segments
-    filtered_edge = filter_by_speaker(speakers_edge, all_segments)
-    filtered_bark = filter_by_speaker(speakers_bark, all_segments)
-    filtered_vits = filter_by_speaker(speakers_vits, all_segments)
-    filtered_coqui = filter_by_speaker(speakers_coqui, all_segments)
-    filtered_vits_onnx = filter_by_speaker(speakers_vits_onnx, all_segments)
-    filtered_openai_tts = filter_by_speaker(speakers_openai_tts, all_segments)
+    filtered_edge = filter_by_speaker(speakers_edge, pending_segments)
+    filtered_bark = filter_by_speaker(speakers_bark, pending_segments)
+    filtered_vits = filter_by_speaker(speakers_vits, pending_segments)
+    filtered_coqui = filter_by_speaker(speakers_coqui, pending_segments)
+    filtered_vits_onnx = filter_by_speaker(
+        speakers_vits_onnx, pending_segments
+    )
+    filtered_openai_tts = filter_by_speaker(
+        speakers_openai_tts, pending_segments
+    )
 
     # Infer
     if filtered_edge["segments"]:
         logger.info(f"EDGE TTS: {speakers_edge}")
-        segments_egde_tts(filtered_edge, TRANSLATE_AUDIO_TO, is_gui)  # mp3
+        segments_egde_tts(
+            filtered_edge, TRANSLATE_AUDIO_TO, is_gui, workspace=workspace
+        )  # mp3
     if filtered_bark["segments"]:
         logger.info(f"BARK TTS: {speakers_bark}")
         segments_bark_tts(
-            filtered_bark, TRANSLATE_AUDIO_TO, model_id_bark
+            filtered_bark,
+            TRANSLATE_AUDIO_TO,
+            model_id_bark,
+            workspace=workspace,
         )  # wav
     if filtered_vits["segments"]:
         logger.info(f"VITS TTS: {speakers_vits}")
-        segments_vits_tts(filtered_vits, TRANSLATE_AUDIO_TO)  # wav
+        segments_vits_tts(
+            filtered_vits, TRANSLATE_AUDIO_TO, workspace=workspace
+        )  # wav
     if filtered_coqui["segments"]:
         logger.info(f"Coqui TTS: {speakers_coqui}")
         segments_coqui_tts(
             filtered_coqui,
             TRANSLATE_AUDIO_TO,
             model_id_coqui,
-            speakers_coqui,
+            find_spkr(pattern_coqui, speaker_to_voice, pending_segments),
             delete_previous_automatic,
             dereverb_automatic,
+            workspace=workspace,
+            reference_segments=all_segments,
         )  # wav
     if filtered_vits_onnx["segments"]:
         logger.info(f"PIPER TTS: {speakers_vits_onnx}")
-        segments_vits_onnx_tts(filtered_vits_onnx, TRANSLATE_AUDIO_TO)  # wav
+        segments_vits_onnx_tts(
+            filtered_vits_onnx, TRANSLATE_AUDIO_TO, workspace=workspace
+        )  # wav
     if filtered_openai_tts["segments"]:
         logger.info(f"OpenAI TTS: {speakers_openai_tts}")
-        segments_openai_tts(filtered_openai_tts, TRANSLATE_AUDIO_TO)  # wav
+        segments_openai_tts(
+            filtered_openai_tts, TRANSLATE_AUDIO_TO, workspace
+        )  # wav
+
+    if clip_cache:
+        cached = [
+            (cache_keys.get(id(segment)), workspace.tts_clip(segment["start"]))
+            for segment in pending_segments
+            if cache_keys.get(id(segment)) and not segment.get("tts_error")
+        ]
+        # Encoded from the clip store; the clip files are not written
+        for key, filename in cached:
+            if filename in workspace.clips:
+                clip_cache.store(key, workspace.clips.encode(filename))
+        logger.debug(f"TTS cache stats: {clip_cache.get_cache_stats()}")
 
     [result.pop("tts_name", None) for result in result_diarize["segments"]]
+    [result.pop("tts_error", None) for result in result_diarize["segments"]]
     return [
         speakers_edge,
         speakers_bark,
@@ -1123,14 +1765,64 @@ def audio_segmentation_to_voice(
     ]
 
 
+def atempo_command(jobs):
+    """
+    One ffmpeg call that time-stretches several clips, from and to raw
+    mono float32 files, so the samples are never re-encoded.
+
+    Parameters:
+    - jobs (list): (input file, tempo, output file, sample rate) tuples.
+    """
+    command = ["ffmpeg", "-y", "-loglevel", "error"]
+    for filename, _, _, sample_rate in jobs:
+        command += ["-f", "f32le", "-ar", str(sample_rate), "-ac", "1"]
+        command += ["-i", filename]
+
+    graph = ";".join(
+        f"[{i}:a]atempo={job[1]}[a{i}]" for i, job in enumerate(jobs)
+    )
+    command += ["-filter_complex", graph]
+    for i, (_, _, output, _) in enumerate(jobs):
+        command += ["-map", f"[a{i}]", "-f", "f32le", output]
+    return command
+
+
+def apply_atempo(
+    jobs, workers=ACCELERATE_WORKERS, chunk_size=ACCELERATE_CHUNK_SIZE
+):
+    """Run the tempo changes in chunks over a bounded pool of ffmpeg
+    processes. A failed chunk is retried clip by clip."""
+    chunk_size = max(1, chunk_size)
+    chunks = [
+        jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)
+    ]
+
+    def run_chunk(chunk):
+        try:
+            run_command(atempo_command(chunk))
+        except Exception as error:
+            if len(chunk) == 1:
+                logger.error(f"Error acceleration {chunk[0][0]}: {str(error)}")
+                return
+            logger.debug(str(error))
+            for job in chunk:
+                run_chunk([job])
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(run_chunk, chunks))
+
+
 def accelerate_segments(
     result_diarize,
     max_accelerate_audio,
     valid_speakers,
     acceleration_rate_regulation=False,
     folder_output="audio2",
+    return_durations=False,
+    workspace=None,
 ):
     logger.info("Apply acceleration")
+    workspace = workspace or Workspace()
 
     (
         speakers_edge,
@@ -1141,29 +1833,35 @@ def accelerate_segments(
         speakers_openai_tts
     ) = valid_speakers
 
-    create_directories(f"{folder_output}/audio/")
-    remove_directory_contents(f"{folder_output}/audio/")
+    workspace.clean(os.path.join(folder_output, "audio"))
+    clips = workspace.clips
 
     audio_files = []
     speakers_list = []
+    new_durations = []
+    atempo_jobs = []
 
     max_count_segments_idx = len(result_diarize["segments"]) - 1
 
+    # find name audio
+    filenames = [
+        workspace.tts_clip(segment["start"])
+        for segment in result_diarize["segments"]
+    ]
+    # Stored by the TTS stage; clips restored from a cache are decoded
+    tts_clips = clips.get_many(filenames)
+
     for i, segment in tqdm(enumerate(result_diarize["segments"])):
         text = segment["text"] # noqa
         start = segment["start"]
         end = segment["end"]
         speaker = segment["speaker"]
-
-        # find name audio
-        # if speaker in speakers_edge:
-        filename = f"audio/{start}.ogg"
-        # elif speaker in speakers_bark + speakers_vits + speakers_coqui + speakers_vits_onnx:
-        #    filename = f"audio/{start}.wav" # wav
+        filename = filenames[i]
+        output_file = workspace.acc_clip(start, folder_output)
 
         # duration
         duration_true = end - start
-        duration_tts = librosa.get_duration(filename=filename)
+        duration_tts = tts_clips[i].duration
 
         # Accelerate percentage
         acc_percentage = duration_tts / duration_true
@@ -1206,34 +1904,48 @@ def accelerate_segments(
         # Round
         acc_percentage = round(acc_percentage + 0.0, 1)
 
-        # Format read if need
-        if speaker in speakers_edge:
-            info_enc = sf.info(filename).format
+        # Apply aceleration or opposite to the clip of folder_output
+        if acc_percentage == 1.0:
+            clips.link(filename, output_file)
         else:
-            info_enc = "OGG"
+            atempo_jobs.append((filename, acc_percentage, output_file))
 
-        # Apply aceleration or opposite to the audio file in folder_output folder
-        if acc_percentage == 1.0 and info_enc == "OGG":
-            copy_files(filename, f"{folder_output}{os.sep}audio")
-        else:
-            os.system(
-                f"ffmpeg -y -loglevel panic -i {filename} -filter:a atempo={acc_percentage} {folder_output}/{filename}"
-            )
+        duration_create = duration_tts / acc_percentage
+        new_durations.append(duration_create)
 
         if logger.isEnabledFor(logging.DEBUG):
-            duration_create = librosa.get_duration(
-                filename=f"{folder_output}/{filename}"
-            )
             logger.debug(
                 f"acc_percen is {acc_percentage}, tts duration "
                 f"is {duration_tts}, new duration is {duration_create}"
                 f", for {filename}"
             )
 
-        audio_files.append(f"{folder_output}/{filename}")
+        audio_files.append(output_file)
         speaker = "TTS Speaker {:02d}".format(int(speaker[-2:]) + 1)
         speakers_list.append(speaker)
 
+    if atempo_jobs:
+        logger.debug(f"Time-stretching {len(atempo_jobs)} clips")
+        raw_jobs = []
+        for filename, tempo, output_file in atempo_jobs:
+            raw_input, sample_rate = clips.raw_input(filename)
+            raw_jobs.append(
+                (raw_input, tempo, clips.raw_output(), sample_rate)
+            )
+        apply_atempo(raw_jobs)
+
+        for (_, _, output_file), (_, _, raw_output, sample_rate) in zip(
+            atempo_jobs, raw_jobs
+        ):
+            try:
+                clips.put_raw(output_file, raw_output, sample_rate)
+            except Exception as error:
+                logger.error(f"Error acceleration {output_file}: {error}")
+
+    logger.debug(f"Clip store: {clips.get_stats()}")
+
+    if return_durations:
+        return audio_files, speakers_list, new_durations
     return audio_files, speakers_list
 
 
@@ -1271,11 +1983,13 @@ def create_wav_vc(
     max_segments=10,
     target_dir="processed",
     get_vocals_dereverb=False,
+    workspace=None,
 ):
     # valid_speakers = list({item['speaker'] for item in segments_base})
+    workspace = workspace or Workspace()
 
     # Before function delete automatic delete_previous_automatic
-    output_dir = os.path.join(".", target_dir)  # remove content
+    output_dir = workspace.path(target_dir)  # remove content
     # remove_directory_contents(output_dir)
 
     path_source_segments = []
@@ -1321,14 +2035,15 @@ def create_wav_vc(
                 else:
                     create_wav_file_vc(
                         sample_name=name_new_wav,
-                        audio_wav="audio.wav",
+                        audio_wav=workspace.path("audio.wav"),
                         start=(float(seg["start"]) + 1.0),
                         end=(float(seg["end"]) - 1.0),
                         output_final_path=dir_path_speaker,
                         get_vocals_dereverb=get_vocals_dereverb,
+                        workspace=workspace,
                     )
 
-                    file_name_tts = f"audio2/audio/{str(seg['start'])}.ogg"
+                    file_name_tts = workspace.acc_clip(seg["start"])
                     # copy_files(file_name_tts, os.path.join(output_dir, dir_name_speaker_tts)
                     convert_to_xtts_good_sample(
                         file_name_tts, dir_path_speaker_tts
@@ -1350,14 +2065,15 @@ def create_wav_vc(
             name_new_wav = str(seg["start"])
             create_wav_file_vc(
                 sample_name=name_new_wav,
-                audio_wav="audio.wav",
+                audio_wav=workspace.path("audio.wav"),
                 start=(float(seg["start"])),
                 end=(float(seg["start"]) + max_duration),
                 output_final_path=dir_path_speaker,
                 get_vocals_dereverb=get_vocals_dereverb,
+                workspace=workspace,
             )
 
-            file_name_tts = f"audio2/audio/{str(seg['start'])}.ogg"
+            file_name_tts = workspace.acc_clip(seg["start"])
             # copy_files(file_name_tts, os.path.join(output_dir, dir_name_speaker_tts)
             convert_to_xtts_good_sample(file_name_tts, dir_path_speaker_tts)
 
@@ -1373,11 +2089,12 @@ def toneconverter_openvoice(
     remove_previous_process=True,
     get_vocals_dereverb=False,
     model="openvoice",
+    workspace=None,
 ):
-    audio_path = "audio.wav"
+    workspace = workspace or Workspace()
+    audio_path = workspace.path("audio.wav")
     # se_path = "se.pth"
     target_dir = "processed"
-    create_directories(target_dir)
 
     from openvoice import se_extractor
     from openvoice.api import ToneColorConverter
@@ -1394,14 +2111,16 @@ def toneconverter_openvoice(
     logger.info("Openvoice preprocessor...")
 
     if remove_previous_process:
-        remove_directory_contents(target_dir)
+        workspace.clean(target_dir)
 
     path_source_segments, path_target_segments = create_wav_vc(
         valid_speakers,
         result_diarize["segments"],
         audio_name,
         max_segments=preprocessor_max_segments,
+        target_dir=target_dir,
         get_vocals_dereverb=get_vocals_dereverb,
+        workspace=workspace,
     )
 
     logger.info("Openvoice loading model...")
@@ -1450,7 +2169,7 @@ def toneconverter_openvoice(
         for seg in filtered_speaker:
             src_path = (
                 save_path
-            ) = f"audio2/audio/{str(seg['start'])}.ogg"  # overwrite
+            ) = workspace.acc_clip(seg["start"])  # overwrite
             logger.debug(f"{src_path}")
 
             tone_color_converter.convert(
@@ -1479,10 +2198,11 @@ def toneconverter_freevc(
     result_diarize,
     remove_previous_process=True,
     get_vocals_dereverb=False,
+    workspace=None,
 ):
-    audio_path = "audio.wav"
+    workspace = workspace or Workspace()
+    audio_path = workspace.path("audio.wav")
     target_dir = "processed"
-    create_directories(target_dir)
 
     from openvoice import se_extractor
 
@@ -1496,14 +2216,16 @@ def toneconverter_freevc(
     logger.info("FreeVC preprocessor...")
 
     if remove_previous_process:
-        remove_directory_contents(target_dir)
+        workspace.clean(target_dir)
 
     path_source_segments, path_target_segments = create_wav_vc(
         valid_speakers,
         result_diarize["segments"],
         audio_name,
         max_segments=1,
+        target_dir=target_dir,
         get_vocals_dereverb=get_vocals_dereverb,
+        workspace=workspace,
     )
 
     logger.info("FreeVC loading model...")
@@ -1541,7 +2263,7 @@ def toneconverter_freevc(
 
             src_path = (
                   save_path
-              ) = f"audio2/audio/{str(seg['start'])}.ogg"  # overwrite
+              ) = workspace.acc_clip(seg["start"])  # overwrite
             logger.debug(f"{src_path} - {original_wav_audio_segment}")
 
             wav = tts.voice_conversion(
@@ -1576,28 +2298,48 @@ def toneconverter(
     preprocessor_max_segments,
     remove_previous_process=True,
     get_vocals_dereverb=False,
-    method_vc="freevc"
+    method_vc="freevc",
+    workspace=None,
 ):
 
-    if method_vc == "freevc":
-        if preprocessor_max_segments > 1:
-            logger.info("FreeVC only uses one segment.")
-        return toneconverter_freevc(
-                    result_diarize,
-                    remove_previous_process=remove_previous_process,
-                    get_vocals_dereverb=get_vocals_dereverb,
-                )
-    elif "openvoice" in method_vc:
-        return toneconverter_openvoice(
-                    result_diarize,
-                    preprocessor_max_segments,
-                    remove_previous_process=remove_previous_process,
-                    get_vocals_dereverb=get_vocals_dereverb,
-                    model=method_vc,
-                )
+    from .mdx_net import release_mdx_sessions
+
+    try:
+        if method_vc == "freevc":
+            if preprocessor_max_segments > 1:
+                logger.info("FreeVC only uses one segment.")
+            return toneconverter_freevc(
+                        result_diarize,
+                        remove_previous_process=remove_previous_process,
+                        get_vocals_dereverb=get_vocals_dereverb,
+                        workspace=workspace,
+                    )
+        elif "openvoice" in method_vc:
+            return toneconverter_openvoice(
+                        result_diarize,
+                        preprocessor_max_segments,
+                        remove_previous_process=remove_previous_process,
+                        get_vocals_dereverb=get_vocals_dereverb,
+                        model=method_vc,
+                        workspace=workspace,
+                    )
+    finally:
+        # The reference samples are separated segment by segment
+        release_mdx_sessions()
 
 
 if __name__ == "__main__":
+    import sys
+
+    if "--benchmark" in sys.argv:
+        for backend, tts_name in (
+            ("vits", "en-facebook-mms VITS"),
+            ("bark", "en_speaker_0-Male BARK"),
+        ):
+            benchmark_tts_batching(backend, tts_name)
+        benchmark_piper_tts()
+        sys.exit(0)
+
     from segments import result_diarize
 
     audio_segmentation_to_voice(
@@ -1,12 +1,19 @@
 from tqdm import tqdm
-from deep_translator import GoogleTranslator
 from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
 import copy
 from .language_configuration import fix_code_language, INVERTED_LANGUAGES
 from .logging_setup import logger
+from .startup import lazy_import
 import re
+import os
 import json
 import time
+import threading
+
+# requests and the parsers of every translator: loaded on the first use
+deep_translator = lazy_import("deep_translator")
 
 TRANSLATION_PROCESS_OPTIONS = [
     "google_translator_batch",
@@ -24,8 +31,98 @@ DOCS_TRANSLATION_PROCESS_OPTIONS = [
     "disable_translation",
 ]
 
+# Parallel requests and the shared limit in requests per second
+GOOGLE_TRANSLATE_WORKERS = int(os.environ.get("GOOGLE_TRANSLATE_WORKERS", 4))
+GOOGLE_TRANSLATE_RATE = float(os.environ.get("GOOGLE_TRANSLATE_RATE", 5.0))
+# GPT batch requests in flight
+GPT_BATCH_MAX_IN_FLIGHT = int(os.environ.get("GPT_BATCH_MAX_IN_FLIGHT", 4))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket; `rate` tokens per second with bursts of up to
+    `capacity`. A rate <= 0 disables the limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConcurrentTranslator:
+    """
+    Runs translate calls on a thread pool under one rate limit.
 
-def translate_iterative(segments, target, source=None):
+    Parameters:
+    - source, target (str): Language codes.
+    - workers (int): Requests in flight.
+    - rate (float): Requests per second shared by all workers.
+    - translator_factory (callable, optional): Builds an object with a
+        `translate(text)` method from `source` and `target` keywords,
+        `GoogleTranslator` by default. Each worker thread gets its own.
+    """
+
+    def __init__(
+        self,
+        source,
+        target,
+        workers=GOOGLE_TRANSLATE_WORKERS,
+        rate=GOOGLE_TRANSLATE_RATE,
+        translator_factory=None,
+    ):
+        self.source = source
+        self.target = target
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(rate)
+        self.translator_factory = (
+            translator_factory or deep_translator.GoogleTranslator
+        )
+        self._local = threading.local()
+
+    def translate(self, text):
+        translator = getattr(self._local, "translator", None)
+        if translator is None:
+            translator = self.translator_factory(
+                source=self.source, target=self.target
+            )
+            self._local.translator = translator
+        self.bucket.acquire()
+        return translator.translate(text)
+
+    def map(self, func, items):
+        """Ordered results of `func` over `items`, run concurrently."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(func, items))
+
+
+def translate_iterative(
+    segments,
+    target,
+    source=None,
+    workers=GOOGLE_TRANSLATE_WORKERS,
+    rate=GOOGLE_TRANSLATE_RATE,
+    translator_factory=None,
+):
     """
     Translate text segments individually to the specified language.
 
@@ -34,12 +131,13 @@ def translate_iterative(segments, target, source=None):
         segment text.
     - target (str): Target language code.
     - source (str, optional): Source language code. Defaults to None.
+    - workers, rate, translator_factory: See `ConcurrentTranslator`.
 
     Returns:
     - list: Translated text segments in the target language.
 
     Notes:
-    - Translates each segment using Google Translate.
+    - Translates the segments concurrently using Google Translate.
 
     Example:
     segments = [{'text': 'first segment.'}, {'text': 'second segment.'}]
@@ -54,12 +152,23 @@ def translate_iterative(segments, target, source=None):
         logger.debug("No source language")
         source = "auto"
 
-    translator = GoogleTranslator(source=source, target=target)
+    engine = ConcurrentTranslator(
+        source, target, workers, rate, translator_factory
+    )
+    progress_bar = tqdm(total=len(segments_), desc="Translating")
+
+    def translate_line(segment):
+        translated_line = engine.translate(segment["text"].strip())
+        progress_bar.update(1)
+        return translated_line
+
+    try:
+        translated_lines = engine.map(translate_line, segments_)
+    finally:
+        progress_bar.close()
 
-    for line in tqdm(range(len(segments_))):
-        text = segments_[line]["text"]
-        translated_line = translator.translate(text.strip())
-        segments_[line]["text"] = translated_line
+    for segment, translated_line in zip(segments_, translated_lines):
+        segment["text"] = translated_line
 
     return segments_
 
@@ -69,7 +178,8 @@ def verify_translate(
     segments_copy,
     translated_lines,
     target,
-    source
+    source,
+    translator_factory=None,
 ):
     """
     Verify integrity and translate segments if lengths match, otherwise
@@ -89,10 +199,20 @@ def verify_translate(
             "The translation failed, switching to google_translate iterative. "
             f"{len(segments), len(translated_lines)}"
         )
-        return translate_iterative(segments, target, source)
+        return translate_iterative(
+            segments, target, source, translator_factory=translator_factory
+        )
 
 
-def translate_batch(segments, target, chunk_size=2000, source=None):
+def translate_batch(
+    segments,
+    target,
+    chunk_size=2000,
+    source=None,
+    workers=GOOGLE_TRANSLATE_WORKERS,
+    rate=GOOGLE_TRANSLATE_RATE,
+    translator_factory=None,
+):
     """
     Translate a batch of text segments into the specified language in chunks,
         respecting the character limit.
@@ -104,6 +224,7 @@ def translate_batch(segments, target, chunk_size=2000, source=None):
     - chunk_size (int, optional): Maximum character limit for each translation
         chunk (default is 2000; max 5000).
     - source (str, optional): Source language code. Defaults to None.
+    - workers, rate, translator_factory: See `ConcurrentTranslator`.
 
     Returns:
     - list: Translated text segments in the target language.
@@ -111,9 +232,9 @@ def translate_batch(segments, target, chunk_size=2000, source=None):
     Notes:
     - Splits input segments into chunks respecting the character limit for
         translation.
-    - Translates the chunks using Google Translate.
-    - If chunked translation fails, switches to iterative translation using
-        `translate_iterative()`.
+    - Translates the chunks in parallel using Google Translate.
+    - A chunk that fails or returns a different number of lines is
+        translated line by line on its own; the other chunks are kept.
 
     Example:
     segments = [{'text': 'first segment.'}, {'text': 'second segment.'}]
@@ -157,25 +278,38 @@ def translate_batch(segments, target, chunk_size=2000, source=None):
 
     # translate chunks
     progress_bar = tqdm(total=len(segments), desc="Translating")
-    translator = GoogleTranslator(source=source, target=target)
-    split_list = []
-    try:
-        for text, text_iterable in zip(text_merge, global_text_list):
-            translated_line = translator.translate(text.strip())
+    engine = ConcurrentTranslator(
+        source, target, workers, rate, translator_factory
+    )
+
+    def translate_chunk(chunk):
+        text, text_iterable = chunk
+        try:
+            translated_line = engine.translate(text.strip())
             split_text = translated_line.split("|||||")
             if len(split_text) == len(text_iterable):
                 progress_bar.update(len(split_text))
-            else:
-                logger.debug(
-                    "Chunk fixing iteratively. Len chunk: "
-                    f"{len(split_text)}, expected: {len(text_iterable)}"
-                )
-                split_text = []
-                for txt_iter in text_iterable:
-                    translated_txt = translator.translate(txt_iter.strip())
-                    split_text.append(translated_txt)
-                    progress_bar.update(1)
-            split_list.append(split_text)
+                return split_text
+            logger.debug(
+                "Chunk fixing iteratively. Len chunk: "
+                f"{len(split_text)}, expected: {len(text_iterable)}"
+            )
+        except Exception as error:
+            logger.warning(
+                f"Chunk failed, translating its lines: {str(error)}"
+            )
+
+        split_text = []
+        for txt_iter in text_iterable:
+            translated_txt = engine.translate(txt_iter.strip())
+            split_text.append(translated_txt)
+            progress_bar.update(1)
+        return split_text
+
+    try:
+        split_list = engine.map(
+            translate_chunk, zip(text_merge, global_text_list)
+        )
         progress_bar.close()
     except Exception as error:
         progress_bar.close()
@@ -184,13 +318,16 @@ def translate_batch(segments, target, chunk_size=2000, source=None):
             "The translation in chunks failed, switching to iterative."
             " Related: too many request"
         )  # use proxy or less chunk size
-        return translate_iterative(segments, target, source)
+        return translate_iterative(
+            segments, target, source, workers, rate, translator_factory
+        )
 
     # un chunk
     translated_lines = list(chain.from_iterable(split_list))
 
     return verify_translate(
-        segments, segments_copy, translated_lines, target, source
+        segments, segments_copy, translated_lines, target, source,
+        translator_factory,
     )
 
 
@@ -201,6 +338,7 @@ def call_gpt_translate(
     user_prompt,
     original_text=None,
     batch_lines=None,
+    metrics=None,
 ):
 
     # https://platform.openai.com/docs/guides/text-generation/json-mode
@@ -215,6 +353,12 @@ def call_gpt_translate(
     result = response.choices[0].message.content
     logger.debug(f"Result: {str(result)}")
 
+    if metrics is not None:
+        usage = getattr(response, "usage", None)
+        metrics["prompt_tokens"] = getattr(usage, "prompt_tokens", 0)
+        metrics["completion_tokens"] = getattr(usage, "completion_tokens", 0)
+        metrics["finish_reason"] = response.choices[0].finish_reason
+
     try:
         translation = json.loads(result)
     except Exception as error:
@@ -267,12 +411,12 @@ def call_gpt_translate(
         return translation
 
 
-def gpt_sequential(segments, model, target, source=None):
-    from openai import OpenAI
-
+def gpt_sequential(segments, model, target, source=None, client=None):
     translated_segments = copy.deepcopy(segments)
 
-    client = OpenAI()
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI()
     progress_bar = tqdm(total=len(segments), desc="Translating")
 
     lang_tg = re.sub(r'\([^)]*\)', '', INVERTED_LANGUAGES[target]).strip()
@@ -305,7 +449,7 @@ def gpt_sequential(segments, model, target, source=None):
                 f"{str(error)} >> The text of segment {start} "
                 "is being corrected with Google Translate"
             )
-            translator = GoogleTranslator(
+            translator = deep_translator.GoogleTranslator(
                 source=fixed_source, target=fixed_target
             )
             translated_text = translator.translate(text.strip())
@@ -318,15 +462,67 @@ def gpt_sequential(segments, model, target, source=None):
     return translated_segments
 
 
-def gpt_batch(segments, model, target, token_batch_limit=900, source=None):
-    from openai import OpenAI
+class AdaptiveBatchSize:
+    """
+    Token budget of the GPT batches. Failed or truncated batches shrink it,
+    successful ones grow it back up to the configured limit.
+    """
+
+    def __init__(self, limit, minimum=100, shrink=0.6, grow=1.1):
+        self.maximum = limit
+        self.minimum = min(minimum, limit)
+        self.limit = limit
+        self.shrink = shrink
+        self.grow = grow
+        self.lock = threading.Lock()
+
+    def success(self):
+        with self.lock:
+            self.limit = min(self.maximum, int(self.limit * self.grow) + 1)
+
+    def failure(self):
+        with self.lock:
+            self.limit = max(self.minimum, int(self.limit * self.shrink))
+
+
+def gpt_batch(
+    segments,
+    model,
+    target,
+    token_batch_limit=900,
+    source=None,
+    client=None,
+    max_in_flight=GPT_BATCH_MAX_IN_FLIGHT,
+    metrics=None,
+):
+    """
+    Translate segments with GPT in token-limited batches sent concurrently.
+
+    Parameters:
+    - client (optional): OpenAI compatible client, `OpenAI()` by default.
+        A client pointed to a local stub server can be used for tests.
+    - max_in_flight (int): Batch requests running at the same time.
+    - metrics (list, optional): Receives one dict per request with the
+        start, lines, latency, prompt/completion tokens, finish reason and
+        whether it succeeded.
+
+    Notes:
+    - The batch size adapts to the observed failures and truncations.
+    - A failed batch is split in half and retried; a single line that
+        still fails is translated with Google Translate, under the
+        `ConcurrentTranslator` rate limit, or kept untranslated.
+    """
     import tiktoken
 
     token_batch_limit = max(100, (token_batch_limit - 40) // 2)
     progress_bar = tqdm(total=len(segments), desc="Translating")
     segments_copy = copy.deepcopy(segments)
     encoding = tiktoken.get_encoding("cl100k_base")
-    client = OpenAI()
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI()
+    if metrics is None:
+        metrics = []
 
     lang_tg = re.sub(r'\([^)]*\)', '', INVERTED_LANGUAGES[target]).strip()
     lang_sc = ""
@@ -338,81 +534,167 @@ def gpt_batch(segments, model, target, token_batch_limit=900, source=None):
 
     name_speaker = "ABCDEFGHIJKL"
 
-    translated_lines = []
-    text_data_dict = []
-    num_tokens = 0
-    count_sk = {char: 0 for char in "ABCDEFGHIJKL"}
-
-    for i, line in enumerate(segments_copy):
-        text = line["text"]
-        speaker = line["speaker"]
-        last_start = line["start"]
-        # text_data_dict.append({str(int(speaker[-1])+1): text})
-        index_sk = int(speaker[-2:])
-        character_sk = name_speaker[index_sk]
-        count_sk[character_sk] += 1
-        code_sk = character_sk+str(count_sk[character_sk])
-        text_data_dict.append({code_sk: text})
-        num_tokens += len(encoding.encode(text)) + 7
-        if num_tokens >= token_batch_limit or i == len(segments_copy)-1:
-            try:
-                batch_lines = len(text_data_dict)
-                batch_conversation = {"conversation": copy.deepcopy(text_data_dict)}
-                # Reset vars
-                num_tokens = 0
-                text_data_dict = []
-                count_sk = {char: 0 for char in "ABCDEFGHIJKL"}
-                # Process translation
-                # https://arxiv.org/pdf/2309.03409.pdf
-                system_prompt = f"Machine translation designed to output the translated_conversation key JSON containing a list of {batch_lines} items."
-                user_prompt = f"Translate each of the following text values in conversation{' from' if lang_sc else ''} {lang_sc} to {lang_tg}:\n{batch_conversation}"
-                logger.debug(f"Prompt: {str(user_prompt)}")
-
-                conversation = call_gpt_translate(
-                    client,
-                    model,
-                    system_prompt,
-                    user_prompt,
-                    original_text=batch_conversation,
-                    batch_lines=batch_lines,
-                )
-
-                if len(conversation) < batch_lines:
-                    raise ValueError(
-                        "Incomplete result received. Batch lines: "
-                        f"{len(conversation)}, expected: {batch_lines}"
-                    )
+    line_tokens = [
+        len(encoding.encode(line["text"])) + 7 for line in segments_copy
+    ]
+    translated_lines = [None] * len(segments_copy)
+    batch_size = AdaptiveBatchSize(token_batch_limit)
+    retry_batches = deque()
+    next_line = 0
+
+    def next_batch():
+        nonlocal next_line
+        if retry_batches:
+            return retry_batches.popleft()
+        if next_line >= len(segments_copy):
+            return None
+        start = next_line
+        num_tokens = 0
+        while next_line < len(segments_copy):
+            num_tokens += line_tokens[next_line]
+            next_line += 1
+            if num_tokens >= batch_size.limit:
+                break
+        return start, next_line
+
+    def translate_range(start, end):
+        batch_lines = end - start
+        text_data_dict = []
+        count_sk = {char: 0 for char in name_speaker}
+        for line in segments_copy[start:end]:
+            index_sk = int(line["speaker"][-2:])
+            character_sk = name_speaker[index_sk]
+            count_sk[character_sk] += 1
+            code_sk = character_sk+str(count_sk[character_sk])
+            text_data_dict.append({code_sk: line["text"]})
+        batch_conversation = {"conversation": text_data_dict}
+
+        # https://arxiv.org/pdf/2309.03409.pdf
+        system_prompt = f"Machine translation designed to output the translated_conversation key JSON containing a list of {batch_lines} items."
+        user_prompt = f"Translate each of the following text values in conversation{' from' if lang_sc else ''} {lang_sc} to {lang_tg}:\n{batch_conversation}"
+        logger.debug(f"Prompt: {str(user_prompt)}")
+
+        batch_metrics = {
+            "start": segments_copy[start]["start"],
+            "lines": batch_lines,
+        }
+        time_start = time.perf_counter()
+        try:
+            conversation = call_gpt_translate(
+                client,
+                model,
+                system_prompt,
+                user_prompt,
+                original_text=batch_conversation,
+                batch_lines=batch_lines,
+                metrics=batch_metrics,
+            )
 
-                for i, translated_text in enumerate(conversation):
-                    if i+1 > batch_lines:
-                        break
-                    translated_lines.append(list(translated_text.values())[0])
+            if len(conversation) < batch_lines:
+                raise ValueError(
+                    "Incomplete result received. Batch lines: "
+                    f"{len(conversation)}, expected: {batch_lines}"
+                )
 
-                progress_bar.update(batch_lines)
+            lines = [
+                list(translated_text.values())[0]
+                for translated_text in conversation[:batch_lines]
+            ]
+            error = None
+        except Exception as batch_error:
+            lines = None
+            error = batch_error
+        batch_metrics["latency"] = time.perf_counter() - time_start
+        batch_metrics["ok"] = lines is not None
+        return lines, error, batch_metrics
+
+    # Google Translate for the single lines GPT failed, rate limited
+    fallback = None
+
+    def translate_fallback(start):
+        try:
+            text = segments_copy[start]["text"].strip()
+            return [fallback.translate(text).strip()], None, None
+        except Exception as fallback_error:
+            return None, fallback_error, None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as executor:
+        in_flight = {}
+        while True:
+            while len(in_flight) < max(1, max_in_flight):
+                batch = next_batch()
+                if batch is None:
+                    break
+                in_flight[executor.submit(translate_range, *batch)] = batch
+            if not in_flight:
+                break
 
-            except Exception as error:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end = in_flight.pop(future)
+                lines, error, batch_metrics = future.result()
+
+                if batch_metrics is None:
+                    # Google Translate fallback of one line
+                    if lines is None:
+                        logger.error(
+                            f"{str(error)} >> The segment "
+                            f"{segments_copy[start]['start']} is kept "
+                            "untranslated"
+                        )
+                        lines = [segments_copy[start]["text"].strip()]
+                    translated_lines[start:end] = lines
+                    progress_bar.update(end - start)
+                    continue
+
+                metrics.append(batch_metrics)
+
+                if lines is not None:
+                    translated_lines[start:end] = lines
+                    progress_bar.update(end - start)
+                    if batch_metrics.get("finish_reason") == "length":
+                        batch_size.failure()
+                    else:
+                        batch_size.success()
+                    continue
+
+                batch_size.failure()
                 logger.error(str(error))
+                first_start = segments_copy[start]["start"]
+                last_start = segments_copy[end - 1]["start"]
 
-                first_start = segments_copy[max(0, i-(batch_lines-1))]["start"]
-                logger.warning(
-                    f"The batch from {first_start} to {last_start} "
-                    "failed, is being corrected with Google Translate"
-                )
+                if end - start > 1:
+                    logger.warning(
+                        f"The batch from {first_start} to {last_start} "
+                        "failed, retrying it split in half"
+                    )
+                    middle = (start + end) // 2
+                    retry_batches.appendleft((middle, end))
+                    retry_batches.appendleft((start, middle))
+                    continue
 
-                translator = GoogleTranslator(
-                    source=fixed_source,
-                    target=fixed_target
+                logger.warning(
+                    f"The segment {first_start} failed, is being corrected "
+                    "with Google Translate"
                 )
-
-                for txt_source in batch_conversation["conversation"]:
-                    translated_txt = translator.translate(
-                        list(txt_source.values())[0].strip()
-                    )
-                    translated_lines.append(translated_txt.strip())
-                    progress_bar.update(1)
+                if fallback is None:
+                    fallback = ConcurrentTranslator(fixed_source, fixed_target)
+                future = executor.submit(translate_fallback, start)
+                in_flight[future] = (start, end)
 
     progress_bar.close()
 
+    if metrics:
+        logger.debug(
+            f"GPT batches: {len(metrics)} requests, "
+            f"{sum(not m['ok'] for m in metrics)} failed, "
+            f"{sum(m.get('prompt_tokens', 0) for m in metrics)} prompt tokens, "
+            f"{sum(m.get('completion_tokens', 0) for m in metrics)} "
+            "completion tokens, max latency "
+            f"{max(m['latency'] for m in metrics):.2f}s, "
+            f"final batch limit {batch_size.limit} tokens"
+        )
+
     return verify_translate(
         segments, segments_copy, translated_lines, fixed_target, fixed_source
     )
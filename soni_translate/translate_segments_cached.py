@@ -1,5 +1,4 @@
 from tqdm import tqdm
-from deep_translator import GoogleTranslator
 from itertools import chain
 import copy
 from .language_configuration import fix_code_language, INVERTED_LANGUAGES
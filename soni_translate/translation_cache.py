@@ -1,15 +1,32 @@
 import sqlite3
 import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from contextlib import contextmanager
 import hashlib
 from .logging_setup import logger
 
+# Entries kept in the in-process LRU in front of SQLite
+TRANSLATION_CACHE_MEMORY_SIZE = int(
+    os.environ.get('TRANSLATION_CACHE_MEMORY_SIZE', 100000)
+)
+# Below SQLITE_MAX_VARIABLE_NUMBER of old builds (999), with room for the
+# fixed query params
+SQLITE_IN_CHUNK_SIZE = 900
+SQLITE_BUSY_TIMEOUT = 30.0
+
+
 class TranslationCache:
     """Translation cache using SQLite for persistent storage."""
 
-    def __init__(self, cache_path: Optional[str] = None):
+    def __init__(
+        self,
+        cache_path: Optional[str] = None,
+        memory_size: int = TRANSLATION_CACHE_MEMORY_SIZE,
+    ):
         if cache_path is None:
             cache_path = os.environ.get('TRANSLATION_CACHE_SQLITE_PATH')
             if cache_path is None:
@@ -18,11 +35,26 @@ class TranslationCache:
                 )
 
         self.db_path = cache_path
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._local = threading.local()
         self._init_db()
 
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False
+        )
+        # WAL lets readers and one writer from other processes proceed
+        # without "database is locked" errors
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}')
+        return conn
+
     def _init_db(self):
         """Initialize the SQLite database and create tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS translations (
                     language_from TEXT NOT NULL,
@@ -34,17 +66,47 @@ class TranslationCache:
                     PRIMARY KEY (language_from, language_to, original, translation_method)
                 )
             ''')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_lookup ON translations(language_from, language_to, original, translation_method)')
+            # Same columns as the primary key, only slows down writes
+            conn.execute('DROP INDEX IF EXISTS idx_lookup')
             conn.commit()
 
     @contextmanager
     def _get_connection(self):
-        """Context manager for database connections."""
-        conn = sqlite3.connect(self.db_path)
+        """Context manager for the connection of this thread and process,
+        opened once and reused."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
         try:
             yield conn
-        finally:
+        except Exception:
+            conn.rollback()
+            raise
+
+    def close(self):
+        """Close the connection of the calling thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
             conn.close()
+        self._local.conn = None
+
+    def _memory_get(self, key: Tuple[str, str, str, str]) -> Optional[str]:
+        with self._memory_lock:
+            translation = self._memory.get(key)
+            if translation is not None:
+                self._memory.move_to_end(key)
+            return translation
+
+    def _memory_put(self, key: Tuple[str, str, str, str], translation: str):
+        if self.memory_size <= 0:
+            return
+        with self._memory_lock:
+            self._memory[key] = translation
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
 
     def get_cached_translations(
         self,
@@ -70,21 +132,35 @@ class TranslationCache:
         # Remove duplicates while preserving order
         unique_texts = list(dict.fromkeys(texts))
 
-        placeholders = ','.join('?' * len(unique_texts))
-        query = f'''
-            SELECT original, translation
-            FROM translations
-            WHERE language_from = ? AND language_to = ? AND translation_method = ?
-            AND original IN ({placeholders})
-        '''
-
-        params = [language_from, language_to, translation_method] + unique_texts
+        cached_translations = {}
+        missing_texts = []
+        for text in unique_texts:
+            translation = self._memory_get(
+                (language_from, language_to, translation_method, text)
+            )
+            if translation is None:
+                missing_texts.append(text)
+            else:
+                cached_translations[text] = translation
 
+        # Chunked to stay under the SQLite variable limit
         with self._get_connection() as conn:
-            cursor = conn.execute(query, params)
-            results = cursor.fetchall()
-
-        cached_translations = {original: translation for original, translation in results}
+            for i in range(0, len(missing_texts), SQLITE_IN_CHUNK_SIZE):
+                chunk = missing_texts[i:i + SQLITE_IN_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                query = f'''
+                    SELECT original, translation
+                    FROM translations
+                    WHERE language_from = ? AND language_to = ? AND translation_method = ?
+                    AND original IN ({placeholders})
+                '''
+                params = [language_from, language_to, translation_method] + chunk
+                for original, translation in conn.execute(query, params):
+                    cached_translations[original] = translation
+                    self._memory_put(
+                        (language_from, language_to, translation_method, original),
+                        translation,
+                    )
 
         logger.debug(f"Found {len(cached_translations)} cached translations out of {len(unique_texts)} requested")
 
@@ -126,6 +202,9 @@ class TranslationCache:
             ''', insert_data)
             conn.commit()
 
+        for lang_from, lang_to, original, translation, method in insert_data:
+            self._memory_put((lang_from, lang_to, method, original), translation)
+
         logger.debug(f"Saved {len(insert_data)} translations to cache")
 
     def clear_cache(self, language_from: str = None, language_to: str = None):
@@ -149,6 +228,9 @@ class TranslationCache:
                 conn.execute('DELETE FROM translations')
             conn.commit()
 
+        with self._memory_lock:
+            self._memory.clear()
+
     def get_cache_stats(self) -> Dict[str, int]:
         """Get cache statistics."""
         with self._get_connection() as conn:
@@ -164,6 +246,7 @@ class TranslationCache:
 
         return {
             'total_entries': total_entries,
+            'memory_entries': len(self._memory),
             'breakdown': breakdown
         }
 
@@ -231,3 +314,50 @@ def apply_cached_translations(segments: List[Dict], translation_mapping: Dict[st
         translated_segments.append(segment_copy)
 
     return translated_segments
+
+
+def benchmark_translation_cache(
+    cache_path: str, entries: int = 100000, lookups: int = 5
+) -> Dict[str, float]:
+    """Time bulk save and cold/warm lookups on a cache of `entries` texts."""
+    if os.path.exists(cache_path):
+        raise ValueError(f"Benchmark needs a new database path: {cache_path}")
+
+    texts = [f"Benchmark sentence number {i}." for i in range(entries)]
+    translations = [
+        {'original': text, 'translation': text[::-1]} for text in texts
+    ]
+    results = {}
+
+    cache = TranslationCache(cache_path, memory_size=entries)
+
+    start = time.perf_counter()
+    cache.save_translations("en", "es", translations)
+    results['save'] = time.perf_counter() - start
+
+    with cache._memory_lock:
+        cache._memory.clear()
+
+    start = time.perf_counter()
+    found = cache.get_cached_translations("en", "es", texts)
+    results['lookup_sqlite'] = time.perf_counter() - start
+    assert len(found) == entries
+
+    start = time.perf_counter()
+    for _ in range(lookups):
+        cache.get_cached_translations("en", "es", texts)
+    results['lookup_memory'] = (time.perf_counter() - start) / lookups
+
+    cache.close()
+    return results
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench = benchmark_translation_cache(
+            os.path.join(tmp_dir, "benchmark.sqlite")
+        )
+    for name, seconds in bench.items():
+        print(f"{name}: {seconds:.3f}s")
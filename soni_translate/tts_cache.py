@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from .logging_setup import logger
+
+TTS_CACHE_DIR = os.environ.get(
+    "TTS_CACHE_DIR", os.path.join(os.getcwd(), ".tts-cache")
+)
+TTS_CACHE_MAX_SIZE_MB = int(os.environ.get("TTS_CACHE_MAX_SIZE_MB", 2048))
+# Clips are stored as FLAC (ClipStore.encode): cheap to encode on every
+# miss, but several times the size of the Vorbis clips of a job
+TTS_CACHE_EXTENSION = ".flac"
+
+
+class TTSClipCache:
+    """Content-addressed store of synthesized clips shared by all TTS
+    backends, bounded in size with least-recently-used eviction."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_size_mb: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir or TTS_CACHE_DIR
+        if max_size_mb is None:
+            max_size_mb = TTS_CACHE_MAX_SIZE_MB
+        self.max_size = max_size_mb * 1024 * 1024
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self._size = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Index the clips already on disk, ordered by last use."""
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(TTS_CACHE_EXTENSION):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                key = name[:-len(TTS_CACHE_EXTENSION)]
+                found.append((stat.st_mtime, key, stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+        logger.debug(
+            f"TTS cache: {len(self._entries)} clips, "
+            f"{self._size / 1024 / 1024:.1f} MB in {self.cache_dir}"
+        )
+
+    @staticmethod
+    def make_key(backend: str, model: str, params: Dict, text: str) -> str:
+        """Hash of everything that determines the synthesized audio."""
+        payload = json.dumps(
+            [backend, model, params, text],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(
+            self.cache_dir, key[:2], key + TTS_CACHE_EXTENSION
+        )
+
+    def fetch(self, key: str) -> Optional[bytes]:
+        """Content of the cached clip, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                if key in self._entries:
+                    self._size -= self._entries.pop(key)
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                # Stored by another process
+                size = os.path.getsize(path)
+                self._entries[key] = size
+                self._size += size
+        return content
+
+    def store(self, key: str, content: bytes):
+        """Atomically add the encoded clip `content` under `key`."""
+        if not content:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        size = os.path.getsize(path)
+        with self._lock:
+            self.stores += 1
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_size and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+            }
+
+
+# Global cache instance
+_tts_clip_cache = None
+
+
+def get_tts_clip_cache() -> TTSClipCache:
+    """Get the global TTS clip cache instance."""
+    global _tts_clip_cache
+    if _tts_clip_cache is None:
+        _tts_clip_cache = TTSClipCache()
+    return _tts_clip_cache
@@ -1,8 +1,8 @@
 import os, zipfile, rarfile, shutil, subprocess, shlex, sys # noqa
 from .logging_setup import logger
 from urllib.parse import urlparse
-from IPython.utils import capture
 import re
+import hashlib
 import soundfile as sf
 import numpy as np
 
@@ -297,6 +297,7 @@ def extract_video_links(link):
 
     try:
         from yt_dlp import YoutubeDL
+        from IPython.utils import capture
         with capture.capture_output() as cap:
             with YoutubeDL(params_dlp) as ydl:
                 info_dict = ydl.extract_info( # noqa
@@ -497,6 +498,18 @@ def copy_files(source_path, destination_path):
             logger.error(f"File '{one_source_path}' does not exist.")
 
 
+def hash_file(filepath, digest_size=None):
+    """blake2b hex digest of the file content."""
+    file_hash = (
+        hashlib.blake2b(digest_size=digest_size)
+        if digest_size else hashlib.blake2b()
+    )
+    with open(filepath, "rb") as f:
+        while chunk := f.read(1 << 20):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
 def rename_file(current_name, new_name):
     file_directory = os.path.dirname(current_name)
 
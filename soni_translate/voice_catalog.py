@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import tempfile
+from .logging_setup import logger
+
+VOICE_CATALOG_DIR = os.environ.get(
+    "VOICE_CATALOG_DIR", os.path.join(os.getcwd(), ".voice-catalog")
+)
+# Seconds before a catalog is fetched again
+VOICE_CATALOG_TTL = int(os.environ.get("VOICE_CATALOG_TTL", 7 * 24 * 3600))
+
+
+def _catalog_path(name):
+    return os.path.join(VOICE_CATALOG_DIR, f"{name}.json")
+
+
+def load_catalog(name, max_age=None):
+    """The voices stored for `name`, or None if missing or older than
+    `max_age` seconds."""
+    path = _catalog_path(name)
+    try:
+        age = time.time() - os.path.getmtime(path)
+        if max_age is not None and age > max_age:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            voices = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as error:
+        logger.warning(f"Invalid voice catalog {path}: {error}")
+        return None
+    return voices if isinstance(voices, list) else None
+
+
+def save_catalog(name, voices):
+    os.makedirs(VOICE_CATALOG_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=VOICE_CATALOG_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(voices, f)
+        os.replace(tmp_path, _catalog_path(name))
+    except Exception as error:
+        logger.warning(f"Voice catalog {name} not saved: {error}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def cached_catalog(name, loader, ttl=None):
+    """
+    Voice list of a TTS engine, read from disk while it is fresh.
+
+    Parameters:
+    - name (str): Catalog name.
+    - loader (callable): Fetches the list (subprocess, network...).
+    - ttl (int or None): Seconds a stored list is valid (VOICE_CATALOG_TTL).
+
+    Returns:
+    - voices (list): The stored list, the fetched one, or the expired one
+      when fetching fails or returns nothing.
+    """
+    if ttl is None:
+        ttl = VOICE_CATALOG_TTL
+
+    voices = load_catalog(name, max_age=ttl)
+    if voices:
+        logger.debug(f"Voice catalog {name}: {len(voices)} voices from disk")
+        return voices
+
+    time_start = time.perf_counter()
+    try:
+        voices = loader()
+    except Exception as error:
+        logger.error(str(error))
+        voices = []
+    logger.debug(
+        f"Voice catalog {name}: fetched in "
+        f"{time.perf_counter() - time_start:.2f}s"
+    )
+
+    if voices:
+        save_catalog(name, voices)
+        return voices
+
+    stale = load_catalog(name)
+    if stale:
+        logger.warning(f"Using an expired voice catalog for {name}")
+        return stale
+    return voices
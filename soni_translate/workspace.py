@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from .utils import create_directories, remove_directory_contents
+from .clip_store import get_clip_store, release_clip_store
+from .logging_setup import logger
+
+WORKSPACE_DIR = os.environ.get(
+    "WORKSPACE_DIR", os.path.join(os.getcwd(), "workspaces")
+)
+
+# Scratch directories of a job, relative to its workspace
+WORKSPACE_DIRECTORIES = [
+    "audio",
+    os.path.join("audio2", "audio"),
+    "clean_song_output",
+    "processed",
+    "pdf_images",
+]
+
+
+class Workspace:
+    """
+    Directory with the intermediate files of one conversion job: the
+    demuxed media, TTS clips, mixes, subtitles and lists for ffmpeg.
+
+    Jobs with different workspaces don't share any file, so several of
+    them can run at once in one process or on one host. The default
+    workspace is the working directory, where the files have always been
+    written. The PCM of the clips is kept in a ClipStore (`clips`).
+
+    Parameters:
+    - root (str): Directory of the job files.
+    - temporary (bool): Remove the whole directory on cleanup.
+    """
+
+    def __init__(self, root=os.curdir, temporary=False):
+        self.root = root
+        self.temporary = temporary
+        create_directories([self.path(d) for d in WORKSPACE_DIRECTORIES])
+
+    @classmethod
+    def create(cls, name="job", base_dir=None):
+        """New temporary workspace in `base_dir` (WORKSPACE_DIR)."""
+        base_dir = base_dir or WORKSPACE_DIR
+        os.makedirs(base_dir, exist_ok=True)
+        root = tempfile.mkdtemp(prefix=f"{name}_", dir=base_dir)
+        logger.debug(f"Workspace created: {root}")
+        return cls(root, temporary=True)
+
+    @property
+    def clips(self):
+        """ClipStore with the PCM of the clips of this job, shared by the
+        Workspace instances of the same root."""
+        return get_clip_store(self.root)
+
+    def path(self, *parts):
+        """Path of a job file. Relative paths are kept in the default
+        workspace, so commands and logs look as they used to."""
+        if self.root == os.curdir:
+            return os.path.join(*parts)
+        return os.path.join(self.root, *parts)
+
+    def tts_clip(self, start):
+        """Clip synthesized for the segment starting at `start`."""
+        return self.path("audio", f"{start}.ogg")
+
+    def acc_clip(self, start, folder="audio2"):
+        """Clip of the segment after the tempo adjustment."""
+        return self.path(folder, "audio", f"{start}.ogg")
+
+    def clean(self, *directories):
+        """Empty scratch directories of this job, creating them if needed."""
+        for directory in directories:
+            path = self.path(directory)
+            create_directories(path)
+            remove_directory_contents(path)
+            self.clips.discard_directory(path)
+
+    def cleanup(self):
+        """Remove the files of the job. A temporary workspace is deleted,
+        otherwise only its scratch directories are emptied."""
+        if self.temporary:
+            shutil.rmtree(self.root, ignore_errors=True)
+            logger.debug(f"Workspace removed: {self.root}")
+        else:
+            self.clean(*WORKSPACE_DIRECTORIES)
+        release_clip_store(self.root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def __repr__(self):
+        return f"Workspace({self.root!r})"
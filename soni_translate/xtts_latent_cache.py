@@ -0,0 +1,143 @@
+import os
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from .logging_setup import logger
+
+XTTS_LATENT_CACHE_DIR = os.environ.get(
+    "XTTS_LATENT_CACHE_DIR", os.path.join(os.getcwd(), ".xtts-latents")
+)
+# Reference voices whose latents are also kept in memory
+XTTS_LATENT_MEMORY_ENTRIES = int(
+    os.environ.get("XTTS_LATENT_MEMORY_ENTRIES", 32)
+)
+XTTS_LATENT_EXTENSION = ".npz"
+
+
+class XTTSLatentCache:
+    """Conditioning latents of XTTS reference voices.
+
+    The GPT conditioning latent and the speaker embedding only depend on
+    the reference audio, the model and the conditioning settings, so they
+    are computed once per reference file and reused for every line of that
+    voice. Entries are kept in memory (LRU) and on disk as .npz files.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        memory_entries: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir or XTTS_LATENT_CACHE_DIR
+        if memory_entries is None:
+            memory_entries = XTTS_LATENT_MEMORY_ENTRIES
+        self.memory_entries = max(1, memory_entries)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> latents, oldest first
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        reference_file: str, model_id: str, settings: str = ""
+    ) -> str:
+        """Hash of the reference audio content, the model and the
+        conditioning settings."""
+        digest = hashlib.blake2b(digest_size=20)
+        with open(reference_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(f"|{model_id}|{settings}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + XTTS_LATENT_EXTENSION)
+
+    def _remember(self, key, latents):
+        self._memory[key] = latents
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def load(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(gpt_cond_latent, speaker_embedding) of `key`, or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                latents = (
+                    data["gpt_cond_latent"], data["speaker_embedding"]
+                )
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as error:
+            logger.warning(f"Invalid XTTS latent cache entry {path}: {error}")
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, latents)
+        return latents
+
+    def save(
+        self,
+        key: str,
+        gpt_cond_latent: np.ndarray,
+        speaker_embedding: np.ndarray,
+    ):
+        with self._lock:
+            self._remember(key, (gpt_cond_latent, speaker_embedding))
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    gpt_cond_latent=gpt_cond_latent,
+                    speaker_embedding=speaker_embedding,
+                )
+            os.replace(tmp_path, self._path(key))
+        except Exception as error:
+            # The entry is still in memory for this process
+            logger.warning(f"XTTS latents not saved: {error}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+
+# Global cache instance
+_xtts_latent_cache = None
+
+
+def get_xtts_latent_cache() -> XTTSLatentCache:
+    """Get the global XTTS latent cache instance."""
+    global _xtts_latent_cache
+    if _xtts_latent_cache is None:
+        _xtts_latent_cache = XTTSLatentCache()
+    return _xtts_latent_cache
@@ -4,28 +4,63 @@ import torch.nn.functional as F
 import scipy.signal as signal
 import pyworld, os, traceback, faiss, librosa, torchcrepe
 from scipy import signal
-from functools import lru_cache
 from soni_translate.logging_setup import logger
+from soni_translate.f0_cache import get_f0_cache
 
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 
 bh, ah = signal.butter(N=5, Wn=48, btype="high", fs=16000)
 
-input_audio_path2wav = {}
+# Chunks converted in one HuBERT and net_g call, padded to the longest
+RVC_BATCH_SIZE = int(os.environ.get("RVC_BATCH_SIZE", 4))
 
+# Pitch extractors without a torch model, safe to run in worker processes
+CPU_F0_METHODS = ("pm", "harvest")
 
-@lru_cache
-def cache_harvest_f0(input_audio_path, fs, f0max, f0min, frame_period):
-    audio = input_audio_path2wav[input_audio_path]
-    f0, t = pyworld.harvest(
-        audio,
-        fs=fs,
-        f0_ceil=f0max,
-        f0_floor=f0min,
-        frame_period=frame_period,
-    )
-    f0 = pyworld.stonemask(audio, f0, t, fs)
+
+def compute_cpu_f0(
+    x,
+    p_len,
+    f0_method,
+    filter_radius,
+    sr=16000,
+    window=160,
+    f0_min=50,
+    f0_max=1100,
+):
+    """Pitch curve from parselmouth ("pm") or pyworld ("harvest")."""
+    time_step = window / sr * 1000
+    if f0_method == "pm":
+        f0 = (
+            parselmouth.Sound(x, sr)
+            .to_pitch_ac(
+                time_step=time_step / 1000,
+                voicing_threshold=0.6,
+                pitch_floor=f0_min,
+                pitch_ceiling=f0_max,
+            )
+            .selected_array["frequency"]
+        )
+        pad_size = (p_len - len(f0) + 1) // 2
+        if pad_size > 0 or p_len - len(f0) - pad_size > 0:
+            f0 = np.pad(
+                f0, [[pad_size, p_len - len(f0) - pad_size]], mode="constant"
+            )
+    elif f0_method == "harvest":
+        audio = x.astype(np.double)
+        f0, t = pyworld.harvest(
+            audio,
+            fs=sr,
+            f0_ceil=f0_max,
+            f0_floor=f0_min,
+            frame_period=time_step,
+        )
+        f0 = pyworld.stonemask(audio, f0, t, sr)
+        if filter_radius > 2:
+            f0 = signal.medfilt(f0, 3)
+    else:
+        raise ValueError(f"{f0_method} is not a CPU pitch method")
     return f0
 
 
@@ -51,6 +86,65 @@ def change_rms(data1, sr1, data2, sr2, rate):  # 1 is the input audio, 2 is the
     return data2
 
 
+def find_split_points(audio, window, t_center, t_query, t_max):
+    """
+    Cut points every t_center samples, moved within t_query to where the
+    sum of the signal over `window` samples is closest to zero. The sums
+    come from one cumulative sum instead of adding `window` shifted copies
+    of the signal.
+    """
+    opt_ts = []
+    n = audio.shape[0]
+    if n + window // 2 * 2 <= t_max:
+        return opt_ts
+
+    audio_pad = np.pad(audio, (window // 2, window // 2), mode="reflect")
+    cumsum = np.concatenate(([0.0], np.cumsum(audio_pad, dtype=np.float64)))
+    audio_sum = np.abs(cumsum[window:window + n] - cumsum[:n])
+
+    for t in range(t_center, n, t_center):
+        opt_ts.append(
+            t - t_query + int(np.argmin(audio_sum[t - t_query : t + t_query]))
+        )
+    return opt_ts
+
+
+def benchmark_split_points(
+    seconds=600, sr=16000, x_center=38, x_query=10, x_max=41
+):
+    """Time the previous shifted-sum search against find_split_points on
+    a fixed noise signal and check both give the same cut points."""
+    window = 160
+    t_center, t_query, t_max = sr * x_center, sr * x_query, sr * x_max
+    audio = np.random.default_rng(0).standard_normal(seconds * sr)
+
+    t0 = ttime()
+    audio_pad = np.pad(audio, (window // 2, window // 2), mode="reflect")
+    audio_sum = np.zeros_like(audio)
+    for i in range(window):
+        audio_sum += audio_pad[i : i - window]
+    opt_ts_loop = []
+    for t in range(t_center, audio.shape[0], t_center):
+        opt_ts_loop.append(
+            t
+            - t_query
+            + np.where(
+                np.abs(audio_sum[t - t_query : t + t_query])
+                == np.abs(audio_sum[t - t_query : t + t_query]).min()
+            )[0][0]
+        )
+    t1 = ttime()
+    opt_ts = find_split_points(audio, window, t_center, t_query, t_max)
+    t2 = ttime()
+
+    logger.info(
+        f"Split points for {seconds}s: shifted sums {t1 - t0:.3f}s, "
+        f"cumulative sum {t2 - t1:.3f}s, "
+        f"same points: {opt_ts == [int(t) for t in opt_ts_loop]}"
+    )
+    return t1 - t0, t2 - t1
+
+
 class VC(object):
     def __init__(self, tgt_sr, config):
         self.x_pad, self.x_query, self.x_center, self.x_max, self.is_half = (
@@ -70,43 +164,18 @@ class VC(object):
         self.t_max = self.sr * self.x_max  # Query-free duration threshold
         self.device = config.device
 
-    def get_f0(
-        self,
-        input_audio_path,
-        x,
-        p_len,
-        f0_up_key,
-        f0_method,
-        filter_radius,
-        inp_f0=None,
-    ):
-        global input_audio_path2wav
-        time_step = self.window / self.sr * 1000
-        f0_min = 50
-        f0_max = 1100
-        f0_mel_min = 1127 * np.log(1 + f0_min / 700)
-        f0_mel_max = 1127 * np.log(1 + f0_max / 700)
-        if f0_method == "pm":
-            f0 = (
-                parselmouth.Sound(x, self.sr)
-                .to_pitch_ac(
-                    time_step=time_step / 1000,
-                    voicing_threshold=0.6,
-                    pitch_floor=f0_min,
-                    pitch_ceiling=f0_max,
-                )
-                .selected_array["frequency"]
+    def extract_f0(self, x, p_len, f0_method, filter_radius, f0_min, f0_max):
+        if f0_method in CPU_F0_METHODS:
+            f0 = compute_cpu_f0(
+                x,
+                p_len,
+                f0_method,
+                filter_radius,
+                self.sr,
+                self.window,
+                f0_min,
+                f0_max,
             )
-            pad_size = (p_len - len(f0) + 1) // 2
-            if pad_size > 0 or p_len - len(f0) - pad_size > 0:
-                f0 = np.pad(
-                    f0, [[pad_size, p_len - len(f0) - pad_size]], mode="constant"
-                )
-        elif f0_method == "harvest":
-            input_audio_path2wav[input_audio_path] = x.astype(np.double)
-            f0 = cache_harvest_f0(input_audio_path, self.sr, f0_max, f0_min, 10)
-            if filter_radius > 2:
-                f0 = signal.medfilt(f0, 3)
         elif f0_method == "crepe":
             model = "full"
             # Pick a batch size that doesn't cause memory errors on your gpu
@@ -142,6 +211,39 @@ class VC(object):
             else:
                 f0 = self.model_rmvpe.infer_from_audio(x, thred)
 
+        return f0
+
+    def get_f0(
+        self,
+        input_audio_path,
+        x,
+        p_len,
+        f0_up_key,
+        f0_method,
+        filter_radius,
+        inp_f0=None,
+    ):
+        f0_min = 50
+        f0_max = 1100
+        f0_mel_min = 1127 * np.log(1 + f0_min / 700)
+        f0_mel_max = 1127 * np.log(1 + f0_max / 700)
+
+        # Same audio and settings give the same curve across runs and models
+        precision = ""
+        if f0_method not in CPU_F0_METHODS:
+            device_type = str(self.device).split(":")[0]
+            precision = f"{device_type}|{'fp16' if self.is_half else 'fp32'}"
+        f0_cache = get_f0_cache()
+        cache_key = f0_cache.make_key(
+            x, f0_method, self.sr, self.window, p_len, filter_radius, precision
+        )
+        f0 = f0_cache.load(cache_key)
+        if f0 is None:
+            f0 = self.extract_f0(
+                x, p_len, f0_method, filter_radius, f0_min, f0_max
+            )
+            f0_cache.save(cache_key, f0)
+
         f0 *= pow(2, f0_up_key / 12)
         # with open("test.txt","w")as f:f.write("\n".join([str(i)for i in f0.tolist()]))
         tf0 = self.sr // self.window  # f0 points per second
@@ -185,16 +287,56 @@ class VC(object):
         version,
         protect,
     ):  # ,file_index,file_big_npy
-        feats = torch.from_numpy(audio0)
+        if audio0.ndim == 2:  # double channels
+            audio0 = audio0.mean(-1)
+        return self.vc_batch(
+            model,
+            net_g,
+            sid,
+            audio0[None],
+            pitch,
+            pitchf,
+            times,
+            index,
+            big_npy,
+            index_rate,
+            version,
+            protect,
+        )[0]
+
+    def vc_batch(
+        self,
+        model,
+        net_g,
+        sid,
+        audios,
+        pitch,
+        pitchf,
+        times,
+        index,
+        big_npy,
+        index_rate,
+        version,
+        protect,
+        lengths=None,
+    ):
+        """Convert chunks, `audios` with shape (batch, samples) and pitch
+        tensors with shape (batch, frames), in one pass. `lengths` are the
+        samples of each chunk before padding; the outputs are trimmed to
+        them. Returns one array per chunk."""
+        feats = torch.from_numpy(np.ascontiguousarray(audios))
         if self.is_half:
             feats = feats.half()
         else:
             feats = feats.float()
-        if feats.dim() == 2:  # double channels
-            feats = feats.mean(-1)
-        assert feats.dim() == 1, feats.dim()
-        feats = feats.view(1, -1)
-        padding_mask = torch.BoolTensor(feats.shape).to(self.device).fill_(False)
+        assert feats.dim() == 2, feats.dim()
+        batch = feats.shape[0]
+        if lengths is None:
+            lengths = [feats.shape[1]] * batch
+        samples = torch.arange(feats.shape[1])[None]
+        padding_mask = (samples >= torch.tensor(lengths)[:, None]).to(
+            self.device
+        )
 
         inputs = {
             "source": feats.to(self.device),
@@ -205,14 +347,11 @@ class VC(object):
         with torch.no_grad():
             logits = model.extract_features(**inputs)
             feats = model.final_proj(logits[0]) if version == "v1" else logits[0]
-        if protect < 0.5 and pitch != None and pitchf != None:
+        use_pitch = pitch is not None and pitchf is not None
+        if protect < 0.5 and use_pitch:
             feats0 = feats.clone()
-        if (
-            isinstance(index, type(None)) == False
-            and isinstance(big_npy, type(None)) == False
-            and index_rate != 0
-        ):
-            npy = feats[0].cpu().numpy()
+        if index is not None and big_npy is not None and index_rate != 0:
+            npy = feats.reshape(-1, feats.shape[-1]).cpu().numpy()
             if self.is_half:
                 npy = npy.astype("float32")
 
@@ -227,42 +366,44 @@ class VC(object):
             if self.is_half:
                 npy = npy.astype("float16")
             feats = (
-                torch.from_numpy(npy).unsqueeze(0).to(self.device) * index_rate
+                torch.from_numpy(npy).view(feats.shape).to(self.device) * index_rate
                 + (1 - index_rate) * feats
             )
 
         feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(0, 2, 1)
-        if protect < 0.5 and pitch != None and pitchf != None:
+        if protect < 0.5 and use_pitch:
             feats0 = F.interpolate(feats0.permute(0, 2, 1), scale_factor=2).permute(
                 0, 2, 1
             )
         t1 = ttime()
-        p_len = audio0.shape[0] // self.window
+        p_len = audios.shape[-1] // self.window
         if feats.shape[1] < p_len:
             p_len = feats.shape[1]
-            if pitch != None and pitchf != None:
+            if use_pitch:
                 pitch = pitch[:, :p_len]
                 pitchf = pitchf[:, :p_len]
 
-        if protect < 0.5 and pitch != None and pitchf != None:
+        if protect < 0.5 and use_pitch:
             pitchff = pitchf.clone()
             pitchff[pitchf > 0] = 1
             pitchff[pitchf < 1] = protect
             pitchff = pitchff.unsqueeze(-1)
             feats = feats * pitchff + feats0 * (1 - pitchff)
             feats = feats.to(feats0.dtype)
-        p_len = torch.tensor([p_len], device=self.device).long()
+        p_lens = [min(length // self.window, p_len) for length in lengths]
+        p_len = torch.tensor(p_lens, device=self.device).long()
+        sid = sid.expand(batch)
         with torch.no_grad():
-            if pitch != None and pitchf != None:
+            if use_pitch:
                 audio1 = (
-                    (net_g.infer(feats, p_len, pitch, pitchf, sid)[0][0, 0])
+                    (net_g.infer(feats, p_len, pitch, pitchf, sid)[0][:, 0])
                     .data.cpu()
                     .float()
                     .numpy()
                 )
             else:
                 audio1 = (
-                    (net_g.infer(feats, p_len, sid)[0][0, 0]).data.cpu().float().numpy()
+                    (net_g.infer(feats, p_len, sid)[0][:, 0]).data.cpu().float().numpy()
                 )
         del feats, p_len, padding_mask
         if torch.cuda.is_available():
@@ -270,7 +411,95 @@ class VC(object):
         t2 = ttime()
         times[0] += t1 - t0
         times[2] += t2 - t1
-        return audio1
+        # Output samples per pitch frame
+        hop = audio1.shape[-1] // max(1, max(p_lens))
+        return [out[: n * hop] for out, n in zip(audio1, p_lens)]
+
+    def convert_chunks(
+        self,
+        model,
+        net_g,
+        sid,
+        audio_pad,
+        opt_ts,
+        pitch,
+        pitchf,
+        times,
+        index,
+        big_npy,
+        index_rate,
+        version,
+        protect,
+        batch_size=RVC_BATCH_SIZE,
+    ):
+        """Cut audio_pad at opt_ts, convert the chunks in batches of similar
+        length, each padded to its longest chunk, and join the results in
+        order."""
+        bounds = []  # audio start, audio end, frame start, frame end
+        s = 0
+        for t in opt_ts:
+            t = t // self.window * self.window
+            bounds.append(
+                (
+                    s,
+                    t + self.t_pad2 + self.window,
+                    s // self.window,
+                    (t + self.t_pad2) // self.window,
+                )
+            )
+            s = t
+        bounds.append((s, None, s // self.window, None))
+
+        chunks = [audio_pad[start:end] for start, end, _, _ in bounds]
+        use_pitch = pitch is not None and pitchf is not None
+        if use_pitch:
+            pitches = [pitch[:, f0:f1] for _, _, f0, f1 in bounds]
+            pitchfs = [pitchf[:, f0:f1] for _, _, f0, f1 in bounds]
+
+        # Neighbours by length, so that little of a batch is padding
+        order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]))
+        step = max(1, batch_size)
+        audio_opt = [None] * len(bounds)
+        for first in range(0, len(order), step):
+            batch = order[first : first + step]
+            lengths = [len(chunks[i]) for i in batch]
+            audios = np.stack(
+                [np.pad(chunks[i], (0, max(lengths) - len(chunks[i])))
+                 for i in batch]
+            )
+            if use_pitch:
+                frames = max(pitches[i].shape[1] for i in batch)
+                # 1 is the unvoiced coarse pitch, 0 Hz the unvoiced f0
+                pitch_batch = torch.cat(
+                    [F.pad(pitches[i], (0, frames - pitches[i].shape[1]),
+                           value=1) for i in batch]
+                )
+                pitchf_batch = torch.cat(
+                    [F.pad(pitchfs[i], (0, frames - pitchfs[i].shape[1]))
+                     for i in batch]
+                )
+            else:
+                pitch_batch = pitchf_batch = None
+
+            converted = self.vc_batch(
+                model,
+                net_g,
+                sid,
+                audios,
+                pitch_batch,
+                pitchf_batch,
+                times,
+                index,
+                big_npy,
+                index_rate,
+                version,
+                protect,
+                lengths=lengths,
+            )
+            for i, audio1 in zip(batch, converted):
+                audio_opt[i] = audio1[self.t_pad_tgt : -self.t_pad_tgt]
+
+        return np.concatenate(audio_opt)
 
     def pipeline(
         self,
@@ -313,24 +542,9 @@ class VC(object):
             logger.warning("File index Not found, set None")
 
         audio = signal.filtfilt(bh, ah, audio)
-        audio_pad = np.pad(audio, (self.window // 2, self.window // 2), mode="reflect")
-        opt_ts = []
-        if audio_pad.shape[0] > self.t_max:
-            audio_sum = np.zeros_like(audio)
-            for i in range(self.window):
-                audio_sum += audio_pad[i : i - self.window]
-            for t in range(self.t_center, audio.shape[0], self.t_center):
-                opt_ts.append(
-                    t
-                    - self.t_query
-                    + np.where(
-                        np.abs(audio_sum[t - self.t_query : t + self.t_query])
-                        == np.abs(audio_sum[t - self.t_query : t + self.t_query]).min()
-                    )[0][0]
-                )
-        s = 0
-        audio_opt = []
-        t = None
+        opt_ts = find_split_points(
+            audio, self.window, self.t_center, self.t_query, self.t_max
+        )
         t1 = ttime()
         audio_pad = np.pad(audio, (self.t_pad, self.t_pad), mode="reflect")
         p_len = audio_pad.shape[0] // self.window
@@ -365,78 +579,21 @@ class VC(object):
             pitchf = torch.tensor(pitchf, device=self.device).unsqueeze(0).float()
         t2 = ttime()
         times[1] += t2 - t1
-        for t in opt_ts:
-            t = t // self.window * self.window
-            if if_f0 == 1:
-                audio_opt.append(
-                    self.vc(
-                        model,
-                        net_g,
-                        sid,
-                        audio_pad[s : t + self.t_pad2 + self.window],
-                        pitch[:, s // self.window : (t + self.t_pad2) // self.window],
-                        pitchf[:, s // self.window : (t + self.t_pad2) // self.window],
-                        times,
-                        index,
-                        big_npy,
-                        index_rate,
-                        version,
-                        protect,
-                    )[self.t_pad_tgt : -self.t_pad_tgt]
-                )
-            else:
-                audio_opt.append(
-                    self.vc(
-                        model,
-                        net_g,
-                        sid,
-                        audio_pad[s : t + self.t_pad2 + self.window],
-                        None,
-                        None,
-                        times,
-                        index,
-                        big_npy,
-                        index_rate,
-                        version,
-                        protect,
-                    )[self.t_pad_tgt : -self.t_pad_tgt]
-                )
-            s = t
-        if if_f0 == 1:
-            audio_opt.append(
-                self.vc(
-                    model,
-                    net_g,
-                    sid,
-                    audio_pad[t:],
-                    pitch[:, t // self.window :] if t is not None else pitch,
-                    pitchf[:, t // self.window :] if t is not None else pitchf,
-                    times,
-                    index,
-                    big_npy,
-                    index_rate,
-                    version,
-                    protect,
-                )[self.t_pad_tgt : -self.t_pad_tgt]
-            )
-        else:
-            audio_opt.append(
-                self.vc(
-                    model,
-                    net_g,
-                    sid,
-                    audio_pad[t:],
-                    None,
-                    None,
-                    times,
-                    index,
-                    big_npy,
-                    index_rate,
-                    version,
-                    protect,
-                )[self.t_pad_tgt : -self.t_pad_tgt]
-            )
-        audio_opt = np.concatenate(audio_opt)
+        audio_opt = self.convert_chunks(
+            model,
+            net_g,
+            sid,
+            audio_pad,
+            opt_ts,
+            pitch,
+            pitchf,
+            times,
+            index,
+            big_npy,
+            index_rate,
+            version,
+            protect,
+        )
         if rms_mix_rate != 1:
             audio_opt = change_rms(audio, 16000, audio_opt, tgt_sr, rms_mix_rate)
         if resample_sr >= 16000 and tgt_sr != resample_sr:
@@ -4,8 +4,18 @@ import gc
 import numpy as np
 import os
 import shutil
+import hashlib
+import tempfile
+import itertools
 import warnings
 import threading
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
 from tqdm import tqdm
 from lib.infer_pack.models import (
     SynthesizerTrnMs256NSFsid,
@@ -25,7 +35,18 @@ from soni_translate.utils import (
 from scipy import signal
 from time import time as ttime
 import faiss
-from vci_pipeline import VC, change_rms, bh, ah
+from vci_pipeline import (
+    VC,
+    change_rms,
+    bh,
+    ah,
+    find_split_points,
+    compute_cpu_f0,
+    CPU_F0_METHODS,
+    RVC_BATCH_SIZE,
+)
+from soni_translate.f0_cache import get_f0_cache
+from soni_translate.model_pool import keep_models_warm
 import librosa
 
 warnings.filterwarnings("ignore")
@@ -115,6 +136,25 @@ BASE_MODELS = [
 ]
 BASE_DIR = "."
 
+# Memory budget of the loaded voice models and FAISS indexes
+RVC_REGISTRY_MAX_MB = int(os.environ.get("RVC_REGISTRY_MAX_MB", 2048))
+RVC_INDEX_CACHE_DIR = os.environ.get(
+    "RVC_INDEX_CACHE_DIR", os.path.join(os.getcwd(), ".rvc-index-cache")
+)
+# Processes extracting pitch before the conversion
+F0_WORKERS = int(os.environ.get("F0_WORKERS", min(4, os.cpu_count() or 1)))
+# Pitch methods extracted ahead in those processes; "pm" takes less time
+# in the conversion threads than it saves
+F0_PREFETCH_METHODS = os.environ.get(
+    "F0_PREFETCH_METHODS", "harvest"
+).split(",")
+# Seconds of audio below which the pitch is left to the conversion
+F0_PREFETCH_MIN_SECONDS = float(
+    os.environ.get("F0_PREFETCH_MIN_SECONDS", 60)
+)
+# Conversion workers: "thread", "process" or "auto" (processes on CPU)
+VC_WORKER_MODE = os.environ.get("VC_WORKER_MODE", "auto")
+
 
 def load_hu_bert(config):
     from fairseq import checkpoint_utils
@@ -185,6 +225,385 @@ def load_trained_model(model_path, config):
     return n_spk, tgt_sr, net_g, vc, cpt, version
 
 
+def load_conversion_audio(input_audio_path):
+    """16 kHz mono audio, normalized and high-pass filtered."""
+    audio = load_audio(input_audio_path, 16000)
+
+    # Normalize audio
+    audio_max = np.abs(audio).max() / 0.95
+    if audio_max > 1:
+        audio = audio / audio_max
+
+    return signal.filtfilt(bh, ah, audio)
+
+
+def padded_conversion_audio(input_audio_path, t_pad, window):
+    """Conversion audio padded as in VC.pipeline, and its pitch frames."""
+    audio = load_conversion_audio(input_audio_path)
+    audio_pad = np.pad(audio, (t_pad, t_pad), mode="reflect")
+    return audio_pad, audio_pad.shape[0] // window
+
+
+def extract_f0_job(job):
+    """Worker process: store the pitch of one file in the F0 cache."""
+    input_audio_path, t_pad, window, sr, f0_method, filter_radius = job
+    try:
+        audio_pad, p_len = padded_conversion_audio(
+            input_audio_path, t_pad, window
+        )
+
+        f0_cache = get_f0_cache()
+        cache_key = f0_cache.make_key(
+            audio_pad, f0_method, sr, window, p_len, filter_radius
+        )
+        if cache_key not in f0_cache:
+            f0 = compute_cpu_f0(
+                audio_pad, p_len, f0_method, filter_radius, sr, window
+            )
+            f0_cache.save(cache_key, f0)
+    except Exception as error:
+        return f"{input_audio_path}: {str(error)}"
+    return None
+
+
+def time_f0_job(job):
+    """Seconds to load one file and extract its pitch, without the F0
+    cache (benchmark_f0_prefetch)."""
+    input_audio_path, t_pad, window, sr, f0_method, filter_radius = job
+    time_start = ttime()
+    audio_pad, p_len = padded_conversion_audio(
+        input_audio_path, t_pad, window
+    )
+    compute_cpu_f0(audio_pad, p_len, f0_method, filter_radius, sr, window)
+    return ttime() - time_start
+
+
+# Pitch prefetch processes, started once per process
+_f0_pool = None
+_f0_pool_lock = threading.Lock()
+
+
+def f0_pool_context():
+    return multiprocessing.get_context("spawn")
+
+
+def get_f0_pool():
+    """Get the process pool of the pitch prefetch. Spawned workers import
+    this module (torch, fairseq, faiss), so they are started on the first
+    prefetch and kept for the next ones."""
+    global _f0_pool
+    with _f0_pool_lock:
+        if _f0_pool is None:
+            _f0_pool = ProcessPoolExecutor(
+                max_workers=max(1, F0_WORKERS), mp_context=f0_pool_context()
+            )
+        return _f0_pool
+
+
+def audio_seconds(audio_files):
+    """Total duration of the readable files."""
+    total = 0.0
+    for path in audio_files:
+        try:
+            total += sf.info(path).duration
+        except Exception as error:
+            logger.debug(f"{path}: {str(error)}")
+    return total
+
+
+def benchmark_f0_prefetch(
+    audio_files, f0_method="harvest", window=160, t_pad=16000, sr=16000
+):
+    """
+    Pitch of `audio_files` extracted one after another in this process
+    (as the conversion threads do) against the prefetch pool, cold (with
+    the start of the workers) and warm.
+
+    Returns:
+        dict: "serial", "pool_cold" and "pool_warm" -> elapsed seconds
+    """
+    jobs = [(path, t_pad, window, sr, f0_method, 3) for path in audio_files]
+    results = {}
+
+    time_start = ttime()
+    for job in jobs:
+        time_f0_job(job)
+    results["serial"] = ttime() - time_start
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, F0_WORKERS), mp_context=f0_pool_context()
+    ) as executor:
+        time_start = ttime()
+        list(executor.map(time_f0_job, jobs))
+        results["pool_cold"] = ttime() - time_start
+
+        time_start = ttime()
+        list(executor.map(time_f0_job, jobs))
+        results["pool_warm"] = ttime() - time_start
+
+    logger.info(
+        f"F0 {f0_method}, {len(jobs)} files, "
+        f"{audio_seconds(audio_files):.1f}s of audio: "
+        f"serial {results['serial']:.2f}s, "
+        f"{F0_WORKERS} workers {results['pool_cold']:.2f}s cold, "
+        f"{results['pool_warm']:.2f}s warm"
+    )
+    return results
+
+
+def benchmark_rvc_batching(
+    model_path,
+    audio_file=None,
+    seconds=120,
+    batch_sizes=(1, RVC_BATCH_SIZE),
+    f0_method="pm",
+    tolerance=0.05,
+):
+    """
+    CPU time of VC.convert_chunks on one long clip for each batch size,
+    and the difference of each batched output from the unbatched one.
+    Without `audio_file`, a synthetic voiced signal of `seconds` is used.
+
+    The random draws of the synthesizer (prior noise, NSF phase and
+    noise) are zeroed during the runs, so both paths are deterministic
+    and differ only by the padding of the batches.
+
+    Returns:
+        dict: batch size -> (elapsed seconds, relative RMS difference)
+    """
+    from unittest import mock
+
+    config = Config(only_cpu=True)
+    hubert = load_hu_bert(config)
+    _, _, net_g, pipe, cpt, version = load_trained_model(model_path, config)
+
+    if audio_file:
+        audio = load_conversion_audio(audio_file)
+    else:
+        sr = pipe.sr
+        t = np.arange(int(seconds * sr)) / sr
+        f0 = 160 + 40 * np.sin(2 * np.pi * 0.3 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 2.1 * t) ** 2
+        audio = sum(np.sin(k * phase) / k for k in range(1, 6))
+        audio = signal.filtfilt(bh, ah, 0.3 * envelope * audio)
+    opt_ts = find_split_points(
+        audio, pipe.window, pipe.t_center, pipe.t_query, pipe.t_max
+    )
+    audio_pad = np.pad(audio, (pipe.t_pad, pipe.t_pad), mode="reflect")
+    p_len = audio_pad.shape[0] // pipe.window
+    pitch = pitchf = None
+    if cpt.get("f0", 1) == 1:
+        pitch, pitchf = pipe.get_f0(
+            None, audio_pad, p_len, 0, f0_method, 3, None
+        )
+        pitch = torch.tensor(pitch[:p_len]).unsqueeze(0).long()
+        pitchf = torch.tensor(pitchf[:p_len]).unsqueeze(0).float()
+    sid = torch.tensor(0).unsqueeze(0).long()
+
+    results = {}
+    reference = None
+    with mock.patch("torch.randn_like", torch.zeros_like), mock.patch(
+        "torch.rand", torch.zeros
+    ):
+        for batch_size in batch_sizes:
+            times = [0, 0, 0]
+            time_start = ttime()
+            output = pipe.convert_chunks(
+                hubert, net_g, sid, audio_pad, opt_ts, pitch, pitchf,
+                times, None, None, 0, version, 0.33, batch_size=batch_size,
+            )
+            elapsed = ttime() - time_start
+            if reference is None:
+                reference = output
+            size = min(len(reference), len(output))
+            difference = np.sqrt(
+                np.mean((output[:size] - reference[:size]) ** 2)
+                / max(np.mean(reference[:size] ** 2), 1e-12)
+            )
+            results[batch_size] = (elapsed, float(difference))
+            logger.info(
+                f"RVC batch {batch_size}: {len(opt_ts) + 1} chunks of "
+                f"{len(audio) / pipe.sr:.0f}s in {elapsed:.2f}s, "
+                f"difference {difference:.4f} "
+                f"({'ok' if difference <= tolerance else 'above'} "
+                f"{tolerance})"
+            )
+    return results
+
+
+def module_footprint(module):
+    """Bytes held by the parameters and buffers of a torch module."""
+    tensors = itertools.chain(module.parameters(), module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """Voice models, FAISS indexes and HuBERT kept loaded across calls.
+
+    Models and indexes share one least-recently-used order and are evicted
+    when their footprint exceeds the memory budget. HuBERT is loaded once
+    per device and precision. The `big_npy` matrix of an index is written
+    once to the index cache dir and memory-mapped afterwards; the file is
+    removed when the index is evicted or the registry cleared.
+    """
+
+    def __init__(self, max_size_mb=None, index_cache_dir=None):
+        if max_size_mb is None:
+            max_size_mb = RVC_REGISTRY_MAX_MB
+        self.max_size = max_size_mb * 1024 * 1024
+        self.index_cache_dir = index_cache_dir or RVC_INDEX_CACHE_DIR
+        self._entries = OrderedDict()  # key -> (value, size), oldest first
+        self._hubert = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _file_key(path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime, stat.st_size)
+
+    def _get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            logger.debug(f"Registry hit {key[0]} {key[1][0]}")
+            return self._entries[key][0]
+        return None
+
+    def _add(self, key, value, size):
+        self._entries[key] = (value, size)
+        self._evict(keep=1)
+
+    def _evict(self, keep):
+        total = sum(size for _, size in self._entries.values())
+        while total > self.max_size and len(self._entries) > keep:
+            key, (_, size) = self._entries.popitem(last=False)
+            total -= size
+            self._release(key)
+            logger.debug(f"Registry evicted {key[0]} {key[1][0]}")
+
+    def _release(self, key):
+        """Remove the `big_npy` file of an evicted index."""
+        if key[0] != "index":
+            return
+        path = self._index_cache_path(key[1])
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as error:
+            # Still mapped by a conversion on platforms that lock it
+            logger.debug(f"Index cache {path}: {str(error)}")
+
+    def get_hubert(self, config):
+        key = (config.device, config.is_half)
+        with self._lock:
+            if key not in self._hubert:
+                self._hubert[key] = load_hu_bert(config)
+            return self._hubert[key]
+
+    def get_model(self, model_path, config):
+        """Same tuple as load_trained_model, loaded once per file."""
+        if not model_path:
+            raise ValueError("No model found")
+
+        key = (
+            "model", self._file_key(model_path), config.device, config.is_half
+        )
+        with self._lock:
+            model = self._get(key)
+            if model is None:
+                (
+                    n_spk, tgt_sr, net_g, pipe, cpt, version
+                ) = load_trained_model(model_path, config)
+                # The weights already live in net_g
+                cpt = {k: v for k, v in cpt.items() if k != "weight"}
+                model = (n_spk, tgt_sr, net_g, pipe, cpt, version)
+                self._add(key, model, module_footprint(net_g))
+            return model
+
+    def _index_cache_path(self, file_key):
+        name = hashlib.sha256(repr(file_key).encode()).hexdigest()[:32]
+        return os.path.join(self.index_cache_dir, name + ".npy")
+
+    def _load_big_npy(self, index, file_key):
+        path = self._index_cache_path(file_key)
+
+        if not os.path.exists(path):
+            os.makedirs(self.index_cache_dir, exist_ok=True)
+            big_npy = index.reconstruct_n(0, index.ntotal)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self.index_cache_dir, suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, big_npy)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return np.load(path, mmap_mode="r")
+
+    def get_index(self, file_index):
+        """FAISS index and its memory-mapped `big_npy`."""
+        file_key = self._file_key(file_index)
+        key = ("index", file_key)
+        with self._lock:
+            entry = self._get(key)
+            if entry is None:
+                logger.info(f"Loading index {file_index}")
+                index = faiss.read_index(file_index)
+                big_npy = self._load_big_npy(index, file_key)
+                entry = (index, big_npy)
+                self._add(key, entry, file_key[2])
+            return entry
+
+    def trim(self):
+        """Evict down to the budget; a zero budget also drops HuBERT."""
+        with self._lock:
+            self._evict(keep=0)
+            if self.max_size <= 0:
+                self._hubert.clear()
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._hubert.clear()
+            # Unmap the arrays before removing their files
+            gc.collect()
+            for key in keys:
+                self._release(key)
+
+    def report(self):
+        """Footprint in MB of every loaded entry, most recently used last."""
+        with self._lock:
+            rows = [
+                (key[0], key[1][0], size / 1024 / 1024)
+                for key, (_, size) in self._entries.items()
+            ]
+            for (device, _), model in self._hubert.items():
+                rows.append(
+                    ("hubert", device, module_footprint(model) / 1024 / 1024)
+                )
+
+        for kind, name, size in rows:
+            logger.debug(f"Registry {kind}: {size:.1f} MB, {name}")
+        return rows
+
+
+# Global registry instance
+_model_registry = None
+
+
+def get_model_registry() -> ModelRegistry:
+    """Get the global voice model registry instance."""
+    global _model_registry
+    if _model_registry is None:
+        _model_registry = ModelRegistry()
+    return _model_registry
+
+
 class ClassVoices:
     def __init__(self, only_cpu=False):
         self.model_config = {}
@@ -272,39 +691,15 @@ class ClassVoices:
 
         f0_up_key = int(f0_up_key)
 
-        audio = load_audio(input_audio_path, 16000)
-
-        # Normalize audio
-        audio_max = np.abs(audio).max() / 0.95
-        if audio_max > 1:
-            audio /= audio_max
+        audio = load_conversion_audio(input_audio_path)
 
         times = [0, 0, 0]
 
-        # filters audio signal, pads it, computes sliding window sums,
-        # and extracts optimized time indices
-        audio = signal.filtfilt(bh, ah, audio)
-        audio_pad = np.pad(
-            audio, (pipe.window // 2, pipe.window // 2), mode="reflect"
+        # extracts optimized time indices
+        opt_ts = find_split_points(
+            audio, pipe.window, pipe.t_center, pipe.t_query, pipe.t_max
         )
-        opt_ts = []
-        if audio_pad.shape[0] > pipe.t_max:
-            audio_sum = np.zeros_like(audio)
-            for i in range(pipe.window):
-                audio_sum += audio_pad[i:i - pipe.window]
-            for t in range(pipe.t_center, audio.shape[0], pipe.t_center):
-                opt_ts.append(
-                    t
-                    - pipe.t_query
-                    + np.where(
-                        np.abs(audio_sum[t - pipe.t_query: t + pipe.t_query])
-                        == np.abs(audio_sum[t - pipe.t_query: t + pipe.t_query]).min()
-                    )[0][0]
-                )
 
-        s = 0
-        audio_opt = []
-        t = None
         t1 = ttime()
 
         sid_value = 0
@@ -339,63 +734,22 @@ class ClassVoices:
 
         t2 = ttime()
         times[1] += t2 - t1
-        for t in opt_ts:
-            t = t // pipe.window * pipe.window
-            if if_f0 == 1:
-                pitch_slice = pitch[
-                    :, s // pipe.window: (t + pipe.t_pad2) // pipe.window
-                ]
-                pitchf_slice = pitchf[
-                    :, s // pipe.window: (t + pipe.t_pad2) // pipe.window
-                ]
-            else:
-                pitch_slice = None
-                pitchf_slice = None
-
-            audio_slice = audio_pad[s:t + pipe.t_pad2 + pipe.window]
-            audio_opt.append(
-                pipe.vc(
-                    self.hu_bert_model,
-                    net_g,
-                    sid,
-                    audio_slice,
-                    pitch_slice,
-                    pitchf_slice,
-                    times,
-                    index,
-                    big_npy,
-                    index_rate,
-                    version,
-                    protect,
-                )[pipe.t_pad_tgt:-pipe.t_pad_tgt]
-            )
-            s = t
-
-        pitch_end_slice = pitch[
-            :, t // pipe.window:
-        ] if t is not None else pitch
-        pitchf_end_slice = pitchf[
-            :, t // pipe.window:
-        ] if t is not None else pitchf
-
-        audio_opt.append(
-            pipe.vc(
-                self.hu_bert_model,
-                net_g,
-                sid,
-                audio_pad[t:],
-                pitch_end_slice,
-                pitchf_end_slice,
-                times,
-                index,
-                big_npy,
-                index_rate,
-                version,
-                protect,
-            )[pipe.t_pad_tgt:-pipe.t_pad_tgt]
+        audio_opt = pipe.convert_chunks(
+            self.hu_bert_model,
+            net_g,
+            sid,
+            audio_pad,
+            opt_ts,
+            pitch,
+            pitchf,
+            times,
+            index,
+            big_npy,
+            index_rate,
+            version,
+            protect,
         )
 
-        audio_opt = np.concatenate(audio_opt)
         if rms_mix_rate != 1:
             audio_opt = change_rms(
                 audio, 16000, audio_opt, tgt_sr, rms_mix_rate
@@ -449,8 +803,7 @@ class ClassVoices:
             subtype="vorbis",
         )
 
-        self.model_config[task_id]["result"].append(output_audio_path)
-        self.output_list.append(output_audio_path)
+        return output_audio_path
 
     def make_test(
         self,
@@ -519,9 +872,316 @@ class ClassVoices:
         gc.collect()
         torch.cuda.empty_cache()
 
+    def load_model_context(self, id_tag, audio_files=None):
+        """Loaded model, index and f0 file of a tag, in the order `infer`
+        takes them. The pitch of `audio_files` is extracted up front."""
+        if not self.hu_bert_model:
+            self.hu_bert_model = get_model_registry().get_hubert(self.config)
+
+        # Model params
+        params = self.model_config[id_tag]
+
+        model_path = params["file_model"]
+        f0_method = params["pitch_algo"]
+        file_index = params["file_index"]
+        index_rate = params["index_influence"]
+        f0_file = params["file_pitch_algo"]
+
+        # Load model
+        (
+            n_spk,
+            tgt_sr,
+            net_g,
+            pipe,
+            cpt,
+            version
+        ) = get_model_registry().get_model(model_path, self.config)
+        if_f0 = cpt.get("f0", 1)  # pitch data
+
+        # Load index
+        if os.path.exists(file_index) and index_rate != 0:
+            try:
+                index, big_npy = get_model_registry().get_index(file_index)
+            except Exception as error:
+                logger.error(f"Index: {str(error)}")
+                index_rate = 0
+                index = big_npy = None
+        else:
+            logger.warning("File index not found")
+            index_rate = 0
+            index = big_npy = None
+
+        # Load f0 file
+        inp_f0 = None
+        if os.path.exists(f0_file):
+            try:
+                with open(f0_file, "r") as f:
+                    lines = f.read().strip("\n").split("\n")
+                inp_f0 = []
+                for line in lines:
+                    inp_f0.append([float(i) for i in line.split(",")])
+                inp_f0 = np.array(inp_f0, dtype="float32")
+            except Exception as error:
+                logger.error(f"f0 file: {str(error)}")
+
+        if "rmvpe" in f0_method:
+            if not self.model_pitch_estimator:
+                from lib.rmvpe import RMVPE
+
+                logger.info("Loading vocal pitch estimator model")
+                self.model_pitch_estimator = RMVPE(
+                    "rmvpe.pt",
+                    is_half=self.config.is_half,
+                    device=self.config.device
+                )
+
+            pipe.model_rmvpe = self.model_pitch_estimator
+
+        if if_f0 == 1 and audio_files:
+            self.prefetch_f0(
+                audio_files,
+                pipe,
+                f0_method,
+                params["respiration_median_filtering"],
+            )
+
+        return (
+            n_spk,
+            tgt_sr,
+            net_g,
+            pipe,
+            cpt,
+            version,
+            if_f0,
+            index_rate,
+            index,
+            big_npy,
+            inp_f0,
+        )
+
+    def convert_file(self, id_tag, context, input_audio_path, overwrite):
+        return self.infer(
+            id_tag,
+            self.model_config[id_tag],
+            *context,
+            input_audio_path,
+            overwrite,
+        )
+
+    def _run_conversions(
+        self, jobs_by_tag, overwrite, parallel_workers, stats
+    ):
+        """Yield (index, tag, output path) as conversions finish."""
+        if not jobs_by_tag:
+            return
+
+        if parallel_workers <= 1:
+            for id_tag, jobs in jobs_by_tag.items():
+                stats[id_tag] = [ttime(), 0, 0.0, 0.0]
+                context = self.load_model_context(
+                    id_tag, [path for _, path in jobs]
+                )
+                for i, input_audio_path in jobs:
+                    try:
+                        output = self.convert_file(
+                            id_tag, context, input_audio_path, overwrite
+                        )
+                    except Exception as error:
+                        logger.error(f"{id_tag} {input_audio_path}: {error}")
+                        output = None
+                    yield i, id_tag, output
+            return
+
+        if VC_WORKER_MODE == "auto":
+            use_processes = self.config.device == "cpu"
+        else:
+            use_processes = VC_WORKER_MODE == "process"
+
+        # With more models than workers, the models run in waves of at
+        # most parallel_workers, one worker each
+        tags = list(jobs_by_tag)
+        for first in range(0, len(tags), parallel_workers):
+            wave = OrderedDict(
+                (id_tag, jobs_by_tag[id_tag])
+                for id_tag in tags[first:first + parallel_workers]
+            )
+            yield from self._run_wave(
+                wave, overwrite, parallel_workers, use_processes, stats
+            )
+
+    def _run_wave(
+        self, jobs_by_tag, overwrite, parallel_workers, use_processes, stats
+    ):
+        """Convert the files of at most parallel_workers models at once,
+        the workers split evenly between them."""
+        per_model = max(1, parallel_workers // len(jobs_by_tag))
+        torch_threads = max(
+            1, (os.cpu_count() or 1) // (per_model * len(jobs_by_tag))
+        )
+        logger.info(
+            f"Voice conversion: {len(jobs_by_tag)} models, {per_model} "
+            f"{'processes' if use_processes else 'threads'} each"
+        )
+
+        if use_processes:
+            # Before any worker starts, as load_model_context does
+            for id_tag, jobs in jobs_by_tag.items():
+                self.prefetch_process_f0(id_tag, [path for _, path in jobs])
+
+        executors = []
+        futures = {}
+        try:
+            for id_tag, jobs in jobs_by_tag.items():
+                workers = min(per_model, len(jobs))
+                stats[id_tag] = [ttime(), 0, 0.0, 0.0]
+                if use_processes:
+                    executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=init_vc_worker,
+                        initargs=(torch_threads,),
+                    )
+                    conf = {
+                        k: v for k, v in self.model_config[id_tag].items()
+                        if k != "result"
+                    }
+                    for i, input_audio_path in jobs:
+                        future = executor.submit(
+                            convert_file_job,
+                            id_tag,
+                            conf,
+                            input_audio_path,
+                            overwrite,
+                        )
+                        futures[future] = (i, id_tag, input_audio_path)
+                else:
+                    context = self.load_model_context(
+                        id_tag, [path for _, path in jobs]
+                    )
+                    executor = ThreadPoolExecutor(max_workers=workers)
+                    for i, input_audio_path in jobs:
+                        future = executor.submit(
+                            self.convert_file,
+                            id_tag,
+                            context,
+                            input_audio_path,
+                            overwrite,
+                        )
+                        futures[future] = (i, id_tag, input_audio_path)
+                executors.append(executor)
+
+            for future in as_completed(futures):
+                i, id_tag, input_audio_path = futures[future]
+                try:
+                    output = future.result()
+                except Exception as error:
+                    logger.error(f"{id_tag} {input_audio_path}: {error}")
+                    output = None
+                yield i, id_tag, output
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def iter_convert(self, jobs_by_tag, overwrite=False, parallel_workers=1):
+        """
+        Convert the files of every tag and yield (index, output path) in
+        index order, each as soon as it and every earlier one are done.
+
+        Parameters:
+        - jobs_by_tag (dict): tag -> list of (index, audio file).
+        - overwrite (bool): Replace the input files.
+        - parallel_workers (int): Workers shared by the models; 1 converts
+          the files one after another.
+        """
+        order = sorted(i for jobs in jobs_by_tag.values() for i, _ in jobs)
+        ready = {}
+        position = 0
+        stats = {}  # tag -> [start, files, audio seconds, elapsed]
+
+        for i, id_tag, output in self._run_conversions(
+            jobs_by_tag, overwrite, parallel_workers, stats
+        ):
+            tag_stats = stats[id_tag]
+            tag_stats[1] += 1
+            tag_stats[3] = ttime() - tag_stats[0]
+            if output:
+                try:
+                    tag_stats[2] += sf.info(output).duration
+                except Exception as error:
+                    logger.debug(str(error))
+
+            ready[i] = output
+            while position < len(order) and order[position] in ready:
+                yield order[position], ready.pop(order[position])
+                position += 1
+
+        for id_tag, (_, files, audio_seconds, elapsed) in stats.items():
+            elapsed = max(elapsed, 1e-6)
+            logger.info(
+                f"{id_tag}: {files} files, {audio_seconds:.1f}s of audio "
+                f"in {elapsed:.1f}s ({files / elapsed:.2f} files/s, "
+                f"{audio_seconds / elapsed:.1f}x real time)"
+            )
+
+    def prefetch_f0(
+        self, audio_files, pipe, f0_method, filter_radius, workers=F0_WORKERS
+    ):
+        """Extract the pitch of the files in the prefetch pool so the
+        conversion threads find it in the F0 cache. Only for the
+        F0_PREFETCH_METHODS and at least F0_PREFETCH_MIN_SECONDS of audio,
+        below which starting the workers costs more than it saves (see
+        benchmark_f0_prefetch)."""
+        if (
+            f0_method not in CPU_F0_METHODS
+            or f0_method not in F0_PREFETCH_METHODS
+            or workers < 2
+        ):
+            return
+
+        jobs = [
+            (path, pipe.t_pad, pipe.window, pipe.sr, f0_method, filter_radius)
+            for path in audio_files
+            if os.path.exists(path)
+        ]
+        if len(jobs) < 2:
+            return
+        seconds = audio_seconds(path for path, *_ in jobs)
+        if seconds < F0_PREFETCH_MIN_SECONDS:
+            logger.debug(f"F0 prefetch skipped: {seconds:.1f}s of audio")
+            return
+
+        t0 = ttime()
+        for error in get_f0_pool().map(extract_f0_job, jobs):
+            if error:
+                logger.error(f"F0: {error}")
+        logger.debug(
+            f"Pitch of {len(jobs)} files with {f0_method} "
+            f"in {ttime() - t0:.1f}s"
+        )
+
+    def prefetch_process_f0(self, id_tag, audio_files):
+        """prefetch_f0 for the conversion worker processes, with the
+        padding of their CPU config. The model is not loaded here, so the
+        pitch is also extracted for models that do not use it."""
+        config = self.config
+        if config.device != "cpu":
+            config = Config(only_cpu=True)
+        params = self.model_config[id_tag]
+        self.prefetch_f0(
+            audio_files,
+            VC(0, config),
+            params["pitch_algo"],
+            params["respiration_median_filtering"],
+        )
+
     def unload_models(self):
         self.hu_bert_model = None
         self.model_pitch_estimator = None
+        if keep_models_warm():
+            # Batch workers keep the models within the registry budget
+            get_model_registry().trim()
+        else:
+            get_model_registry().clear()
         gc.collect()
         torch.cuda.empty_cache()
 
@@ -558,181 +1218,72 @@ class ClassVoices:
             logger.info("Cut list tags")
             tag_list = tag_list[:len(audio_files)]
 
-        tag_file_pairs = list(zip(tag_list, audio_files))
-        sorted_tag_file = sorted(tag_file_pairs, key=lambda x: x[0])
-
-        # Base params
-        if not self.hu_bert_model:
-            self.hu_bert_model = load_hu_bert(self.config)
-
-        cache_params = None
-        threads = []
-        progress_bar = tqdm(total=len(tag_list), desc="Progress")
-        for i, (id_tag, input_audio_path) in enumerate(sorted_tag_file):
-
+        jobs_by_tag = OrderedDict()
+        for i, (id_tag, input_audio_path) in enumerate(
+            zip(tag_list, audio_files)
+        ):
             if id_tag not in self.model_config.keys():
                 logger.info(
                     f"No configured model for {id_tag} with {input_audio_path}"
                 )
                 continue
+            jobs_by_tag.setdefault(id_tag, []).append((i, input_audio_path))
 
-            if (
-                len(threads) >= parallel_workers
-                or cache_params != id_tag
-                and cache_params is not None
-            ):
-
-                self.run_threads(threads)
-                progress_bar.update(len(threads))
+        for id_tag in jobs_by_tag:
+            self.model_config[id_tag]["result"] = []
 
-                threads = []
-
-            if cache_params != id_tag:
+        progress_bar = tqdm(total=len(tag_list), desc="Progress")
+        for i, output_audio_path in self.iter_convert(
+            jobs_by_tag, overwrite, parallel_workers
+        ):
+            progress_bar.update(1)
+            if output_audio_path:
+                self.model_config[tag_list[i]]["result"].append(
+                    output_audio_path
+                )
+                self.output_list.append(output_audio_path)
+        progress_bar.close()
+        get_model_registry().report()
 
-                self.model_config[id_tag]["result"] = []
+        final_result = list(self.output_list)
 
-                # Unload previous
-                (
-                    n_spk,
-                    tgt_sr,
-                    net_g,
-                    pipe,
-                    cpt,
-                    version,
-                    if_f0,
-                    index_rate,
-                    index,
-                    big_npy,
-                    inp_f0,
-                ) = [None] * 11
-                gc.collect()
-                torch.cuda.empty_cache()
-
-                # Model params
-                params = self.model_config[id_tag]
-
-                model_path = params["file_model"]
-                f0_method = params["pitch_algo"]
-                file_index = params["file_index"]
-                index_rate = params["index_influence"]
-                f0_file = params["file_pitch_algo"]
-
-                # Load model
-                (
-                    n_spk,
-                    tgt_sr,
-                    net_g,
-                    pipe,
-                    cpt,
-                    version
-                ) = load_trained_model(model_path, self.config)
-                if_f0 = cpt.get("f0", 1)  # pitch data
-
-                # Load index
-                if os.path.exists(file_index) and index_rate != 0:
-                    try:
-                        index = faiss.read_index(file_index)
-                        big_npy = index.reconstruct_n(0, index.ntotal)
-                    except Exception as error:
-                        logger.error(f"Index: {str(error)}")
-                        index_rate = 0
-                        index = big_npy = None
-                else:
-                    logger.warning("File index not found")
-                    index_rate = 0
-                    index = big_npy = None
+        return final_result
 
-                # Load f0 file
-                inp_f0 = None
-                if os.path.exists(f0_file):
-                    try:
-                        with open(f0_file, "r") as f:
-                            lines = f.read().strip("\n").split("\n")
-                        inp_f0 = []
-                        for line in lines:
-                            inp_f0.append([float(i) for i in line.split(",")])
-                        inp_f0 = np.array(inp_f0, dtype="float32")
-                    except Exception as error:
-                        logger.error(f"f0 file: {str(error)}")
 
-                if "rmvpe" in f0_method:
-                    if not self.model_pitch_estimator:
-                        from lib.rmvpe import RMVPE
+# Conversion worker process state
+_worker_voices = None
 
-                        logger.info("Loading vocal pitch estimator model")
-                        self.model_pitch_estimator = RMVPE(
-                            "rmvpe.pt",
-                            is_half=self.config.is_half,
-                            device=self.config.device
-                        )
 
-                    pipe.model_rmvpe = self.model_pitch_estimator
-
-                cache_params = id_tag
-
-            # self.infer(
-            #     id_tag,
-            #     params,
-            #     # load model
-            #     n_spk,
-            #     tgt_sr,
-            #     net_g,
-            #     pipe,
-            #     cpt,
-            #     version,
-            #     if_f0,
-            #     # load index
-            #     index_rate,
-            #     index,
-            #     big_npy,
-            #     # load f0 file
-            #     inp_f0,
-            #     # output file
-            #     input_audio_path,
-            #     overwrite,
-            # )
-
-            thread = threading.Thread(
-                target=self.infer,
-                args=(
-                    id_tag,
-                    params,
-                    # loaded model
-                    n_spk,
-                    tgt_sr,
-                    net_g,
-                    pipe,
-                    cpt,
-                    version,
-                    if_f0,
-                    # loaded index
-                    index_rate,
-                    index,
-                    big_npy,
-                    # loaded f0 file
-                    inp_f0,
-                    # audio file
-                    input_audio_path,
-                    overwrite,
-                )
-            )
+def init_vc_worker(torch_threads):
+    global _worker_voices
+    torch.set_num_threads(torch_threads)
+    _worker_voices = ClassVoices(only_cpu=True)
 
-            threads.append(thread)
 
-        # Run last
-        if threads:
-            self.run_threads(threads)
+def convert_file_job(id_tag, conf, input_audio_path, overwrite):
+    """Worker process: convert one file, loading the model on first use."""
+    _worker_voices.apply_conf(tag=id_tag, **conf)
+    context = _worker_voices.load_model_context(id_tag)
+    return _worker_voices.convert_file(
+        id_tag, context, input_audio_path, overwrite
+    )
 
-        progress_bar.update(len(threads))
-        progress_bar.close()
 
-        final_result = []
-        valid_tags = set(tag_list)
-        for tag in valid_tags:
-            if (
-                tag in self.model_config.keys()
-                and "result" in self.model_config[tag].keys()
-            ):
-                final_result.extend(self.model_config[tag]["result"])
-
-        return final_result
+if __name__ == "__main__":
+    import sys
+
+    # python voice_main.py --benchmark-rvc model.pth [file.wav]
+    if "--benchmark-rvc" in sys.argv:
+        args = [arg for arg in sys.argv[1:] if arg != "--benchmark-rvc"]
+        benchmark_rvc_batching(*args[:2])
+        sys.exit(0)
+
+    # python voice_main.py --benchmark [--method pm] file.wav ...
+    if "--benchmark" in sys.argv:
+        args = [arg for arg in sys.argv[1:] if arg != "--benchmark"]
+        method = "harvest"
+        if "--method" in args:
+            index = args.index("--method")
+            method = args[index + 1]
+            del args[index:index + 2]
+        benchmark_f0_prefetch(args, method)